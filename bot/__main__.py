@@ -2,22 +2,120 @@ from bot.discord import TorobooruClient
 from bot.utils import (
     build_argument_parser,
     parse_environment_variables_to_namespace,
-    get_settings_using_namespace
+    get_settings_using_namespace,
+    parse_shard_ids
 )
+from argparse import Namespace
+import logging
+import multiprocessing
+import time
 import ujson
 
-argument_parser = build_argument_parser()
+# NOTE(synzr): shards are identifying one by one (5 seconds each), so the next
+#              process is started after the shards of the previous one
+SHARD_IDENTIFY_INTERVAL = 5
 
-namespace = argument_parser.parse_args()
-namespace = parse_environment_variables_to_namespace(namespace)
+logger = logging.getLogger("bot")
 
-namespace.discord_text_channels = ujson.loads(namespace.discord_text_channels) \
-    if namespace.discord_text_channels else []
 
-database_connection_settings, storage_connection_settings = \
-    get_settings_using_namespace(namespace)
+def run_client(namespace: Namespace,
+               shard_ids: list[int] | None,
+               is_render_service_owner: bool = True) -> None:
+    """Run the bot with the shards.
 
-client = TorobooruClient(database_connection_settings,
-                         storage_connection_settings,
-                         namespace.discord_text_channels)
-client.run(namespace.discord_token, root_logger=True)
+    Args:
+        namespace (Namespace): Namespace.
+        shard_ids (list[int] | None): Shards of the process (or None for all of them).
+        is_render_service_owner (bool, optional): Is the process serving the rendering service?
+    """
+
+    database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, ingest_settings = get_settings_using_namespace(namespace)
+
+    client = TorobooruClient(database_connection_settings,
+                             storage_connection_settings,
+                             http_connection_settings,
+                             media_processing_settings,
+                             render_service_settings,
+                             ingest_settings,
+                             namespace.discord_text_channels,
+                             shard_ids,
+                             namespace.discord_shard_count,
+                             is_render_service_owner)
+    client.run(namespace.discord_token, root_logger=True)
+
+
+def get_shard_ranges(shard_ids: list[int], process_count: int) -> list[list[int]]:
+    """Split the shards into the contiguous ranges of the processes.
+
+    Args:
+        shard_ids (list[int]): Shard IDs.
+        process_count (int): Count of the processes.
+
+    Returns:
+        list[list[int]]: Shards of every process.
+    """
+
+    process_count = min(process_count, len(shard_ids))
+    range_size, extra_shard_count = divmod(len(shard_ids), process_count)
+
+    shard_ranges = []
+    range_start = 0
+
+    for process_index in range(process_count):
+        range_end = range_start + range_size + int(process_index < extra_shard_count)
+        shard_ranges.append(shard_ids[range_start:range_end])
+
+        range_start = range_end
+
+    return shard_ranges
+
+
+def main() -> None:
+    argument_parser = build_argument_parser()
+
+    namespace = argument_parser.parse_args()
+    namespace = parse_environment_variables_to_namespace(namespace)
+
+    namespace.discord_text_channels = ujson.loads(namespace.discord_text_channels) \
+        if namespace.discord_text_channels else []
+
+    shard_ids = parse_shard_ids(namespace.discord_shard_ids) \
+        if namespace.discord_shard_ids else None
+
+    if (shard_ids or namespace.discord_shard_processes > 1) and not namespace.discord_shard_count:
+        argument_parser.error("--discord-shard-count is required to run the part of the shards")
+
+    # Auto-sharded mode, every shard is in this process
+    if namespace.discord_shard_processes <= 1:
+        run_client(namespace, shard_ids)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+
+    shard_ids = shard_ids or list(range(namespace.discord_shard_count))
+    shard_processes = []
+
+    # NOTE(synzr): the rendering service is listening on the single port,
+    #              so it's served by the first process only
+    for process_index, shard_range in enumerate(get_shard_ranges(shard_ids, namespace.discord_shard_processes)):
+        shard_process = multiprocessing.Process(target=run_client,
+                                                args=(namespace, shard_range, process_index == 0),
+                                                name=f"toroboorubot-shards-{shard_range[0]}-{shard_range[-1]}")
+        shard_process.start()
+        shard_processes.append(shard_process)
+
+        logger.info(f"main(): Started process {shard_process.pid} with shards {shard_range}")
+        time.sleep(SHARD_IDENTIFY_INTERVAL * len(shard_range))
+
+    for shard_process in shard_processes:
+        shard_process.join()
+
+        if shard_process.exitcode:
+            logger.error(f"main(): Process {shard_process.name} exited with code {shard_process.exitcode}")
+
+
+# Shard and process pool workers are importing this module too
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,187 @@
 from core.managers import (
     ContentManager,
     MediaProcessingManager,
-    ExternalDataManager
+    ExternalDataManager,
+    DerivativeManager,
+    IngestManager,
+    IngestQueueManager
 )
+from core.clients import HttpClient, StorageClient
 from core.models import (
+    DiscordMessage,
+    DiscordUser,
     DatabaseConnectionSettings,
-    StorageConnectionSettings
+    StorageConnectionSettings,
+    HttpConnectionSettings,
+    MediaProcessingSettings,
+    RenderServiceSettings,
+    IngestSettings,
+    EventRateMetrics
 )
-from discord import Client, Intents, Message
+from core.providers import DiscordProvider
+from core.services import RenderService
+from discord import AutoShardedClient, Intents, Message
+
+from .message import is_submission_message, get_ingest_request
+
+import asyncio
 import logging
 
 
-class TorobooruClient(Client):
+class TorobooruClient(AutoShardedClient):
     """Torobooru's discord bot implementation."""
 
-    MESSAGE_SPECIAL_WORD = "+torobooru"
-    MESSAGE_SPACE_SYMBOL = " "
+    # Interval of the shard message rate report (in seconds)
+    SHARD_METRICS_INTERVAL = 60
 
     def __init__(self,
                  database_connection_settings: DatabaseConnectionSettings,
                  storage_connection_settings: StorageConnectionSettings,
-                 text_channels: list[int]) -> None:
+                 http_connection_settings: HttpConnectionSettings,
+                 media_processing_settings: MediaProcessingSettings,
+                 render_service_settings: RenderServiceSettings,
+                 ingest_settings: IngestSettings,
+                 text_channels: list[int],
+                 shard_ids: list[int] | None = None,
+                 shard_count: int | None = None,
+                 is_render_service_owner: bool = True) -> None:
         """Class constructor.
 
         Args:
             database_connection_settings (DatabaseConnectionSettings): Database connection settings.
             storage_connection_settings (StorageConnectionSettings): Storage connection settings.
+            http_connection_settings (HttpConnectionSettings): HTTP connection settings.
+            media_processing_settings (MediaProcessingSettings): Media processing settings.
+            render_service_settings (RenderServiceSettings): On-demand rendering service settings.
+            ingest_settings (IngestSettings): Ingest settings.
             text_channels (list[int]): Text channels.
+            shard_ids (list[int] | None, optional): Shards of the process (or None for all of them).
+            shard_count (int | None, optional): Total count of the shards (or None for the recommended one).
+            is_render_service_owner (bool, optional): Is the process serving the rendering service?
+                (only one of the shard processes can listen on its port)
         """
 
         intents = Intents.default()
         intents.message_content = True
 
-        self.__media_processing_manager = MediaProcessingManager(storage_connection_settings)
+        self.__http_client = HttpClient(http_connection_settings)
+        self.__storage_client = StorageClient(storage_connection_settings)
+
+        self.__media_processing_manager = MediaProcessingManager(media_processing_settings,
+                                                                 self.__storage_client,
+                                                                 self.__http_client)
+        self.__derivative_manager = None
+        self.__render_service = None
+
+        # Derivatives are rendered on the first request instead of the ingest
+        if render_service_settings.service_enabled:
+            self.__derivative_manager = DerivativeManager(database_connection_settings,
+                                                          render_service_settings,
+                                                          self.__media_processing_manager)
+
+            if is_render_service_owner:
+                self.__render_service = RenderService(render_service_settings,
+                                                      self.__derivative_manager,
+                                                      self.__storage_client)
+
         self.__content_manager = ContentManager(database_connection_settings,
-                                                storage_connection_settings,
-                                                self.__media_processing_manager)
-        self.__external_data_manager = ExternalDataManager(database_connection_settings)
+                                                self.__storage_client,
+                                                self.__media_processing_manager,
+                                                self.__derivative_manager)
+        self.__external_data_manager = ExternalDataManager(database_connection_settings,
+                                                           self.__http_client)
+        self.__ingest_queue_manager = None
+
+        # Requests are only saved here, the worker processes are ingesting them
+        if ingest_settings.durable_enabled:
+            self.__ingest_queue_manager = IngestQueueManager(database_connection_settings,
+                                                             ingest_settings)
+
+        self.__ingest_manager = IngestManager(ingest_settings,
+                                              self.__external_data_manager,
+                                              self.__content_manager,
+                                              self.__ingest_queue_manager)
 
         self.__text_channels = text_channels
         self.__logger = logging.getLogger("bot.discord")
 
-        super().__init__(intents=intents)
+        # NOTE(synzr): shards of the process are sharing the managers above,
+        #              only the gateway connections are per shard
+        # Only the messages are counted, the rest of the gateway events aren't dispatched to the client
+        self.__shard_metrics = {}
+        self.__shard_metrics_task = None
+
+        super().__init__(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+
+        # NOTE(synzr): the provider is using the gateway cache of the bot,
+        #              so the cached channels, messages and users are not fetched again
+        self.__external_data_manager.add_provider("discord", DiscordProvider,
+                                                  {"message": DiscordMessage, "user": DiscordUser},
+                                                  {"client": self})
+
+    async def setup_hook(self) -> None:
+        await self.__storage_client.start()
+        self.__ingest_manager.start()
+
+        if self.__render_service:
+            await self.__render_service.start()
+
+        self.__shard_metrics_task = asyncio.create_task(self.__report_shard_metrics())
+
+    async def close(self) -> None:
+        if self.__shard_metrics_task:
+            self.__shard_metrics_task.cancel()
+
+        await self.__ingest_manager.close()
+        await self.__external_data_manager.close()
+
+        if self.__render_service:
+            await self.__render_service.close()
+
+        await self.__http_client.close()
+        await self.__storage_client.close()
+        self.__media_processing_manager.close()
+
+        await super().close()
 
     async def on_ready(self) -> None:
-        self.__logger.info(f"on_ready(): Bot ({self.user}) is ready!")
+        self.__logger.info(f"on_ready(): Bot ({self.user}) is ready with {len(self.shards)} shards!")
+
+    async def on_shard_ready(self, shard_id: int) -> None:
+        self.__logger.info(f"on_shard_ready(shard_id={shard_id}): Shard is ready")
+
+    async def on_shard_disconnect(self, shard_id: int) -> None:
+        self.__logger.warning(f"on_shard_disconnect(shard_id={shard_id}): Shard is disconnected")
 
-    async def __get_urns_from_message(self, message: Message) -> list[str]:
-        words = message.clean_content.split(self.MESSAGE_SPACE_SYMBOL)
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        self.__logger.info(f"on_shard_resumed(shard_id={shard_id}): Shard is resumed")
 
-        urls = list(filter(lambda url: url.startswith("http://") or url.startswith("https://"), words))
-        urns = filter(lambda urn: urn != None,
-                      [await self.__external_data_manager.get_urn_from_url(url) for url in urls])
+    def __get_shard_metrics(self, shard_id: int) -> EventRateMetrics:
+        if shard_id not in self.__shard_metrics:
+            self.__shard_metrics[shard_id] = EventRateMetrics()
 
-        return list(urns)
+        return self.__shard_metrics[shard_id]
 
-    def __get_hashtags_from_message(self, message: Message) -> list[str]:
-        words = message.clean_content.split(self.MESSAGE_SPACE_SYMBOL)
+    async def __report_shard_metrics(self) -> None:
+        while True:
+            await asyncio.sleep(self.SHARD_METRICS_INTERVAL)
 
-        hashtags = filter(lambda word: word.startswith("~"), words)
-        hashtags = map(lambda hashtag: hashtag[1:], hashtags)
+            for shard_id, shard_latency in self.latencies:
+                shard_metrics = self.__get_shard_metrics(shard_id)
+                message_rate = shard_metrics.reset_window()
 
-        return list(hashtags)
+                self.__logger.info(f"__report_shard_metrics(): Shard {shard_id}: {message_rate:.2f} messages/s "
+                                   f"({shard_metrics.metrics_count} total), latency {shard_latency * 1000:.0f}ms")
 
     async def on_message(self, message: Message) -> None:
-        is_special_word_not_in_message_content = self.MESSAGE_SPECIAL_WORD not in message.clean_content
-        is_not_in_allowed_text_channels = message.channel.id not in self.__text_channels
-        is_message_from_torobooru = message.author.id == self.user.id
-
-        if message.author.bot or \
-            is_not_in_allowed_text_channels or \
-                is_message_from_torobooru or \
-                    is_special_word_not_in_message_content:
-            return
+        # Direct messages are received by the first shard
+        self.__get_shard_metrics(message.guild.shard_id if message.guild else 0).record()
 
-        urns = await self.__get_urns_from_message(message)
-        hashtags = self.__get_hashtags_from_message(message)
+        if not is_submission_message(message, self.__text_channels, self.user.id):
+            return
 
-        self.__logger.info(f"on_message(message={message}): {urns}, {hashtags}")
+        # NOTE(synzr): URNs are resolved by the ingest workers,
+        #              so the handler is not waiting for the HTTP requests
+        if ingest_request := get_ingest_request(message):
+            await self.__ingest_manager.enqueue(ingest_request)
+            self.__logger.info(f"on_message(message={message}): Enqueued {ingest_request.request_urls}, {ingest_request.request_tags}")
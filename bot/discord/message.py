@@ -0,0 +1,81 @@
+from core.models import IngestRequest
+from discord import Message
+
+MESSAGE_SPECIAL_WORD = "+torobooru"
+MESSAGE_SPACE_SYMBOL = " "
+
+
+def is_submission_message(message: Message, text_channels: list[int], user_id: int) -> bool:
+    """Check if the message is the submission to Torobooru.
+
+    Args:
+        message (Message): Message.
+        text_channels (list[int]): Allowed text channels.
+        user_id (int): ID of the bot user.
+
+    Returns:
+        bool: Message is the submission?
+    """
+
+    is_special_word_in_message_content = MESSAGE_SPECIAL_WORD in message.clean_content
+    is_in_allowed_text_channels = message.channel.id in text_channels
+    is_message_from_torobooru = message.author.id == user_id
+
+    return not message.author.bot and \
+        is_in_allowed_text_channels and \
+            not is_message_from_torobooru and \
+                is_special_word_in_message_content
+
+
+def get_urls_from_message(message: Message) -> list[str]:
+    """Get the URLs from the message.
+
+    Args:
+        message (Message): Message.
+
+    Returns:
+        list[str]: URLs.
+    """
+
+    words = message.clean_content.split(MESSAGE_SPACE_SYMBOL)
+
+    urls = filter(lambda url: url.startswith("http://") or url.startswith("https://"), words)
+    return list(urls)
+
+
+def get_hashtags_from_message(message: Message) -> list[str]:
+    """Get the hashtags from the message.
+
+    Args:
+        message (Message): Message.
+
+    Returns:
+        list[str]: Hashtags (without the "~" prefix).
+    """
+
+    words = message.clean_content.split(MESSAGE_SPACE_SYMBOL)
+
+    hashtags = filter(lambda word: word.startswith("~"), words)
+    hashtags = map(lambda hashtag: hashtag[1:], hashtags)
+
+    return list(hashtags)
+
+
+def get_ingest_request(message: Message) -> IngestRequest | None:
+    """Get the ingest request of the submission message.
+
+    Args:
+        message (Message): Submission message.
+
+    Returns:
+        IngestRequest | None: Ingest request (or None if there are no URLs).
+    """
+
+    urls = get_urls_from_message(message)
+
+    if not urls:
+        return None
+
+    return IngestRequest(request_submission_urn=f"urn:discord:message:{message.channel.id}:{message.id}",
+                         request_urls=urls,
+                         request_tags=get_hashtags_from_message(message))
@@ -1,13 +1,54 @@
 from core.models import (
     DatabaseConnectionSettings,
-    StorageConnectionSettings
+    StorageConnectionSettings,
+    HttpConnectionSettings,
+    MediaProcessingSettings,
+    RenderServiceSettings,
+    IngestSettings,
+    ImageFormat
 )
 from argparse import ArgumentParser, Namespace
 import os
 
+
+def parse_boolean(value: str) -> bool:
+    """Parse the boolean value of an environment variable.
+
+    Args:
+        value (str): Value.
+
+    Returns:
+        bool: Parsed value.
+    """
+
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def parse_shard_ids(value: str) -> list[int]:
+    """Parse the shard IDs (for example, "0-3,8").
+
+    Args:
+        value (str): Value.
+
+    Returns:
+        list[int]: Shard IDs.
+    """
+
+    shard_ids = []
+
+    for shard_range in value.split(","):
+        first_shard_id, _, last_shard_id = shard_range.strip().partition("-")
+        shard_ids.extend(range(int(first_shard_id), int(last_shard_id or first_shard_id) + 1))
+
+    return shard_ids
+
+
 ENVIRONMENT_VARIABLES_MAPPING = {
     "DISCORD_TOKEN": "discord_token",
     "DISCORD_TEXT_CHANNELS": "discord_text_channels",
+    "DISCORD_SHARD_COUNT": ["discord_shard_count", int],
+    "DISCORD_SHARD_IDS": "discord_shard_ids",
+    "DISCORD_SHARD_PROCESSES": ["discord_shard_processes", int],
     "DATABASE_INSTANCE_HOSTNAME": "database_instance_hostname",
     "DATABASE_INSTANCE_PORT": ["database_instance_port", int],
     "DATABASE_CREDENTIALS_USERNAME": "database_credentials_username",
@@ -18,24 +59,50 @@ ENVIRONMENT_VARIABLES_MAPPING = {
     "STORAGE_CREDENTIALS_ACCESS_KEY": "storage_credentials_access_key",
     "STORAGE_CREDENTIALS_SECRET_ACCESS_KEY": "storage_credentials_secret_access_key",
     "STORAGE_BUCKET_NAME": "storage_bucket_name",
-    "STORAGE_PUBLIC_BASE_URL": "storage_public_base_url"
+    "STORAGE_PUBLIC_BASE_URL": "storage_public_base_url",
+    "STORAGE_POOL_MAXIMUM_SIZE": ["storage_pool_maximum_size", int],
+    "STORAGE_RETRIES_MAXIMUM_ATTEMPTS": ["storage_retries_maximum_attempts", int],
+    "STORAGE_MULTIPART_PART_SIZE": ["storage_multipart_part_size", int],
+    "STORAGE_MULTIPART_CONCURRENCY": ["storage_multipart_concurrency", int],
+    "MEDIA_PROCESS_POOL_SIZE": ["media_process_pool_size", int],
+    "MEDIA_OUTPUT_FORMATS": "media_output_formats",
+    "MEDIA_SOURCE_CACHE_DIRECTORY": "media_source_cache_directory",
+    "MEDIA_SOURCE_CACHE_MAXIMUM_SIZE": ["media_source_cache_maximum_size", int],
+    "RENDER_SERVICE_ENABLED": ["render_service_enabled", parse_boolean],
+    "RENDER_SERVICE_HOSTNAME": "render_service_hostname",
+    "RENDER_SERVICE_PORT": ["render_service_port", int],
+    "RENDER_SERVICE_PUBLIC_BASE_URL": "render_service_public_base_url",
+    "INGEST_WORKER_COUNT": ["ingest_worker_count", int],
+    "INGEST_QUEUE_MAXIMUM_SIZE": ["ingest_queue_maximum_size", int],
+    "INGEST_DURABLE": ["ingest_durable", parse_boolean],
+    "INGEST_LEASE_DURATION": ["ingest_lease_duration", int],
+    "INGEST_MAXIMUM_ATTEMPTS": ["ingest_maximum_attempts", int]
 }
 
 
-def build_argument_parser() -> ArgumentParser:
-    """Create an argument parser for the bot.
+def build_argument_parser(program_name: str = "toroboorubot",
+                          description: str = "Torobooru's discord bot") -> ArgumentParser:
+    """Create an argument parser for the bot (or the job with the same settings).
+
+    Args:
+        program_name (str, optional): Name of the program.
+        description (str, optional): Description of the program.
 
     Returns:
         ArgumentParser: Argument parser.
     """
 
-    argument_parser = ArgumentParser("toroboorubot",
-                                     description="Torobooru's discord bot")
+    argument_parser = ArgumentParser(program_name,
+                                     description=description)
 
     # Discord-related settings
     argument_parser.add_argument("--discord-token", default=None)
     argument_parser.add_argument("--discord-text-channels", default=None)
 
+    argument_parser.add_argument("--discord-shard-count", type=int, default=None)
+    argument_parser.add_argument("--discord-shard-ids", default=None)
+    argument_parser.add_argument("--discord-shard-processes", type=int, default=1)
+
     # Database settings
     argument_parser.add_argument("--database-instance-hostname", default=None)
     argument_parser.add_argument("--database-instance-port", type=int, default=None)
@@ -55,6 +122,33 @@ def build_argument_parser() -> ArgumentParser:
     argument_parser.add_argument("--storage-bucket-name", default=None)
     argument_parser.add_argument("--storage-public-base-url", default=None)
 
+    argument_parser.add_argument("--storage-pool-maximum-size", type=int, default=10)
+    argument_parser.add_argument("--storage-retries-maximum-attempts", type=int, default=5)
+
+    argument_parser.add_argument("--storage-multipart-part-size", type=int, default=8 * 1024 * 1024)
+    argument_parser.add_argument("--storage-multipart-concurrency", type=int, default=4)
+
+    # Media processing settings
+    argument_parser.add_argument("--media-process-pool-size", type=int, default=None)
+    argument_parser.add_argument("--media-output-formats", default="jpeg,webp")
+
+    argument_parser.add_argument("--media-source-cache-directory", default=None)
+    argument_parser.add_argument("--media-source-cache-maximum-size", type=int, default=2 * 1024 * 1024 * 1024)
+
+    # On-demand rendering service settings
+    argument_parser.add_argument("--render-service-enabled", action="store_true")
+    argument_parser.add_argument("--render-service-hostname", default="127.0.0.1")
+    argument_parser.add_argument("--render-service-port", type=int, default=8080)
+    argument_parser.add_argument("--render-service-public-base-url", default=None)
+
+    # Ingest settings
+    argument_parser.add_argument("--ingest-worker-count", type=int, default=4)
+    argument_parser.add_argument("--ingest-queue-maximum-size", type=int, default=256)
+
+    argument_parser.add_argument("--ingest-durable", action="store_true")
+    argument_parser.add_argument("--ingest-lease-duration", type=int, default=300)
+    argument_parser.add_argument("--ingest-maximum-attempts", type=int, default=5)
+
     return argument_parser
 
 
@@ -82,11 +176,15 @@ def parse_environment_variables_to_namespace(namespace: Namespace) -> Namespace:
 
 
 def get_settings_using_namespace(namespace: Namespace) \
-     -> tuple[DatabaseConnectionSettings, StorageConnectionSettings]:
+     -> tuple[DatabaseConnectionSettings, StorageConnectionSettings,
+              HttpConnectionSettings, MediaProcessingSettings,
+              RenderServiceSettings, IngestSettings]:
     """Get settings using an namespace.
 
     Returns:
-        tuple[DatabaseConnectionSettings, StorageConnectionSettings]: Settings.
+        tuple[DatabaseConnectionSettings, StorageConnectionSettings,
+              HttpConnectionSettings, MediaProcessingSettings,
+              RenderServiceSettings, IngestSettings]: Settings.
     """
 
     database_connection_settings = DatabaseConnectionSettings(
@@ -105,7 +203,57 @@ def get_settings_using_namespace(namespace: Namespace) \
         credentials_access_key=namespace.storage_credentials_access_key,
         credentials_secret_access_key=namespace.storage_credentials_secret_access_key,
         bucket_name=namespace.storage_bucket_name,
-        public_url_base=namespace.storage_public_base_url
+        public_url_base=namespace.storage_public_base_url,
+        pool_maximum_size=namespace.storage_pool_maximum_size,
+        retries_maximum_attempts=namespace.storage_retries_maximum_attempts,
+        multipart_part_size=namespace.storage_multipart_part_size,
+        multipart_concurrency=namespace.storage_multipart_concurrency
+    )
+
+    http_connection_settings = HttpConnectionSettings(
+        pool_maximum_size=100,
+        pool_maximum_size_per_host=10,
+        dns_cache_ttl=300,
+        keepalive_timeout=30,
+        connect_timeout=10,
+        total_timeout=60
+    )
+
+    # NOTE(synzr): `None` is the count of CPU cores
+    media_processing_settings = MediaProcessingSettings(
+        process_pool_maximum_workers=namespace.media_process_pool_size,
+        output_formats=[ImageFormat(image_format.strip().lower())
+                        for image_format in namespace.media_output_formats.split(",")],
+        download_concurrency=4,
+        upload_concurrency=4,
+        pipeline_queue_size=8,
+        download_maximum_size=64 * 1024 * 1024,
+        download_spill_threshold=8 * 1024 * 1024,
+        download_spill_directory=None,
+        source_cache_directory=namespace.media_source_cache_directory,
+        source_cache_maximum_size=namespace.media_source_cache_maximum_size
+    )
+
+    render_service_settings = RenderServiceSettings(
+        service_enabled=namespace.render_service_enabled,
+        service_hostname=namespace.render_service_hostname,
+        service_port=namespace.render_service_port,
+        # NOTE(synzr): the service is reachable directly, if it's not behind the proxy or CDN
+        public_url_base=namespace.render_service_public_base_url or
+            f"http://{namespace.render_service_hostname}:{namespace.render_service_port}"
+    )
+
+    ingest_settings = IngestSettings(
+        worker_count=namespace.ingest_worker_count,
+        queue_maximum_size=namespace.ingest_queue_maximum_size,
+        durable_enabled=namespace.ingest_durable,
+        lease_duration=namespace.ingest_lease_duration,
+        maximum_attempts=namespace.ingest_maximum_attempts,
+        retry_base_delay=30,
+        retry_maximum_delay=60 * 60,
+        poll_interval=2.0
     )
 
-    return database_connection_settings, storage_connection_settings
+    return database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, ingest_settings
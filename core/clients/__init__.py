@@ -0,0 +1,4 @@
+from .http import HttpClient
+from .session_pool import SessionPool
+from .storage import StorageClient
+from .source_cache import SourceCache
@@ -0,0 +1,116 @@
+from core.models import HttpConnectionSettings, ExternalDataValidators
+
+from aiohttp import (
+    ClientResponse,
+    ClientSession,
+    ClientTimeout,
+    DummyCookieJar,
+    TCPConnector
+)
+
+import ujson
+import logging
+
+
+class HttpClient:
+    """Process-wide HTTP client with a pooled connector."""
+
+    def __init__(self, http_connection_settings: HttpConnectionSettings) -> None:
+        """Class constructor.
+
+        Args:
+            http_connection_settings (HttpConnectionSettings): HTTP connection settings.
+        """
+
+        self.__http_connection_settings = http_connection_settings
+        self.__session = None
+
+        self.__logger = logging.getLogger("core.clients.http")
+
+    def __instantiate_session(self) -> ClientSession:
+        connector = TCPConnector(limit=self.__http_connection_settings.pool_maximum_size,
+                                 limit_per_host=self.__http_connection_settings.pool_maximum_size_per_host,
+                                 ttl_dns_cache=self.__http_connection_settings.dns_cache_ttl,
+                                 keepalive_timeout=self.__http_connection_settings.keepalive_timeout)
+
+        timeout = ClientTimeout(total=self.__http_connection_settings.total_timeout,
+                                connect=self.__http_connection_settings.connect_timeout)
+
+        # NOTE(synzr): the session is shared between the providers,
+        #              so the cookies are passed per request instead
+        session = ClientSession(connector=connector,
+                                timeout=timeout,
+                                cookie_jar=DummyCookieJar(),
+                                json_serialize=ujson.dumps)
+
+        self.__logger.info(f"__instantiate_session(): Instantiated an HTTP session (connector={connector})")
+        return session
+
+    async def get_session(self) -> ClientSession:
+        """Get the shared HTTP session.
+
+        The session is created on the first call, so it's bound
+        to the running event loop.
+
+        Returns:
+            ClientSession: HTTP session.
+        """
+
+        if not self.__session or self.__session.closed:
+            self.__session = self.__instantiate_session()
+
+        return self.__session
+
+    def get_conditional_headers(self, validators: ExternalDataValidators | None) -> dict[str, str]:
+        """Get the conditional request headers using the validators.
+
+        Args:
+            validators (ExternalDataValidators | None): Validators of the previous response.
+
+        Returns:
+            dict[str, str]: Request headers.
+        """
+
+        headers = {}
+
+        if not validators:
+            return headers
+
+        if validators.validator_etag:
+            headers["if-none-match"] = validators.validator_etag
+
+        if validators.validator_last_modified:
+            headers["if-modified-since"] = validators.validator_last_modified
+
+        return headers
+
+    def get_validators(self, response: ClientResponse) -> ExternalDataValidators | None:
+        """Get the validators of the response.
+
+        Args:
+            response (ClientResponse): Response.
+
+        Returns:
+            ExternalDataValidators: Validators.
+            None: Nothing (the response doesn't have any validators).
+        """
+
+        validator_etag = response.headers.get("etag")
+        validator_last_modified = response.headers.get("last-modified")
+
+        if not validator_etag and not validator_last_modified:
+            return None
+
+        return ExternalDataValidators(
+            validator_etag=validator_etag,
+            validator_last_modified=validator_last_modified
+        )
+
+    async def close(self) -> None:
+        """Close the shared HTTP session."""
+
+        if self.__session and not self.__session.closed:
+            await self.__session.close()
+
+        self.__session = None
+        self.__logger.info("close(): Closed the HTTP session")
@@ -0,0 +1,167 @@
+from core.models import ProviderSession
+from typing import Awaitable, Callable, Mapping
+
+import asyncio
+import logging
+import time
+
+
+class SessionPool:
+    """Pool of reusable provider sessions (guest tokens, cookies, etc.)."""
+
+    RATE_LIMIT_REMAINING_HEADER = "x-rate-limit-remaining"
+    RATE_LIMIT_RESET_HEADER = "x-rate-limit-reset"
+
+    def __init__(self,
+                 pool_name: str,
+                 activate_session: Callable[[], Awaitable[ProviderSession | None]],
+                 pool_maximum_size: int,
+                 refresh_margin: float,
+                 refresh_interval: float) -> None:
+        """Class constructor.
+
+        Args:
+            pool_name (str): Pool name (used for logging).
+            activate_session (Callable[[], Awaitable[ProviderSession | None]]): Session activation callback.
+            pool_maximum_size (int): Maximum count of sessions in the pool.
+            refresh_margin (float): Seconds before expiration when a session has to be refreshed.
+            refresh_interval (float): Seconds between background refresh checks.
+        """
+
+        self.__activate_session = activate_session
+        self.__pool_maximum_size = pool_maximum_size
+        self.__refresh_margin = refresh_margin
+        self.__refresh_interval = refresh_interval
+
+        self.__sessions: list[ProviderSession] = []
+        self.__activation_lock = asyncio.Lock()
+        self.__refresh_task = None
+
+        self.__logger = logging.getLogger(f"core.clients.session_pool.{pool_name}")
+
+    def __is_usable(self, session: ProviderSession, now: float) -> bool:
+        if session.session_expires_at <= now:
+            return False
+
+        is_rate_limited = session.session_remaining_requests is not None and \
+            session.session_remaining_requests <= 0
+
+        if is_rate_limited and session.session_rate_limit_reset_at:
+            if session.session_rate_limit_reset_at > now:
+                return False
+
+            # The rate limit window is over, the budget is unknown again
+            session.session_remaining_requests = None
+            session.session_rate_limit_reset_at = None
+
+        return True
+
+    def __get_best_session(self, now: float) -> ProviderSession | None:
+        usable_sessions = [session for session in self.__sessions if self.__is_usable(session, now)]
+
+        if not usable_sessions:
+            return None
+
+        # Prefer the session with the largest remaining budget (unknown budget goes first)
+        return max(usable_sessions,
+                   key=lambda session: session.session_remaining_requests
+                   if session.session_remaining_requests is not None else float("inf"))
+
+    async def __add_new_session(self) -> ProviderSession | None:
+        session = await self.__activate_session()
+
+        if not session:
+            self.__logger.error("__add_new_session(): Session activation failed")
+            return None
+
+        now = time.time()
+        self.__sessions = [session for session in self.__sessions if self.__is_usable(session, now)]
+
+        if len(self.__sessions) >= self.__pool_maximum_size:
+            self.__sessions.pop(0)
+
+        self.__sessions.append(session)
+
+        self.__logger.info(f"__add_new_session(): Added an session, pool size: {len(self.__sessions)}")
+        return session
+
+    async def __refresh_sessions(self) -> None:
+        while True:
+            await asyncio.sleep(self.__refresh_interval)
+
+            refresh_deadline = time.time() + self.__refresh_margin
+            expiring_sessions = [session for session in self.__sessions
+                                 if session.session_expires_at <= refresh_deadline]
+
+            for expiring_session in expiring_sessions:
+                async with self.__activation_lock:
+                    if expiring_session in self.__sessions:
+                        self.__sessions.remove(expiring_session)
+
+                    await self.__add_new_session()
+
+            if expiring_sessions:
+                self.__logger.info(f"__refresh_sessions(): Refreshed {len(expiring_sessions)} sessions")
+
+    def __ensure_refresh_task(self) -> None:
+        if self.__refresh_task and not self.__refresh_task.done():
+            return
+
+        self.__refresh_task = asyncio.create_task(self.__refresh_sessions())
+
+    async def acquire(self) -> ProviderSession | None:
+        """Acquire an session from the pool, activating a new one if needed.
+
+        Returns:
+            ProviderSession: Provider session.
+            None: Nothing (activation failed).
+        """
+
+        self.__ensure_refresh_task()
+
+        session = self.__get_best_session(time.time())
+
+        if not session:
+            async with self.__activation_lock:
+                # Another coroutine could activate the session while we were waiting
+                session = self.__get_best_session(time.time()) or \
+                    await self.__add_new_session()
+
+        if session and session.session_remaining_requests is not None:
+            session.session_remaining_requests -= 1
+
+        return session
+
+    def update_rate_limit(self, session: ProviderSession, headers: Mapping[str, str]) -> None:
+        """Update the remaining budget of the session using the response headers.
+
+        Args:
+            session (ProviderSession): Provider session.
+            headers (Mapping[str, str]): Response headers.
+        """
+
+        if self.RATE_LIMIT_REMAINING_HEADER in headers:
+            session.session_remaining_requests = int(headers[self.RATE_LIMIT_REMAINING_HEADER], 10)
+
+        if self.RATE_LIMIT_RESET_HEADER in headers:
+            session.session_rate_limit_reset_at = float(headers[self.RATE_LIMIT_RESET_HEADER])
+
+    def invalidate(self, session: ProviderSession) -> None:
+        """Remove the session from the pool.
+
+        Args:
+            session (ProviderSession): Provider session.
+        """
+
+        if session in self.__sessions:
+            self.__sessions.remove(session)
+            self.__logger.info(f"invalidate(session=[redacted]): Invalidated an session, pool size: {len(self.__sessions)}")
+
+    async def close(self) -> None:
+        """Stop the background refresh and forget all sessions."""
+
+        if self.__refresh_task:
+            self.__refresh_task.cancel()
+
+        self.__refresh_task = None
+        self.__sessions = []
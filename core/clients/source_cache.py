@@ -0,0 +1,248 @@
+from core.models import DownloadedMedia, ExternalDataValidators
+
+from hashlib import blake2b
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import time
+import ujson
+import uuid
+
+# Eviction frees a bit more than needed, so it's not running on every write
+SOURCE_CACHE_EVICTION_RATIO = 0.9
+
+# Temporary files of the crashed processes are removed after this time (in seconds)
+SOURCE_CACHE_TEMPORARY_FILE_LIFETIME = 60 * 60
+
+SOURCE_CACHE_URL_HASH_SIZE = 16
+
+
+class SourceCache:
+    """Local disk cache of the downloaded source images."""
+
+    # NOTE(synzr): objects are keyed by the content hash, so the same image
+    #              from the different URLs is stored once. URL entries are
+    #              keyed by the URL and point to the object with its validators.
+    OBJECTS_DIRECTORY_NAME = "objects"
+    URLS_DIRECTORY_NAME = "urls"
+    TEMPORARY_DIRECTORY_NAME = "temporary"
+    LOCK_FILE_NAME = "eviction.lock"
+
+    def __init__(self, cache_directory: str, cache_maximum_size: int) -> None:
+        """Class constructor.
+
+        Args:
+            cache_directory (str): Path to the cache directory.
+            cache_maximum_size (int): Maximum size of the cache (in bytes).
+        """
+
+        self.__cache_directory = cache_directory
+        self.__cache_maximum_size = cache_maximum_size
+
+        # NOTE(synzr): size is counted per process and recounted on the eviction,
+        #              `None` means that it wasn't counted yet
+        self.__cache_size = None
+
+        for directory_name in (self.OBJECTS_DIRECTORY_NAME,
+                               self.URLS_DIRECTORY_NAME,
+                               self.TEMPORARY_DIRECTORY_NAME):
+            os.makedirs(os.path.join(cache_directory, directory_name), exist_ok=True)
+
+        self.__logger = logging.getLogger("core.clients.source_cache")
+
+    def __get_url_entry_path(self, source_url: str) -> str:
+        url_hash = blake2b(source_url.encode(), digest_size=SOURCE_CACHE_URL_HASH_SIZE).hexdigest()
+        return os.path.join(self.__cache_directory, self.URLS_DIRECTORY_NAME, f"{url_hash}.json")
+
+    def __get_object_path(self, media_hash: bytes) -> str:
+        object_hash = media_hash.hex()
+        return os.path.join(self.__cache_directory, self.OBJECTS_DIRECTORY_NAME, object_hash[:2], object_hash)
+
+    def __get_temporary_path(self) -> str:
+        return os.path.join(self.__cache_directory, self.TEMPORARY_DIRECTORY_NAME, uuid.uuid4().hex)
+
+    def __touch(self, path: str) -> None:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def __remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __get(self, source_url: str) -> tuple[DownloadedMedia, ExternalDataValidators | None] | None:
+        url_entry_path = self.__get_url_entry_path(source_url)
+
+        try:
+            with open(url_entry_path, "r") as url_entry_file:
+                url_entry = ujson.load(url_entry_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if url_entry["url"] != source_url:
+            return None
+
+        media_hash = bytes.fromhex(url_entry["hash"])
+        object_path = self.__get_object_path(media_hash)
+
+        # The caller receives its own link, so the eviction can't remove the file under it
+        media_file_path = self.__get_temporary_path()
+
+        try:
+            os.link(object_path, media_file_path)
+        except FileNotFoundError:
+            self.__remove(url_entry_path)
+            return None
+
+        self.__touch(object_path)
+        self.__touch(url_entry_path)
+
+        validators = None
+
+        if url_entry["etag"] or url_entry["last_modified"]:
+            validators = ExternalDataValidators(validator_etag=url_entry["etag"],
+                                                validator_last_modified=url_entry["last_modified"])
+
+        return DownloadedMedia(media_contents=None,
+                               media_file_path=media_file_path,
+                               media_size=url_entry["size"],
+                               media_hash=media_hash), validators
+
+    def __write_atomically(self, path: str, contents: bytes) -> None:
+        temporary_path = self.__get_temporary_path()
+
+        with open(temporary_path, "wb") as temporary_file:
+            temporary_file.write(contents)
+
+        os.replace(temporary_path, path)
+
+    def __put(self,
+              source_url: str,
+              media: DownloadedMedia,
+              validators: ExternalDataValidators | None) -> None:
+        object_path = self.__get_object_path(media.media_hash)
+        added_size = 0
+
+        if os.path.exists(object_path):
+            self.__touch(object_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+            if media.media_contents is not None:
+                self.__write_atomically(object_path, media.media_contents)
+            else:
+                temporary_path = self.__get_temporary_path()
+
+                # Spilled images are linked when they're on the same file system
+                try:
+                    os.link(media.media_file_path, temporary_path)
+                except OSError:
+                    shutil.copyfile(media.media_file_path, temporary_path)
+
+                os.replace(temporary_path, object_path)
+
+            added_size += media.media_size
+
+        url_entry = ujson.dumps({
+            "url": source_url,
+            "hash": media.media_hash.hex(),
+            "size": media.media_size,
+            "etag": validators.validator_etag if validators else None,
+            "last_modified": validators.validator_last_modified if validators else None
+        }).encode()
+
+        self.__write_atomically(self.__get_url_entry_path(source_url), url_entry)
+        added_size += len(url_entry)
+
+        if self.__cache_size is not None:
+            self.__cache_size += added_size
+
+        if self.__cache_size is None or self.__cache_size > self.__cache_maximum_size:
+            self.__evict()
+
+    def __evict(self) -> None:
+        lock_file_path = os.path.join(self.__cache_directory, self.LOCK_FILE_NAME)
+
+        # NOTE(synzr): the cache directory could be shared by the multiple processes,
+        #              so only one of them is scanning and evicting at the time
+        with open(lock_file_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            cache_entries = []
+            expired_at = time.time() - SOURCE_CACHE_TEMPORARY_FILE_LIFETIME
+
+            for directory_entry in os.scandir(os.path.join(self.__cache_directory, self.TEMPORARY_DIRECTORY_NAME)):
+                if directory_entry.stat().st_mtime < expired_at:
+                    self.__remove(directory_entry.path)
+
+            for directory_name in (self.OBJECTS_DIRECTORY_NAME, self.URLS_DIRECTORY_NAME):
+                for directory_path, _, file_names in os.walk(os.path.join(self.__cache_directory, directory_name)):
+                    for file_name in file_names:
+                        file_path = os.path.join(directory_path, file_name)
+
+                        try:
+                            file_stat = os.stat(file_path)
+                        except FileNotFoundError:
+                            continue
+
+                        cache_entries.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+            cache_size = sum(file_size for _, file_size, _ in cache_entries)
+
+            if cache_size > self.__cache_maximum_size:
+                target_size = self.__cache_maximum_size * SOURCE_CACHE_EVICTION_RATIO
+                evicted_count = 0
+
+                # Least recently used entries are the first ones
+                for _, file_size, file_path in sorted(cache_entries):
+                    if cache_size <= target_size:
+                        break
+
+                    self.__remove(file_path)
+
+                    cache_size -= file_size
+                    evicted_count += 1
+
+                self.__logger.info(f"__evict(): Evicted {evicted_count} entries, cache size: {cache_size}")
+
+            self.__cache_size = cache_size
+
+    async def get(self, source_url: str) -> tuple[DownloadedMedia, ExternalDataValidators | None] | None:
+        """Get the source image from the cache.
+
+        Args:
+            source_url (str): Source image URL.
+
+        Returns:
+            tuple[DownloadedMedia, ExternalDataValidators | None] | None: Cached image (as a temporary
+                file, which should be removed by the caller) with its validators.
+        """
+
+        try:
+            return await asyncio.to_thread(self.__get, source_url)
+        except OSError as error:
+            self.__logger.warning(f"get(source_url={source_url}): Failed to read the cache: {error}")
+            return None
+
+    async def put(self,
+                  source_url: str,
+                  media: DownloadedMedia,
+                  validators: ExternalDataValidators | None) -> None:
+        """Put the source image to the cache.
+
+        Args:
+            source_url (str): Source image URL.
+            media (DownloadedMedia): Downloaded image.
+            validators (ExternalDataValidators | None): Validators of the image.
+        """
+
+        try:
+            await asyncio.to_thread(self.__put, source_url, media, validators)
+        except OSError as error:
+            self.__logger.warning(f"put(source_url={source_url}): Failed to write the cache: {error}")
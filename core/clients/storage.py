@@ -0,0 +1,320 @@
+from core.models import StorageConnectionSettings, LatencyMetrics, EncodedImage
+
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+from contextlib import AsyncExitStack
+from dataclasses import replace
+
+from typing import AsyncIterator
+
+import aiobotocore.session
+import asyncio
+import base64
+import logging
+import time
+
+STORAGE_DELETE_BATCH_SIZE = 1000
+
+# Object keys are including the hashes of the source and the processing profile,
+# so the stored objects are never changing
+STORAGE_OBJECT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageClient:
+    """Process-wide S3 client with a pooled connector."""
+
+    def __init__(self, storage_connection_settings: StorageConnectionSettings) -> None:
+        """Class constructor.
+
+        Args:
+            storage_connection_settings (StorageConnectionSettings): Storage connection settings.
+        """
+
+        self.__storage_connection_settings = storage_connection_settings
+
+        self.__client = None
+        self.__exit_stack = None
+        self.__client_lock = asyncio.Lock()
+
+        self.__upload_metrics = LatencyMetrics()
+        self.__logger = logging.getLogger("core.clients.storage")
+
+    @property
+    def bucket_name(self) -> str:
+        """Name of the storage bucket."""
+
+        return self.__storage_connection_settings.bucket_name
+
+    @property
+    def multipart_part_size(self) -> int:
+        """Size of the multipart upload part."""
+
+        return self.__storage_connection_settings.multipart_part_size
+
+    async def __instantiate_client(self) -> None:
+        config = AioConfig(max_pool_connections=self.__storage_connection_settings.pool_maximum_size,
+                           retries={
+                               "max_attempts": self.__storage_connection_settings.retries_maximum_attempts,
+                               "mode": "standard"
+                           })
+
+        session = aiobotocore.session.get_session()
+
+        self.__exit_stack = AsyncExitStack()
+        self.__client = await self.__exit_stack.enter_async_context(
+            session.create_client("s3",
+                                  region_name=self.__storage_connection_settings.instance_region_name,
+                                  endpoint_url=self.__storage_connection_settings.instance_url,
+                                  aws_access_key_id=self.__storage_connection_settings.credentials_access_key,
+                                  aws_secret_access_key=self.__storage_connection_settings.credentials_secret_access_key,
+                                  config=config))
+
+        self.__logger.info("__instantiate_client(): Instantiated an storage client")
+
+    async def start(self) -> None:
+        """Create the storage client (if it wasn't created yet)."""
+
+        await self.get_client()
+
+    async def get_client(self) -> any:
+        """Get the shared storage client.
+
+        Returns:
+            any: S3 client.
+        """
+
+        if not self.__client:
+            async with self.__client_lock:
+                if not self.__client:
+                    await self.__instantiate_client()
+
+        return self.__client
+
+    async def is_object_exists(self, object_key: str) -> bool:
+        """Check if the object exists in the bucket.
+
+        Args:
+            object_key (str): Object key.
+
+        Returns:
+            bool: Is the object exists?
+        """
+
+        client = await self.get_client()
+
+        try:
+            await client.head_object(Bucket=self.bucket_name, Key=object_key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in ("404", "NoSuchKey", "NotFound"):
+                self.__logger.error(f"is_object_exists(object_key={object_key}): {error}")
+
+            return False
+
+        return True
+
+    async def __upload_part(self,
+                            client: any,
+                            object_key: str,
+                            upload_id: str,
+                            part_number: int,
+                            part_contents: bytearray,
+                            part_digest: bytes,
+                            upload_semaphore: asyncio.Semaphore) -> dict:
+        async with upload_semaphore:
+            response = await client.upload_part(
+                Body=part_contents,
+                Bucket=self.bucket_name,
+                Key=object_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                ContentLength=len(part_contents),
+                ContentMD5=base64.b64encode(part_digest).decode()
+            )
+
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    async def __upload_multipart_object(self,
+                                        client: any,
+                                        object_key: str,
+                                        encoded_image: EncodedImage,
+                                        content_type: str) -> None:
+        response = await client.create_multipart_upload(Bucket=self.bucket_name,
+                                                        Key=object_key,
+                                                        ContentType=content_type,
+                                                        CacheControl=STORAGE_OBJECT_CACHE_CONTROL)
+        upload_id = response["UploadId"]
+        upload_semaphore = asyncio.Semaphore(self.__storage_connection_settings.multipart_concurrency)
+
+        part_tasks = [
+            asyncio.create_task(self.__upload_part(client, object_key, upload_id, part_index + 1,
+                                                   part_contents, part_digest, upload_semaphore))
+            for part_index, (part_contents, part_digest)
+            in enumerate(zip(encoded_image.image_parts, encoded_image.image_part_digests))
+        ]
+
+        try:
+            uploaded_parts = await asyncio.gather(*part_tasks)
+
+            await client.complete_multipart_upload(Bucket=self.bucket_name,
+                                                   Key=object_key,
+                                                   UploadId=upload_id,
+                                                   MultipartUpload={"Parts": uploaded_parts})
+        except BaseException:
+            for part_task in part_tasks:
+                if not part_task.done(): part_task.cancel()
+
+            await asyncio.gather(*part_tasks, return_exceptions=True)
+
+            # Uploaded parts are billed until the upload is aborted
+            await client.abort_multipart_upload(Bucket=self.bucket_name,
+                                                Key=object_key,
+                                                UploadId=upload_id)
+            raise
+
+    async def upload_encoded_object(self,
+                                    object_key: str,
+                                    encoded_image: EncodedImage,
+                                    content_type: str) -> None:
+        """Upload the encoded image to the bucket.
+
+        Images with the single part are uploaded with `put_object`,
+        other images are uploaded with the parallel multipart upload.
+
+        Args:
+            object_key (str): Object key.
+            encoded_image (EncodedImage): Encoded image.
+            content_type (str): Content type of the object.
+        """
+
+        client = await self.get_client()
+        upload_started_at = time.perf_counter()
+
+        if len(encoded_image.image_parts) == 1:
+            await client.put_object(
+                Body=encoded_image.image_parts[0],
+                Bucket=self.bucket_name,
+                Key=object_key,
+                ContentType=content_type,
+                CacheControl=STORAGE_OBJECT_CACHE_CONTROL,
+                ContentLength=encoded_image.image_size,
+                ContentMD5=base64.b64encode(encoded_image.image_digest).decode()
+            )
+        else:
+            await self.__upload_multipart_object(client, object_key, encoded_image, content_type)
+
+        upload_latency = time.perf_counter() - upload_started_at
+        self.__upload_metrics.record(upload_latency)
+
+        self.__logger.info(f"upload_encoded_object(object_key={object_key}, encoded_image=[{encoded_image.image_size} bytes, {len(encoded_image.image_parts)} parts], content_type={content_type}): Uploaded in {upload_latency:.3f}s (average {self.__upload_metrics.metrics_average_seconds:.3f}s)")
+
+    def get_upload_metrics(self) -> LatencyMetrics:
+        """Get the upload latency metrics.
+
+        Returns:
+            LatencyMetrics: Copy of the upload latency metrics.
+        """
+
+        return replace(self.__upload_metrics)
+
+    def __get_instance_url_base(self) -> str:
+        instance_url = self.__storage_connection_settings.instance_url
+        bucket_name = self.__storage_connection_settings.bucket_name
+
+        return f"{instance_url}/{bucket_name}/" \
+            if not instance_url.endswith("/") \
+                else f"{instance_url}{bucket_name}/"
+
+    def __get_public_url_base(self) -> str:
+        public_url_base = self.__storage_connection_settings.public_url_base
+
+        if public_url_base:
+            return public_url_base if public_url_base.endswith("/") \
+                else public_url_base + "/"
+
+        return self.__get_instance_url_base()
+
+    def get_public_url(self, object_key: str) -> str:
+        """Get the public URL of the object.
+
+        Args:
+            object_key (str): Object key.
+
+        Returns:
+            str: Public URL.
+        """
+
+        return self.__get_public_url_base() + object_key
+
+    def get_object_key(self, public_url: str) -> str | None:
+        """Get the object key from the public URL of the object.
+
+        Args:
+            public_url (str): Public URL.
+
+        Returns:
+            str | None: Object key (or None if the URL is not pointing to the bucket).
+        """
+
+        # NOTE(synzr): older contents could be saved before the public URL base was changed
+        for url_base in (self.__get_public_url_base(), self.__get_instance_url_base()):
+            if public_url.startswith(url_base):
+                return public_url[len(url_base):]
+
+        return None
+
+    async def iterate_objects(self, prefix: str) -> AsyncIterator[list[dict]]:
+        """Iterate over the objects in the bucket.
+
+        Args:
+            prefix (str): Prefix of the object keys.
+
+        Yields:
+            list[dict]: Page of the objects (with `Key`, `Size` and `LastModified` fields).
+        """
+
+        client = await self.get_client()
+        paginator = client.get_paginator("list_objects_v2")
+
+        async for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            yield page.get("Contents", [])
+
+    async def delete_objects(self, object_keys: list[str]) -> int:
+        """Delete the objects from the bucket.
+
+        Args:
+            object_keys (list[str]): Object keys.
+
+        Returns:
+            int: Count of deleted objects.
+        """
+
+        client = await self.get_client()
+        deleted_count = 0
+
+        # S3 is deleting up to 1000 objects per request
+        for batch_index in range(0, len(object_keys), STORAGE_DELETE_BATCH_SIZE):
+            batch_keys = object_keys[batch_index:batch_index + STORAGE_DELETE_BATCH_SIZE]
+
+            response = await client.delete_objects(Bucket=self.bucket_name,
+                                                   Delete={
+                                                       "Objects": [{"Key": object_key} for object_key in batch_keys],
+                                                       "Quiet": True
+                                                   })
+
+            for error in response.get("Errors", []):
+                self.__logger.error(f"delete_objects(object_keys=[{len(object_keys)} keys]): Failed to delete {error['Key']}: {error['Message']}")
+
+            deleted_count += len(batch_keys) - len(response.get("Errors", []))
+
+        return deleted_count
+
+    async def close(self) -> None:
+        """Close the shared storage client."""
+
+        if self.__exit_stack:
+            await self.__exit_stack.aclose()
+
+        self.__client = None
+        self.__exit_stack = None
+
+        self.__logger.info("close(): Closed the storage client")
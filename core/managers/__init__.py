@@ -1,3 +1,6 @@
 from .content import ContentManager
 from .external_data import ExternalDataManager
 from .media_processing import MediaProcessingManager
+from .derivative import DerivativeManager
+from .ingest import IngestManager
+from .ingest_queue import IngestQueueManager
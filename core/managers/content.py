@@ -1,18 +1,21 @@
+from core.clients import StorageClient
 from core.models import (
     DatabaseConnectionSettings,
-    StorageConnectionSettings,
     ViewTagType,
     ViewOrderType,
     ViewSettings,
     Content,
     ContentViewResult,
-    ImageType
+    ImageType,
+    ImageFormat
 )
 
 from .media_processing import MediaProcessingManager
+from .derivative import DerivativeManager
+
+from typing import AsyncIterator
 
 import aiomysql
-import aiobotocore.session
 
 import asyncio
 import ujson
@@ -33,35 +36,80 @@ class ContentManager:
         OFFSET {offset_value};
     """
 
+    # NOTE(synzr): resubmitted contents are skipped instead of failing the whole batch,
+    #              the other errors (e.g. too long data) are still raised
     INSERT_CONTENT_SQL_QUERY = """
         INSERT INTO
         `contents` (
             `contents`.`content_submission_urn`, `contents`.`content_source_urn`,
             `contents`.`content_origin_urn`, `contents`.`content_media_url`,
-            `contents`.`content_thumbnail_url`, `contents`.`content_tags`
+            `contents`.`content_thumbnail_url`, `contents`.`content_media_variants`,
+            `contents`.`content_source_media_url`, `contents`.`content_tags`
         )
-        VALUES (%s, %s, %s, %s, %s, %s);
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE `contents`.`content_id` = `contents`.`content_id`;
+    """
+
+    CONTENTS_AFTER_SQL_QUERY = """
+        SELECT *
+        FROM `contents`
+        WHERE `contents`.`content_id` > %s
+        ORDER BY `contents`.`content_id` ASC
+        LIMIT %s;
+    """
+
+    MEDIA_URLS_AFTER_SQL_QUERY = """
+        SELECT
+            `contents`.`content_id`,
+            `contents`.`content_media_url`,
+            `contents`.`content_thumbnail_url`,
+            `contents`.`content_media_variants`
+        FROM `contents`
+        WHERE `contents`.`content_id` > %s
+        ORDER BY `contents`.`content_id` ASC
+        LIMIT %s;
+    """
+
+    UPDATE_CONTENT_MEDIA_SQL_QUERY = """
+        UPDATE `contents`
+        SET
+            `contents`.`content_media_url` = %s,
+            `contents`.`content_thumbnail_url` = %s,
+            `contents`.`content_media_variants` = %s,
+            `contents`.`content_source_media_url` = %s
+        WHERE `contents`.`content_id` = %s;
     """
 
     INSERT_CONTENT_KEYS = [
         "content_submission_urn", "content_source_urn", "content_origin_urn",
-        "content_media_url", "content_thumbnail_url", "content_tags"
+        "content_media_url", "content_thumbnail_url", "content_media_variants",
+        "content_source_media_url", "content_tags"
     ]
 
+    # NOTE(synzr): JSON keys of the media variants
+    MEDIA_VARIANT_NAMES = {
+        ImageType.MEDIA: "media",
+        ImageType.THUMBNAIL: "thumbnail"
+    }
+
     def __init__(self,
                  database_connection_settings: DatabaseConnectionSettings,
-                 storage_connection_settings: StorageConnectionSettings,
-                 media_processing_manager: MediaProcessingManager) -> None:
+                 storage_client: StorageClient,
+                 media_processing_manager: MediaProcessingManager,
+                 derivative_manager: DerivativeManager | None = None) -> None:
         """Class constructor.
 
         Args:
             database_connection_settings (DatabaseConnectionSettings): Database connection settings.
-            storage_connection_settings (StorageConnectionSettings): Storage connection settings.
+            storage_client (StorageClient): Shared storage client.
             media_processing_manager (MediaProcessingManager): Media processing manager.
+            derivative_manager (DerivativeManager | None, optional): Derivative manager
+                (the derivatives are rendered on demand if it's passed).
         """
 
-        self.__storage_connection_settings = storage_connection_settings
+        self.__storage_client = storage_client
         self.__media_processing_manager = media_processing_manager
+        self.__derivative_manager = derivative_manager
 
         self.__logger = logging.getLogger("core.managers.content")
 
@@ -129,6 +177,36 @@ class ContentManager:
 
         return nesseccary_tags + blocked_tags
 
+    def __parse_content_row(self, row: dict) -> Content:
+        content = Content(**row)
+        content.content_tags = ujson.loads(content.content_tags)
+
+        if content.content_media_variants:
+            content.content_media_variants = ujson.loads(content.content_media_variants)
+
+        return content
+
+    def __set_processed_images(self,
+                               content: Content,
+                               source_image_url: str,
+                               processed_images: dict[str, dict[ImageType, dict[ImageFormat, str]]]) -> None:
+        content.content_source_media_url = source_image_url
+
+        content.content_media_url = self.__storage_client.get_public_url(
+            processed_images[source_image_url][ImageType.MEDIA][ImageFormat.JPEG]
+        )
+
+        content.content_thumbnail_url = self.__storage_client.get_public_url(
+            processed_images[source_image_url][ImageType.THUMBNAIL][ImageFormat.JPEG]
+        )
+
+        # Every format is recorded, so the galleries can pick the smallest supported one
+        content.content_media_variants = {
+            variant_name: {image_format.value: self.__storage_client.get_public_url(image_path)
+                           for image_format, image_path in processed_images[source_image_url][image_type].items()}
+            for image_type, variant_name in self.MEDIA_VARIANT_NAMES.items()
+        }
+
     async def get_contents(self, view_settings: ViewSettings) -> ContentViewResult:
         """Get contents with an view settings.
 
@@ -149,10 +227,7 @@ class ContentManager:
                 results = []
 
                 for row in await cursor.fetchall():
-                    content = Content(**row)
-                    content.content_tags = ujson.loads(content.content_tags)
-
-                    results.append(content)
+                    results.append(self.__parse_content_row(row))
 
                 # Maximum size of `len(results)` is equals to `view_settings.page_size + 1``
                 has_more = len(results) == view_settings.page_size + 1
@@ -163,22 +238,6 @@ class ContentManager:
                 return ContentViewResult(results=results,
                                          has_more=has_more)
 
-    def __get_storage_url(self, file_path: str) -> str:
-        instance_url = self.__storage_connection_settings.instance_url
-        bucket_name = self.__storage_connection_settings.bucket_name
-
-        base_url = f"{instance_url}/{bucket_name}/" \
-            if not instance_url.endswith("/") \
-                else f"{instance_url}{bucket_name}/"
-
-        public_url_base = self.__storage_connection_settings.public_url_base
-
-        if public_url_base:
-            base_url = public_url_base if public_url_base.endswith("/") \
-                else public_url_base + "/"
-
-        return base_url + file_path
-
     async def add_contents(self, contents: list[Content], process_media: bool = False) -> int:
         """Add an multiple content information to the database.
 
@@ -190,24 +249,46 @@ class ContentManager:
             list: Count of added contents.
         """
 
+        processed_images = {}
+        source_keys = {}
+
+        # NOTE(synzr): in the lazy mode only the sources are saved,
+        #              derivatives are rendered on the first request
+        if process_media and self.__derivative_manager:
+            source_keys = await self.__derivative_manager.add_sources([content.content_media_url
+                                                                       for content in contents])
+
+        # All of the images are processed at once, so the pipeline can run them concurrently
+        elif process_media:
+            processed_images = await self.__media_processing_manager.process_images_from_urls({
+                content.content_media_url: [ImageType.MEDIA, ImageType.THUMBNAIL]
+                for content in contents
+            })
+
         async with self.__database_pool.acquire() as connection:
             arguments_of_queries = []
 
             for content in contents:
-                if process_media:
+                if process_media and self.__derivative_manager:
                     source_image_url = content.content_media_url
+                    content.content_source_media_url = source_image_url
 
-                    processed_images = await self.__media_processing_manager.process_images_from_urls({
-                        source_image_url: [ImageType.MEDIA, ImageType.THUMBNAIL]
-                    })
+                    content.content_media_variants = {
+                        variant_name: {image_format.value: self.__derivative_manager.get_render_url(
+                                           source_keys[source_image_url], image_type, image_format
+                                       )
+                                       for image_format in self.__media_processing_manager.output_formats}
+                        for image_type, variant_name in self.MEDIA_VARIANT_NAMES.items()
+                    }
 
-                    content.content_media_url = self.__get_storage_url(
-                        processed_images[source_image_url][ImageType.MEDIA]
-                    )
+                    content.content_media_url = content.content_media_variants["media"][ImageFormat.JPEG.value]
+                    content.content_thumbnail_url = content.content_media_variants["thumbnail"][ImageFormat.JPEG.value]
 
-                    content.content_thumbnail_url = self.__get_storage_url(
-                        processed_images[source_image_url][ImageType.THUMBNAIL]
-                    )
+                elif process_media:
+                    self.__set_processed_images(content, content.content_media_url, processed_images)
+
+                if content.content_media_variants is not None:
+                    content.content_media_variants = ujson.dumps(content.content_media_variants)
 
                 content.content_tags = ujson.dumps(content.content_tags)
                 query_arguments = [getattr(content, key) for key in self.INSERT_CONTENT_KEYS]
@@ -220,3 +301,118 @@ class ContentManager:
 
                 self.__logger.info(f"add_contents(contents={contents}, process_media={process_media}): Added {cursor.rowcount} contents")
                 return cursor.rowcount
+
+    async def get_contents_after(self, content_id: int, limit: int) -> list[Content]:
+        """Get contents after the content ID (ordered by the content ID).
+
+        Args:
+            content_id (int): Content ID (exclusive).
+            limit (int): Maximum count of contents.
+
+        Returns:
+            list[Content]: Contents.
+        """
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.CONTENTS_AFTER_SQL_QUERY, [content_id, limit])
+                results = [self.__parse_content_row(row) for row in await cursor.fetchall()]
+
+                self.__logger.info(f"get_contents_after(content_id={content_id}, limit={limit}): Got {len(results)} contents")
+                return results
+
+    async def rerender_contents(self, contents: list[Content]) -> int:
+        """Re-render the media of the contents with the current image settings.
+
+        Contents of the lazy mode (their media is on the rendering service) are not
+        converted to the stored derivatives, the rendered paths of their sources are
+        reset instead, so the rendering service renders them again on the next request.
+        The lazy contents are recognized only if the derivative manager is set.
+
+        Args:
+            contents (list[Content]): Contents.
+
+        Returns:
+            int: Count of updated contents.
+        """
+
+        lazy_source_keys = {}
+
+        if self.__derivative_manager:
+            for content in contents:
+                if source_key := self.__derivative_manager.get_source_key_of_render_url(content.content_media_url):
+                    lazy_source_keys[content.content_id] = source_key
+
+        if lazy_source_keys:
+            # NOTE(synzr): the old derivatives are collected after the grace period,
+            #              while the caches of the rendering service are expiring
+            await self.__derivative_manager.reset_derivative_paths(sorted(set(lazy_source_keys.values())))
+
+        contents = [content for content in contents if content.content_id not in lazy_source_keys]
+
+        if not contents:
+            return len(lazy_source_keys)
+
+        # NOTE(synzr): contents before the source media URL was saved
+        #              are re-rendered from their current media
+        source_image_urls = {content.content_id: content.content_source_media_url or content.content_media_url
+                             for content in contents}
+
+        processed_images = await self.__media_processing_manager.process_images_from_urls({
+            source_image_url: [ImageType.MEDIA, ImageType.THUMBNAIL]
+            for source_image_url in source_image_urls.values()
+        })
+
+        arguments_of_queries = []
+
+        for content in contents:
+            self.__set_processed_images(content, source_image_urls[content.content_id], processed_images)
+
+            arguments_of_queries.append([content.content_media_url, content.content_thumbnail_url,
+                                         ujson.dumps(content.content_media_variants),
+                                         content.content_source_media_url, content.content_id])
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.executemany(self.UPDATE_CONTENT_MEDIA_SQL_QUERY, arguments_of_queries)
+                await connection.commit()
+
+                self.__logger.info(f"rerender_contents(contents=[{len(contents)} contents]): Updated {cursor.rowcount} contents, "
+                                   f"reset {len(lazy_source_keys)} lazy contents")
+                return cursor.rowcount + len(lazy_source_keys)
+
+    async def iterate_media_urls(self,
+                                 content_id: int = 0,
+                                 batch_size: int = 1000) -> AsyncIterator[tuple[int, list[str]]]:
+        """Iterate over the media URLs of the contents (including the variants).
+
+        Args:
+            content_id (int, optional): Content ID to start after (exclusive).
+            batch_size (int, optional): Count of contents in the batch.
+
+        Yields:
+            tuple[int, list[str]]: Last content ID of the batch with the media URLs.
+        """
+
+        while True:
+            async with self.__database_pool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(self.MEDIA_URLS_AFTER_SQL_QUERY, [content_id, batch_size])
+                    rows = await cursor.fetchall()
+
+            if not rows:
+                return
+
+            media_urls = []
+
+            for row in rows:
+                media_urls.append(row["content_media_url"])
+
+                if row["content_thumbnail_url"]:
+                    media_urls.append(row["content_thumbnail_url"])
+
+                for media_variant in ujson.loads(row["content_media_variants"] or "{}").values():
+                    media_urls.extend(media_variant.values())
+
+            content_id = rows[-1]["content_id"]
+            yield content_id, media_urls
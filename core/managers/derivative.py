@@ -0,0 +1,368 @@
+from core.models import (
+    DatabaseConnectionSettings,
+    RenderServiceSettings,
+    ImageType,
+    ImageFormat
+)
+from collections import OrderedDict
+
+from hashlib import blake2b
+from typing import AsyncIterator
+
+from .media_processing import MediaProcessingManager
+
+import aiomysql
+import asyncio
+
+import time
+import ujson
+import logging
+
+DERIVATIVE_SOURCE_KEY_SIZE = 16
+DERIVATIVE_PATH_CACHE_SIZE = 65536
+
+# NOTE(synzr): cached paths are expiring, so the rendering service picks up the
+#              derivatives reset by the other processes (e.g. the re-rendering job)
+DERIVATIVE_PATH_CACHE_TTL = 300
+
+
+class DerivativeManager:
+    """Derivative manager (on-demand rendering of the derivatives)."""
+
+    GET_DERIVATIVE_SOURCE_SQL = """
+        SELECT
+            `derivative_sources`.`derivative_source_url`,
+            `derivative_sources`.`derivative_source_paths`
+        FROM `derivative_sources`
+        WHERE `derivative_sources`.`derivative_source_key` = %s;
+    """
+
+    ADD_DERIVATIVE_SOURCE_SQL = """
+        INSERT IGNORE
+        INTO `derivative_sources` (
+            `derivative_sources`.`derivative_source_key`,
+            `derivative_sources`.`derivative_source_url`
+        )
+        VALUES (%s, %s);
+    """
+
+    DERIVATIVE_PATHS_AFTER_SQL = """
+        SELECT
+            `derivative_sources`.`derivative_source_key`,
+            `derivative_sources`.`derivative_source_paths`,
+            IF(
+                `derivative_sources`.`derivative_source_reset_at` > CURRENT_TIMESTAMP - INTERVAL %s SECOND,
+                `derivative_sources`.`derivative_source_previous_paths`,
+                NULL
+            ) AS `derivative_source_previous_paths`
+        FROM `derivative_sources`
+        WHERE `derivative_sources`.`derivative_source_key` > %s
+        AND (
+            `derivative_sources`.`derivative_source_paths` IS NOT NULL OR
+            `derivative_sources`.`derivative_source_previous_paths` IS NOT NULL
+        )
+        ORDER BY `derivative_sources`.`derivative_source_key` ASC
+        LIMIT %s;
+    """
+
+    UPDATE_DERIVATIVE_PATHS_SQL = """
+        UPDATE `derivative_sources`
+        SET `derivative_sources`.`derivative_source_paths` = JSON_MERGE_PATCH(
+            COALESCE(`derivative_sources`.`derivative_source_paths`, JSON_OBJECT()), %s
+        )
+        WHERE `derivative_sources`.`derivative_source_key` = %s;
+    """
+
+    # NOTE(synzr): previous paths are kept, so the derivatives which are still cached
+    #              (by the rendering service or the clients) are not collected right away
+    RESET_DERIVATIVE_PATHS_SQL = """
+        UPDATE `derivative_sources`
+        SET
+            `derivative_sources`.`derivative_source_previous_paths` = COALESCE(
+                `derivative_sources`.`derivative_source_paths`,
+                `derivative_sources`.`derivative_source_previous_paths`
+            ),
+            `derivative_sources`.`derivative_source_reset_at` = CURRENT_TIMESTAMP,
+            `derivative_sources`.`derivative_source_paths` = NULL
+        WHERE `derivative_sources`.`derivative_source_key` IN ({derivative_source_keys});
+    """
+
+    def __init__(self,
+                 database_connection_settings: DatabaseConnectionSettings,
+                 render_service_settings: RenderServiceSettings,
+                 media_processing_manager: MediaProcessingManager) -> None:
+        """Class constructor.
+
+        Args:
+            database_connection_settings (DatabaseConnectionSettings): Database connection settings.
+            render_service_settings (RenderServiceSettings): On-demand rendering service settings.
+            media_processing_manager (MediaProcessingManager): Media processing manager.
+        """
+
+        self.__render_service_settings = render_service_settings
+        self.__media_processing_manager = media_processing_manager
+
+        self.__derivative_paths = OrderedDict()
+        self.__pending_renders = {}
+
+        self.__logger = logging.getLogger("core.managers.derivative")
+
+        asyncio.get_event_loop().run_until_complete(
+            self.__instantiate_pool(database_connection_settings))
+
+    async def __instantiate_pool(self,
+                                 database_connection_settings: DatabaseConnectionSettings) -> None:
+        """Instantiate the database pool.
+
+        Args:
+            database_connection_settings (DatabaseConnectionSettings): Database connection settings.
+        """
+
+        self.__database_pool = await aiomysql.create_pool(database_connection_settings.pool_minimum_size,
+                                                          database_connection_settings.pool_maximum_size,
+                                                          host=database_connection_settings.instance_hostname,
+                                                          port=database_connection_settings.instance_port,
+                                                          user=database_connection_settings.credentials_username,
+                                                          password=database_connection_settings.credentials_password,
+                                                          db=database_connection_settings.database_name,
+                                                          cursorclass=aiomysql.DictCursor)
+
+        self.__logger.info("__instantiate_pool(database_connection_settings=[redacted]): Instantiated an database pool")
+
+    def __get_cached_derivative_paths(self, cache_key: tuple[str, ImageType]) -> dict[ImageFormat, str] | None:
+        cache_entry = self.__derivative_paths.get(cache_key)
+
+        if not cache_entry:
+            return None
+
+        derivative_paths, cached_at = cache_entry
+
+        if time.monotonic() - cached_at >= DERIVATIVE_PATH_CACHE_TTL:
+            del self.__derivative_paths[cache_key]
+            return None
+
+        self.__derivative_paths.move_to_end(cache_key)
+        return derivative_paths
+
+    def __add_cached_derivative_paths(self,
+                                      cache_key: tuple[str, ImageType],
+                                      derivative_paths: dict[ImageFormat, str]) -> None:
+        self.__derivative_paths[cache_key] = (derivative_paths, time.monotonic())
+        self.__derivative_paths.move_to_end(cache_key)
+
+        if len(self.__derivative_paths) > DERIVATIVE_PATH_CACHE_SIZE:
+            self.__derivative_paths.popitem(last=False)
+
+    async def __get_derivative_source(self, source_key: str) -> dict | None:
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.GET_DERIVATIVE_SOURCE_SQL, [source_key])
+                return await cursor.fetchone()
+
+    async def __render_derivatives(self,
+                                   source_key: str,
+                                   source_url: str,
+                                   image_type: ImageType) -> dict[ImageFormat, str]:
+        processed_images = await self.__media_processing_manager.process_images_from_urls({source_url: [image_type]})
+        derivative_paths = processed_images[source_url][image_type]
+
+        # Rendered paths are saved, so the next requests are not downloading the source again
+        stored_paths = {image_type.name.lower(): {image_format.value: derivative_path
+                                                  for image_format, derivative_path in derivative_paths.items()}}
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.UPDATE_DERIVATIVE_PATHS_SQL, [ujson.dumps(stored_paths), source_key])
+                await connection.commit()
+
+        self.__add_cached_derivative_paths((source_key, image_type), derivative_paths)
+
+        self.__logger.info(f"__render_derivatives(source_key={source_key}, source_url={source_url}, image_type={image_type}): Rendered {len(derivative_paths)} derivatives")
+        return derivative_paths
+
+    def get_source_key(self, source_url: str) -> str:
+        """Get the key of the derivative source.
+
+        Args:
+            source_url (str): Source image URL.
+
+        Returns:
+            str: Key of the derivative source.
+        """
+
+        return blake2b(source_url.encode(), digest_size=DERIVATIVE_SOURCE_KEY_SIZE).hexdigest()
+
+    def get_render_url(self, source_key: str, image_type: ImageType, image_format: ImageFormat) -> str:
+        """Get the URL of the derivative on the rendering service.
+
+        Args:
+            source_key (str): Key of the derivative source.
+            image_type (ImageType): Image type.
+            image_format (ImageFormat): Image format.
+
+        Returns:
+            str: URL of the derivative.
+        """
+
+        public_url_base = self.__render_service_settings.public_url_base.rstrip("/")
+        return f"{public_url_base}/{image_type.name.lower()}/{source_key}.{image_format.value}"
+
+    def get_source_key_of_render_url(self, render_url: str) -> str | None:
+        """Get the key of the derivative source from the URL of the rendering service.
+
+        Args:
+            render_url (str): URL of the derivative.
+
+        Returns:
+            str | None: Key of the derivative source (or None if it's not the URL of the rendering service).
+        """
+
+        public_url_base = self.__render_service_settings.public_url_base.rstrip("/")
+
+        if not render_url.startswith(f"{public_url_base}/"):
+            return None
+
+        return render_url.rsplit("/", 1)[-1].split(".", 1)[0]
+
+    async def reset_derivative_paths(self, source_keys: list[str]) -> int:
+        """Forget the rendered derivatives, so they're rendered again on the next request.
+
+        Rendering services of the other processes are forgetting them after the cache TTL,
+        the previous derivatives are kept referenced until the grace period of the garbage collector.
+
+        Args:
+            source_keys (list[str]): Keys of the derivative sources.
+
+        Returns:
+            int: Count of reset derivative sources.
+        """
+
+        if not source_keys:
+            return 0
+
+        for source_key in source_keys:
+            for image_type in ImageType:
+                self.__derivative_paths.pop((source_key, image_type), None)
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                query = self.RESET_DERIVATIVE_PATHS_SQL.format(
+                    derivative_source_keys=", ".join(["%s"] * len(source_keys)))
+
+                await cursor.execute(query, source_keys)
+                await connection.commit()
+
+                self.__logger.info(f"reset_derivative_paths(source_keys=[{len(source_keys)} keys]): Reset {cursor.rowcount} derivative sources")
+                return cursor.rowcount
+
+    async def add_sources(self, source_urls: list[str]) -> dict[str, str]:
+        """Add an multiple derivative sources to the database.
+
+        Args:
+            source_urls (list[str]): Source image URL(s).
+
+        Returns:
+            dict[str, str]: Keys of the derivative sources.
+        """
+
+        source_keys = {source_url: self.get_source_key(source_url) for source_url in source_urls}
+
+        if not source_keys:
+            return source_keys
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.executemany(self.ADD_DERIVATIVE_SOURCE_SQL,
+                                         [[source_key, source_url] for source_url, source_key in source_keys.items()])
+                await connection.commit()
+
+        self.__logger.info(f"add_sources(source_urls={source_urls}): Added {len(source_keys)} derivative sources")
+        return source_keys
+
+    async def get_derivative_path(self,
+                                  source_key: str,
+                                  image_type: ImageType,
+                                  image_format: ImageFormat) -> str | None:
+        """Get the storage path of the derivative, rendering it on the first request.
+
+        Concurrent requests of the same derivative are waiting for the single render.
+
+        Args:
+            source_key (str): Key of the derivative source.
+            image_type (ImageType): Image type.
+            image_format (ImageFormat): Image format.
+
+        Returns:
+            str | None: Storage path of the derivative (or None if the source is unknown).
+        """
+
+        cache_key = (source_key, image_type)
+
+        if derivative_paths := self.__get_cached_derivative_paths(cache_key):
+            return derivative_paths.get(image_format)
+
+        if cache_key not in self.__pending_renders:
+            derivative_source = await self.__get_derivative_source(source_key)
+
+            if not derivative_source:
+                return None
+
+            stored_paths = ujson.loads(derivative_source["derivative_source_paths"] or "{}")
+
+            if image_type.name.lower() in stored_paths:
+                derivative_paths = {ImageFormat(image_format_value): derivative_path
+                                    for image_format_value, derivative_path
+                                    in stored_paths[image_type.name.lower()].items()}
+
+                self.__add_cached_derivative_paths(cache_key, derivative_paths)
+                return derivative_paths.get(image_format)
+
+        # NOTE(synzr): the database query above yields to the event loop,
+        #              so the pending render is checked again
+        if cache_key not in self.__pending_renders:
+            render_task = asyncio.create_task(self.__render_derivatives(source_key,
+                                                                        derivative_source["derivative_source_url"],
+                                                                        image_type))
+            render_task.add_done_callback(lambda _: self.__pending_renders.pop(cache_key, None))
+
+            self.__pending_renders[cache_key] = render_task
+
+        # Render is shielded, so the disconnected client doesn't cancel it for the others
+        derivative_paths = await asyncio.shield(self.__pending_renders[cache_key])
+        return derivative_paths.get(image_format)
+
+    async def iterate_derivative_paths(self,
+                                       previous_paths_period: int = 0,
+                                       batch_size: int = 1000) -> AsyncIterator[list[str]]:
+        """Iterate over the storage paths of the rendered derivatives.
+
+        Args:
+            previous_paths_period (int, optional): Period (in seconds) after the reset
+                while the previous derivatives are included too.
+            batch_size (int, optional): Count of derivative sources in the batch.
+
+        Yields:
+            list[str]: Storage paths of the derivatives.
+        """
+
+        source_key = ""
+
+        while True:
+            async with self.__database_pool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(self.DERIVATIVE_PATHS_AFTER_SQL, [previous_paths_period,
+                                                                           source_key, batch_size])
+                    rows = await cursor.fetchall()
+
+            if not rows:
+                return
+
+            derivative_paths = []
+
+            for row in rows:
+                for paths_column in ("derivative_source_paths", "derivative_source_previous_paths"):
+                    for stored_paths in ujson.loads(row[paths_column] or "{}").values():
+                        derivative_paths.extend(stored_paths.values())
+
+            source_key = rows[-1]["derivative_source_key"]
+            yield derivative_paths
@@ -1,6 +1,6 @@
 from yarl import URL
-from aiohttp import ClientSession
 
+from core.clients import HttpClient
 from core.models import (
     PivixArtwork,
     PivixUser,
@@ -10,6 +10,7 @@ from core.models import (
     TwitterUser,
     DatabaseConnectionSettings,
     ExternalData,
+    ExternalDataValidators,
     URN
 )
 from core.providers import (
@@ -32,7 +33,9 @@ class ExternalDataManager:
     GET_EXTERNAL_DATA_SQL = """
         SELECT
             `external_data`.`external_data_urn`,
-            `external_data`.`external_data`
+            `external_data`.`external_data`,
+            `external_data`.`external_data_etag`,
+            `external_data`.`external_data_last_modified`
         FROM `external_data`
         WHERE {external_data_urn_check};
     """
@@ -41,31 +44,50 @@ class ExternalDataManager:
         INSERT
         INTO `external_data` (
             `external_data`.`external_data_urn`,
-            `external_data`.`external_data`
+            `external_data`.`external_data`,
+            `external_data`.`external_data_etag`,
+            `external_data`.`external_data_last_modified`
         )
-        VALUES (%s, %s)
+        VALUES (%s, %s, %s, %s)
         ON DUPLICATE KEY UPDATE
             `external_data`.`external_data_urn` = %s,
-            `external_data`.`external_data` = %s;
+            `external_data`.`external_data` = %s,
+            `external_data`.`external_data_etag` = %s,
+            `external_data`.`external_data_last_modified` = %s,
+            `external_data`.`external_data_last_update` = CURRENT_TIMESTAMP;
+    """
+
+    TOUCH_EXTERNAL_DATA_SQL = """
+        UPDATE `external_data`
+        SET `external_data`.`external_data_last_update` = CURRENT_TIMESTAMP
+        WHERE `external_data`.`external_data_urn` = %s;
     """
 
     def __init__(self,
-                 database_connection_settings: DatabaseConnectionSettings) -> None:
+                 database_connection_settings: DatabaseConnectionSettings,
+                 http_client: HttpClient) -> None:
         """Class constructor.
 
         Args:
             database_connection_settings (DatabaseConnectionSettings): Database connection settings.
+            http_client (HttpClient): Shared HTTP client.
         """
 
         self.__providers = {}
+        self.__http_client = http_client
         self.__logger = logging.getLogger("core.managers.external_data")
 
         asyncio.get_event_loop().run_until_complete(
             self.__instantiate_pool(database_connection_settings))
 
-        self.add_provider("pixiv", PixivProvider, {"artwork": PivixArtwork, "user": PivixUser})
-        self.add_provider("tumblr", TumblrProvider, {"blog": TumblrBlog, "post": TumblrPost})
-        self.add_provider("twitter", TwitterProvider, {"tweet": TwitterTweet, "user": TwitterUser})
+        provider_class_arguments = {"http_client": http_client}
+
+        self.add_provider("pixiv", PixivProvider, {"artwork": PivixArtwork, "user": PivixUser},
+                          provider_class_arguments)
+        self.add_provider("tumblr", TumblrProvider, {"blog": TumblrBlog, "post": TumblrPost},
+                          provider_class_arguments)
+        self.add_provider("twitter", TwitterProvider, {"tweet": TwitterTweet, "user": TwitterUser},
+                          provider_class_arguments)
 
     async def __instantiate_pool(self,
                                  database_connection_settings: DatabaseConnectionSettings) -> None:
@@ -156,6 +178,9 @@ class ExternalDataManager:
     async def __get_dictionary_using_cached_data(self,
                                                  urns: list[str],
                                                  cursor: aiomysql.Cursor) -> dict[str, ExternalData]:
+        if not urns:
+            return {}
+
         query = self.__generate_get_external_data_query(len(urns))
         await cursor.execute(query, urns)
 
@@ -173,55 +198,147 @@ class ExternalDataManager:
                 external_data_urn_parsed.urn_object
             ](**external_data)
 
+            validators = None
+
+            if row["external_data_etag"] or row["external_data_last_modified"]:
+                validators = ExternalDataValidators(
+                    validator_etag=row["external_data_etag"],
+                    validator_last_modified=row["external_data_last_modified"]
+                )
+
             result[external_data_urn_string] = ExternalData(
                 urn_string=external_data_urn_string,
                 urn_parsed=external_data_urn_parsed,
-                external_data=external_data_as_object
+                external_data=external_data_as_object,
+                validators=validators
             )
 
         self.__logger.info(f"__get_dictionary_using_cached_data(urns={urns}, cursor={cursor}): Got {len(result)} results")
         return result
 
+    async def __fetch_using_provider(self,
+                                     provider_name: str,
+                                     urns_parsed: list[URN]) -> list[tuple[any, ExternalDataValidators | None]]:
+        provider = self.__providers[provider_name]["class_instance"]
+
+        # NOTE(synzr): the validators of the first response are saved too,
+        #              so the next update can be revalidated
+        if hasattr(provider, "fetch_many_conditional"):
+            responses = await provider.fetch_many_conditional(urns_parsed)
+            return [(response.external_data, response.validators) for response in responses]
+
+        # Providers with batch endpoints are implementing `fetch_many`
+        if hasattr(provider, "fetch_many"):
+            return [(external_data, None) for external_data in await provider.fetch_many(urns_parsed)]
+
+        if hasattr(provider, "fetch_conditional"):
+            responses = [await provider.fetch_conditional(urn_parsed, None) for urn_parsed in urns_parsed]
+            return [(response.external_data, response.validators) for response in responses]
+
+        return [(await provider.fetch(urn_parsed), None) for urn_parsed in urns_parsed]
+
+    async def __save_external_data(self,
+                                   external_data: ExternalData,
+                                   cursor: aiomysql.Cursor) -> None:
+        external_data_dictionary = dataclasses.asdict(external_data.external_data)
+        external_data_json = ujson.dumps(
+            external_data_dictionary,
+            ensure_ascii=False,
+            encode_html_chars=True,
+            escape_forward_slashes=True
+        )
+
+        validator_etag, validator_last_modified = None, None
+
+        if external_data.validators:
+            validator_etag = external_data.validators.validator_etag
+            validator_last_modified = external_data.validators.validator_last_modified
+
+        query_arguments = [external_data.urn_string, external_data_json, validator_etag, validator_last_modified]
+        await cursor.execute(self.ADD_OR_UPDATE_EXTERNAL_DATA_SQL, query_arguments + query_arguments)
+
+    async def __revalidate_using_provider(self,
+                                          provider_name: str,
+                                          cached_external_data: ExternalData,
+                                          cursor: aiomysql.Cursor) -> ExternalData | None:
+        response = await self.__providers[provider_name]["class_instance"].fetch_conditional(
+            cached_external_data.urn_parsed,
+            cached_external_data.validators
+        )
+
+        if response.is_not_modified:
+            # Nothing was changed, only the freshness of the data is updated
+            await cursor.execute(self.TOUCH_EXTERNAL_DATA_SQL, [cached_external_data.urn_string])
+            return cached_external_data
+
+        if not response.external_data:
+            return None
+
+        external_data = ExternalData(
+            urn_string=cached_external_data.urn_string,
+            urn_parsed=cached_external_data.urn_parsed,
+            external_data=response.external_data,
+            validators=response.validators
+        )
+
+        await self.__save_external_data(external_data, cursor)
+        return external_data
+
     async def __get_dictionary_using_providers(self,
                                                urns: list[str],
-                                               cursor: aiomysql.Cursor) -> dict[str, ExternalData]:
+                                               cursor: aiomysql.Cursor,
+                                               cached_data: dict[str, ExternalData] | None = None) -> dict[str, ExternalData]:
+        cached_data = cached_data or {}
+
         result = {urn: None for urn in urns}
         result_count = 0
 
+        pending_urns = {}
+
         for urn in urns:
             urn_parsed = self.__parse_urn(urn)
 
             if urn_parsed.urn_provider not in self.__providers:
-                result[urn] = None
                 continue
 
             if urn_parsed.urn_object not in self.__providers[
                 urn_parsed.urn_provider
             ]["avaliable_objects"].keys():
-                result[urn] = None
                 continue
 
-            external_data = await self.__providers[
-                urn_parsed.urn_provider
-            ]["class_instance"].fetch(urn_parsed)
-
-            external_data_dictionary = dataclasses.asdict(external_data)
-            external_data_json = ujson.dumps(
-                external_data_dictionary,
-                ensure_ascii=False,
-                encode_html_chars=True,
-                escape_forward_slashes=True
-            )
+            provider = self.__providers[urn_parsed.urn_provider]["class_instance"]
+            cached_external_data = cached_data.get(urn)
+
+            # Cached data with validators can be revalidated using the conditional request
+            if cached_external_data and cached_external_data.validators and \
+                    hasattr(provider, "fetch_conditional"):
+                result[urn] = await self.__revalidate_using_provider(urn_parsed.urn_provider,
+                                                                     cached_external_data,
+                                                                     cursor)
+                result_count += int(result[urn] is not None)
+                continue
 
-            query_arguments = [urn, external_data_json, urn, external_data_json]
-            await cursor.execute(self.ADD_OR_UPDATE_EXTERNAL_DATA_SQL, query_arguments)
+            pending_urns.setdefault(urn_parsed.urn_provider, []).append((urn, urn_parsed))
 
-            result[urn] = ExternalData(
-                urn_string=urn,
-                urn_parsed=urn_parsed,
-                external_data=external_data
+        for provider_name, provider_urns in pending_urns.items():
+            external_data_list = await self.__fetch_using_provider(
+                provider_name,
+                [urn_parsed for urn, urn_parsed in provider_urns]
             )
-            result_count += 1
+
+            for (urn, urn_parsed), (external_data, validators) in zip(provider_urns, external_data_list):
+                if not external_data:
+                    continue
+
+                result[urn] = ExternalData(
+                    urn_string=urn,
+                    urn_parsed=urn_parsed,
+                    external_data=external_data,
+                    validators=validators
+                )
+
+                await self.__save_external_data(result[urn], cursor)
+                result_count += 1
 
         self.__logger.info(f"__get_dictionary_using_providers(urns={urns}, cursor={cursor}): Got {result_count} results")
         return result
@@ -242,13 +359,14 @@ class ExternalDataManager:
 
         async with self.__database_pool.acquire() as connection:
             async with connection.cursor() as cursor:
+                cached_data = await self.__get_dictionary_using_cached_data(urns, cursor)
                 result = {}
 
                 if not force_update:
-                    result = await self.__get_dictionary_using_cached_data(urns, cursor)
-                    urns = list(filter(lambda urn: not result[urn], urns))
+                    result = cached_data
+                    urns = list(filter(lambda urn: not result.get(urn), urns))
 
-                result.update(await self.__get_dictionary_using_providers(urns, cursor))
+                result.update(await self.__get_dictionary_using_providers(urns, cursor, cached_data))
                 await connection.commit()
 
                 self.__logger.info(f"get_external_data(urns={urns}, force_update={force_update}): Got {len(result)} results")
@@ -285,9 +403,10 @@ class ExternalDataManager:
             else: return None
 
         if parsed_url.host == "tmblr.co":
-            async with ClientSession() as session:
-                async with session.get(url, allow_redirects=False) as response:
-                    parsed_url = URL(response.headers["location"])
+            session = await self.__http_client.get_session()
+
+            async with session.get(url, allow_redirects=False) as response:
+                parsed_url = URL(response.headers["location"])
 
         if parsed_url.host.endswith("tumblr.com"):
             is_blog_name_in_hostname = parsed_url.host != "tumblr.com"
@@ -311,3 +430,12 @@ class ExternalDataManager:
                 return f"urn:pixiv:user:{parsed_url.parts[-1]}"
 
         return None
+
+    async def close(self) -> None:
+        """Close the providers which are having the background tasks."""
+
+        for provider_name, provider in self.__providers.items():
+            if hasattr(provider["class_instance"], "close"):
+                await provider["class_instance"].close()
+
+                self.__logger.info(f"close(): Closed provider {provider_name}")
@@ -0,0 +1,247 @@
+from core.models import ImageType, ImageFormat, EncodingProfile, EncodedImage
+
+from PIL import Image
+from io import BytesIO
+
+import hashlib
+import mmap
+
+BLACK_COLOR = (0, 0, 0)
+
+# Pillow reduces the image by an integer factor with `reduce()` before the resampling,
+# while the image is at least `RESIZE_REDUCING_GAP` times larger than the target
+RESIZE_RESAMPLING_FILTER = Image.Resampling.LANCZOS
+RESIZE_REDUCING_GAP = 2.0
+
+# NOTE(synzr): functions of this module are executed in the process pool,
+#              so they're receiving the raw bytes (or the file path) and returning the encoded images only
+
+
+def _get_target_size(size: tuple[int, int], maximum_height: int) -> tuple[int, int]:
+    width, height = size
+
+    if height <= maximum_height:
+        return size
+
+    aspect_ratio = height / width
+    return max(int(maximum_height // aspect_ratio), 1), maximum_height
+
+
+def _flatten_image(image: Image.Image) -> Image.Image:
+    has_transparency = image.mode in ("RGBA", "LA", "PA") or \
+        (image.mode == "P" and "transparency" in image.info)
+
+    if has_transparency:
+        image = image.convert("RGBA")
+
+        background_image = Image.new("RGBA", image.size, BLACK_COLOR + (255,))
+        image = Image.alpha_composite(background_image, image)
+
+    return image.convert("RGB")
+
+
+def _decode_image(source_image: Image.Image, maximum_height: int) -> Image.Image:
+    # JPEG can be decoded at 1/2, 1/4 or 1/8 scale directly,
+    # the result is never smaller than the requested size
+    if source_image.format == "JPEG":
+        source_image.draft("RGB", _get_target_size(source_image.size, maximum_height))
+
+    return _flatten_image(source_image)
+
+
+def _decode_image_from_source(source: bytes | bytearray | str, maximum_height: int) -> Image.Image:
+    if not isinstance(source, str):
+        return _decode_image(Image.open(BytesIO(source)), maximum_height)
+
+    # Large images are spilled to the disk, they're mapped instead of reading to memory
+    with open(source, "rb") as source_file:
+        with mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as source_mapping:
+            return _decode_image(Image.open(source_mapping), maximum_height)
+
+
+class _HashingWriter:
+    """Writer which hashes the encoder output and splits it to the upload parts."""
+
+    def __init__(self, part_size: int) -> None:
+        """Class constructor.
+
+        Args:
+            part_size (int): Size of the upload part.
+        """
+
+        self.__part_size = part_size
+
+        self.__parts = []
+        self.__part_digests = []
+
+        self.__part = bytearray()
+        self.__part_hash = hashlib.md5(usedforsecurity=False)
+        self.__hash = hashlib.md5(usedforsecurity=False)
+
+        self.__size = 0
+
+    def __finish_part(self) -> None:
+        self.__parts.append(self.__part)
+        self.__part_digests.append(self.__part_hash.digest())
+
+        self.__part = bytearray()
+        self.__part_hash = hashlib.md5(usedforsecurity=False)
+
+    def write(self, data: bytes) -> int:
+        """Write the encoded data.
+
+        Args:
+            data (bytes): Encoded data.
+
+        Returns:
+            int: Count of the written bytes.
+        """
+
+        data_view = memoryview(data).cast("B")
+
+        self.__hash.update(data_view)
+        self.__size += len(data_view)
+
+        # The data is sliced without copying, it's copied only to the part buffer
+        while data_view:
+            part_free_size = self.__part_size - len(self.__part)
+            part_chunk, data_view = data_view[:part_free_size], data_view[part_free_size:]
+
+            self.__part += part_chunk
+            self.__part_hash.update(part_chunk)
+
+            if len(self.__part) == self.__part_size:
+                self.__finish_part()
+
+        return len(data)
+
+    def flush(self) -> None:
+        """Flush the writer (nothing to do)."""
+
+    def tell(self) -> int:
+        """Get the count of the written bytes.
+
+        Returns:
+            int: Count of the written bytes.
+        """
+
+        return self.__size
+
+    def get_encoded_image(self) -> EncodedImage:
+        """Get the encoded image.
+
+        Returns:
+            EncodedImage: Encoded image.
+        """
+
+        if self.__part or not self.__parts:
+            self.__finish_part()
+
+        return EncodedImage(image_parts=self.__parts,
+                            image_part_digests=self.__part_digests,
+                            image_digest=self.__hash.digest(),
+                            image_size=self.__size)
+
+
+def _save_image(image: Image.Image, image_format: ImageFormat,
+                encoding_profile: EncodingProfile, quality: int, part_size: int) -> EncodedImage:
+    save_options = {"quality": quality}
+
+    if image_format == ImageFormat.JPEG:
+        save_options["progressive"] = encoding_profile.progressive
+        save_options["optimize"] = encoding_profile.optimize
+
+    image_writer = _HashingWriter(part_size)
+    image.save(image_writer, format=image_format.value, **save_options)
+
+    return image_writer.get_encoded_image()
+
+
+def _encode_image(image: Image.Image, image_format: ImageFormat,
+                  encoding_profile: EncodingProfile, part_size: int) -> EncodedImage:
+    image_contents = _save_image(image, image_format, encoding_profile, encoding_profile.maximum_quality, part_size)
+
+    # Most of the images are fitting the budget at the maximum quality, so it's a single pass
+    if encoding_profile.target_size is None or image_contents.image_size <= encoding_profile.target_size:
+        return image_contents
+
+    # Binary search of the highest quality which fits the budget,
+    # the smallest result (at the minimum quality) is used when nothing fits
+    fitting_contents = None
+    smallest_contents = image_contents
+
+    minimum_quality, maximum_quality = encoding_profile.minimum_quality, encoding_profile.maximum_quality - 1
+
+    while minimum_quality <= maximum_quality:
+        quality = (minimum_quality + maximum_quality) // 2
+        image_contents = _save_image(image, image_format, encoding_profile, quality, part_size)
+
+        if image_contents.image_size <= encoding_profile.target_size:
+            fitting_contents = image_contents
+            minimum_quality = quality + 1
+        else:
+            smallest_contents = image_contents
+            maximum_quality = quality - 1
+
+    return fitting_contents if fitting_contents is not None else smallest_contents
+
+
+def is_format_supported(image_format: ImageFormat) -> bool:
+    """Check the support of the output format by Pillow.
+
+    Args:
+        image_format (ImageFormat): Image format.
+
+    Returns:
+        bool: Is the format supported?
+    """
+
+    Image.init()
+    return image_format.value.upper() in Image.SAVE
+
+
+def process_image(source: bytes | bytearray | str,
+                  image_settings: dict[ImageType, dict],
+                  part_size: int) -> dict[ImageType, dict[ImageFormat, EncodedImage]]:
+    """Decode the image once and encode the derivatives for each image type.
+
+    The source is decoded at the smallest resolution which covers the largest
+    image type, and each smaller derivative is produced from the previous one.
+    Each derivative is encoded in every output format, with the quality
+    searched to fit the byte budget of the encoding profile. The output is
+    hashed and split to the upload parts while it's encoded.
+
+    Args:
+        source (bytes | bytearray | str): Source image contents or path to the source image file.
+        image_settings (dict[ImageType, dict]): Settings of the needed image types.
+        part_size (int): Size of the upload part.
+
+    Returns:
+        dict[ImageType, dict[ImageFormat, EncodedImage]]: Processed images by the format.
+    """
+
+    image_types = sorted(image_settings,
+                         key=lambda image_type: image_settings[image_type]["maximum_height"],
+                         reverse=True)
+
+    largest_maximum_height = image_settings[image_types[0]]["maximum_height"]
+    processed_image = _decode_image_from_source(source, largest_maximum_height)
+
+    processed_images = {}
+
+    for image_type in image_types:
+        settings = image_settings[image_type]
+        target_size = _get_target_size(processed_image.size, settings["maximum_height"])
+
+        if target_size != processed_image.size:
+            processed_image = processed_image.resize(target_size,
+                                                     RESIZE_RESAMPLING_FILTER,
+                                                     reducing_gap=RESIZE_REDUCING_GAP)
+
+        processed_images[image_type] = {}
+
+        for image_format, encoding_profile in settings["output_formats"].items():
+            processed_images[image_type][image_format] = _encode_image(processed_image, image_format,
+                                                                       encoding_profile, part_size)
+
+    return processed_images
@@ -0,0 +1,220 @@
+from core.models import (
+    Content,
+    ExternalData,
+    IngestMetrics,
+    IngestRequest,
+    IngestSettings,
+    LatencyMetrics,
+    PivixArtwork,
+    TumblrPost,
+    TwitterTweet
+)
+
+from .content import ContentManager
+from .external_data import ExternalDataManager
+from .ingest_queue import IngestQueueManager
+
+import asyncio
+import logging
+import time
+
+
+class IngestManager:
+    """Ingest manager (in-process work queue of the submissions)."""
+
+    def __init__(self,
+                 ingest_settings: IngestSettings,
+                 external_data_manager: ExternalDataManager,
+                 content_manager: ContentManager,
+                 ingest_queue_manager: IngestQueueManager | None = None) -> None:
+        """Class constructor.
+
+        Args:
+            ingest_settings (IngestSettings): Ingest settings.
+            external_data_manager (ExternalDataManager): External data manager.
+            content_manager (ContentManager): Content manager.
+            ingest_queue_manager (IngestQueueManager | None, optional): Durable ingest queue
+                (requests are only saved to it, if it's set).
+        """
+
+        self.__ingest_settings = ingest_settings
+        self.__external_data_manager = external_data_manager
+        self.__content_manager = content_manager
+        self.__ingest_queue_manager = ingest_queue_manager
+
+        self.__request_queue = None
+        self.__worker_tasks = []
+
+        self.__queue_maximum_depth = 0
+        self.__processed_count = 0
+        self.__failed_count = 0
+
+        self.__wait_metrics = LatencyMetrics()
+        self.__processing_metrics = LatencyMetrics()
+
+        self.__logger = logging.getLogger("core.managers.ingest")
+
+    def __get_contents_of_external_data(self,
+                                        ingest_request: IngestRequest,
+                                        external_data: ExternalData) -> list[Content]:
+        data = external_data.external_data
+
+        # NOTE(synzr): only the posts are having the media, users and blogs are skipped
+        if isinstance(data, TwitterTweet):
+            media_urls = data.tweet_image_urls
+            origin_urn = f"urn:twitter:user:{data.tweet_author_screen_name}"
+        elif isinstance(data, TumblrPost):
+            media_urls = data.post_images
+            origin_urn = f"urn:tumblr:blog:{data.blog_name}"
+        elif isinstance(data, PivixArtwork):
+            media_urls = [data.artwork_hq_image_url]
+            origin_urn = f"urn:pixiv:user:{data.artwork_author_id}"
+        else:
+            return []
+
+        return [Content(content_id=None,
+                        content_submission_urn=ingest_request.request_submission_urn,
+                        content_source_urn=external_data.urn_string,
+                        content_origin_urn=origin_urn,
+                        content_media_url=media_url,
+                        content_thumbnail_url=None,
+                        content_media_variants=None,
+                        content_source_media_url=None,
+                        content_tags=list(ingest_request.request_tags),
+                        content_submitted_at=None)
+                for media_url in media_urls]
+
+    async def __run_worker(self, worker_index: int) -> None:
+        while True:
+            ingest_request = await self.__request_queue.get()
+            started_at = time.monotonic()
+
+            self.__wait_metrics.record(started_at - ingest_request.request_enqueued_at)
+
+            try:
+                added_count = await self.process_request(ingest_request)
+                self.__processed_count += 1
+
+                self.__logger.info(f"__run_worker(worker_index={worker_index}): Added {added_count} contents of {ingest_request.request_submission_urn} "
+                                   f"(queue depth {self.__request_queue.qsize()})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.__failed_count += 1
+                self.__logger.error(f"__run_worker(worker_index={worker_index}): Failed to ingest {ingest_request.request_submission_urn}: {error}")
+            finally:
+                self.__processing_metrics.record(time.monotonic() - started_at)
+                self.__request_queue.task_done()
+
+    async def resolve_urns(self, urls: list[str]) -> list[str]:
+        """Resolve the URNs of the URLs concurrently (the short links are doing the HTTP requests).
+
+        Args:
+            urls (list[str]): URLs.
+
+        Returns:
+            list[str]: Unique URNs (unresolved URLs are skipped).
+        """
+
+        results = await asyncio.gather(*[self.__external_data_manager.get_urn_from_url(url) for url in urls],
+                                       return_exceptions=True)
+        urns = []
+
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                self.__logger.warning(f"resolve_urns(urls={urls}): Failed to resolve {url}: {result}")
+            elif result and result not in urns:
+                urns.append(result)
+
+        return urns
+
+    async def process_request(self, ingest_request: IngestRequest) -> int:
+        """Ingest the contents of the submission.
+
+        Args:
+            ingest_request (IngestRequest): Ingest request.
+
+        Returns:
+            int: Count of added contents.
+        """
+
+        urns = ingest_request.request_urns
+
+        if urns is None:
+            urns = await self.resolve_urns(ingest_request.request_urls)
+
+        if not urns:
+            return 0
+
+        external_data = await self.__external_data_manager.get_external_data(urns)
+        contents = []
+
+        for urn in urns:
+            if external_data.get(urn):
+                contents.extend(self.__get_contents_of_external_data(ingest_request, external_data[urn]))
+
+        if not contents:
+            return 0
+
+        return await self.__content_manager.add_contents(contents, process_media=True)
+
+    def start(self) -> None:
+        """Start the workers (should be called inside of the event loop)."""
+
+        # NOTE(synzr): durable requests are processed by the separate worker processes
+        if self.__ingest_queue_manager:
+            self.__logger.info("start(): Durable queue is enabled, requests are only enqueued")
+            return
+
+        self.__request_queue = asyncio.Queue(self.__ingest_settings.queue_maximum_size)
+        self.__worker_tasks = [asyncio.create_task(self.__run_worker(worker_index))
+                               for worker_index in range(self.__ingest_settings.worker_count)]
+
+        self.__logger.info(f"start(): Started {len(self.__worker_tasks)} workers")
+
+    async def enqueue(self, ingest_request: IngestRequest) -> None:
+        """Enqueue the ingest request, waiting for the free place in the queue.
+
+        Args:
+            ingest_request (IngestRequest): Ingest request.
+        """
+
+        if self.__ingest_queue_manager:
+            await self.__ingest_queue_manager.enqueue(ingest_request)
+            return
+
+        if self.__request_queue.full():
+            self.__logger.warning(f"enqueue(ingest_request={ingest_request}): Queue is full, waiting for the workers")
+
+        ingest_request.request_enqueued_at = time.monotonic()
+        await self.__request_queue.put(ingest_request)
+
+        self.__queue_maximum_depth = max(self.__queue_maximum_depth, self.__request_queue.qsize())
+
+    def get_metrics(self) -> IngestMetrics:
+        """Get the ingest metrics.
+
+        Returns:
+            IngestMetrics: Ingest metrics.
+        """
+
+        return IngestMetrics(metrics_queue_depth=self.__request_queue.qsize() if self.__request_queue else 0,
+                             metrics_queue_maximum_depth=self.__queue_maximum_depth,
+                             metrics_processed_count=self.__processed_count,
+                             metrics_failed_count=self.__failed_count,
+                             metrics_wait_average_seconds=self.__wait_metrics.metrics_average_seconds,
+                             metrics_processing_average_seconds=self.__processing_metrics.metrics_average_seconds)
+
+    async def close(self) -> None:
+        """Stop the workers."""
+
+        for worker_task in self.__worker_tasks:
+            worker_task.cancel()
+
+        await asyncio.gather(*self.__worker_tasks, return_exceptions=True)
+
+        # NOTE(synzr): the queue is in-process, so the queued requests are lost on shutdown
+        if self.__request_queue and not self.__request_queue.empty():
+            self.__logger.warning(f"close(): Dropped {self.__request_queue.qsize()} queued requests")
+
+        self.__worker_tasks = []
@@ -0,0 +1,286 @@
+from core.models import (
+    DatabaseConnectionSettings,
+    IngestJob,
+    IngestRequest,
+    IngestSettings
+)
+
+import aiomysql
+import asyncio
+
+import random
+import ujson
+import logging
+
+
+class IngestQueueManager:
+    """Ingest queue manager (durable job queue in the database)."""
+
+    # NOTE(synzr): the lease is the availability time moved forward, so the job
+    #              of the crashed worker is claimed again when the lease expires
+    ADD_INGEST_JOB_SQL = """
+        INSERT
+        INTO `ingest_jobs` (
+            `ingest_jobs`.`ingest_job_submission_urn`,
+            `ingest_jobs`.`ingest_job_urls`,
+            `ingest_jobs`.`ingest_job_tags`
+        )
+        VALUES (%s, %s, %s);
+    """
+
+    GET_AVAILABLE_INGEST_JOBS_SQL = """
+        SELECT
+            `ingest_jobs`.`ingest_job_id`,
+            `ingest_jobs`.`ingest_job_submission_urn`,
+            `ingest_jobs`.`ingest_job_urls`,
+            `ingest_jobs`.`ingest_job_tags`,
+            `ingest_jobs`.`ingest_job_attempts`
+        FROM `ingest_jobs`
+        WHERE `ingest_jobs`.`ingest_job_failed_at` IS NULL
+        AND `ingest_jobs`.`ingest_job_available_at` <= CURRENT_TIMESTAMP
+        AND `ingest_jobs`.`ingest_job_attempts` < %s
+        ORDER BY `ingest_jobs`.`ingest_job_available_at` ASC
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED;
+    """
+
+    LEASE_INGEST_JOBS_SQL = """
+        UPDATE `ingest_jobs`
+        SET
+            `ingest_jobs`.`ingest_job_lease_owner` = %s,
+            `ingest_jobs`.`ingest_job_available_at` = CURRENT_TIMESTAMP + INTERVAL %s SECOND,
+            `ingest_jobs`.`ingest_job_attempts` = `ingest_jobs`.`ingest_job_attempts` + 1
+        WHERE `ingest_jobs`.`ingest_job_id` IN ({ingest_job_ids});
+    """
+
+    RENEW_INGEST_JOB_LEASES_SQL = """
+        UPDATE `ingest_jobs`
+        SET `ingest_jobs`.`ingest_job_available_at` = CURRENT_TIMESTAMP + INTERVAL %s SECOND
+        WHERE `ingest_jobs`.`ingest_job_lease_owner` = %s
+        AND `ingest_jobs`.`ingest_job_id` IN ({ingest_job_ids});
+    """
+
+    DELETE_INGEST_JOB_SQL = """
+        DELETE
+        FROM `ingest_jobs`
+        WHERE `ingest_jobs`.`ingest_job_id` = %s
+        AND `ingest_jobs`.`ingest_job_lease_owner` = %s;
+    """
+
+    RETRY_INGEST_JOB_SQL = """
+        UPDATE `ingest_jobs`
+        SET
+            `ingest_jobs`.`ingest_job_lease_owner` = NULL,
+            `ingest_jobs`.`ingest_job_available_at` = CURRENT_TIMESTAMP + INTERVAL %s SECOND,
+            `ingest_jobs`.`ingest_job_last_error` = %s
+        WHERE `ingest_jobs`.`ingest_job_id` = %s
+        AND `ingest_jobs`.`ingest_job_lease_owner` = %s;
+    """
+
+    FAIL_INGEST_JOB_SQL = """
+        UPDATE `ingest_jobs`
+        SET
+            `ingest_jobs`.`ingest_job_lease_owner` = NULL,
+            `ingest_jobs`.`ingest_job_failed_at` = CURRENT_TIMESTAMP,
+            `ingest_jobs`.`ingest_job_last_error` = %s
+        WHERE `ingest_jobs`.`ingest_job_id` = %s
+        AND `ingest_jobs`.`ingest_job_lease_owner` = %s;
+    """
+
+    FAIL_EXHAUSTED_INGEST_JOBS_SQL = """
+        UPDATE `ingest_jobs`
+        SET
+            `ingest_jobs`.`ingest_job_lease_owner` = NULL,
+            `ingest_jobs`.`ingest_job_failed_at` = CURRENT_TIMESTAMP,
+            `ingest_jobs`.`ingest_job_last_error` = 'Lease expired after the last attempt'
+        WHERE `ingest_jobs`.`ingest_job_failed_at` IS NULL
+        AND `ingest_jobs`.`ingest_job_available_at` <= CURRENT_TIMESTAMP
+        AND `ingest_jobs`.`ingest_job_attempts` >= %s;
+    """
+
+    RELEASE_INGEST_JOBS_SQL = """
+        UPDATE `ingest_jobs`
+        SET
+            `ingest_jobs`.`ingest_job_lease_owner` = NULL,
+            `ingest_jobs`.`ingest_job_available_at` = CURRENT_TIMESTAMP,
+            `ingest_jobs`.`ingest_job_attempts` = `ingest_jobs`.`ingest_job_attempts` - 1
+        WHERE `ingest_jobs`.`ingest_job_lease_owner` = %s;
+    """
+
+    def __init__(self,
+                 database_connection_settings: DatabaseConnectionSettings,
+                 ingest_settings: IngestSettings) -> None:
+        """Class constructor.
+
+        Args:
+            database_connection_settings (DatabaseConnectionSettings): Database connection settings.
+            ingest_settings (IngestSettings): Ingest settings.
+        """
+
+        self.__ingest_settings = ingest_settings
+        self.__logger = logging.getLogger("core.managers.ingest_queue")
+
+        asyncio.get_event_loop().run_until_complete(
+            self.__instantiate_pool(database_connection_settings))
+
+    async def __instantiate_pool(self,
+                                 database_connection_settings: DatabaseConnectionSettings) -> None:
+        """Instantiate the database pool.
+
+        Args:
+            database_connection_settings (DatabaseConnectionSettings): Database connection settings.
+        """
+
+        self.__database_pool = await aiomysql.create_pool(database_connection_settings.pool_minimum_size,
+                                                          database_connection_settings.pool_maximum_size,
+                                                          host=database_connection_settings.instance_hostname,
+                                                          port=database_connection_settings.instance_port,
+                                                          user=database_connection_settings.credentials_username,
+                                                          password=database_connection_settings.credentials_password,
+                                                          db=database_connection_settings.database_name,
+                                                          cursorclass=aiomysql.DictCursor)
+
+        self.__logger.info("__instantiate_pool(database_connection_settings=[redacted]): Instantiated an database pool")
+
+    def __get_retry_delay(self, job_attempts: int) -> int:
+        retry_delay = min(self.__ingest_settings.retry_base_delay * 2 ** (job_attempts - 1),
+                          self.__ingest_settings.retry_maximum_delay)
+
+        # Jitter is spreading the retries of the jobs failed at the same time
+        return max(1, round(retry_delay * random.uniform(0.5, 1.0)))
+
+    async def enqueue(self, ingest_request: IngestRequest) -> int:
+        """Add the ingest request to the queue.
+
+        Args:
+            ingest_request (IngestRequest): Ingest request.
+
+        Returns:
+            int: ID of the job.
+        """
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.ADD_INGEST_JOB_SQL, [ingest_request.request_submission_urn,
+                                                               ujson.dumps(ingest_request.request_urls),
+                                                               ujson.dumps(ingest_request.request_tags)])
+                await connection.commit()
+
+                self.__logger.info(f"enqueue(ingest_request={ingest_request}): Added job {cursor.lastrowid}")
+                return cursor.lastrowid
+
+    async def claim_jobs(self, lease_owner: str, job_count: int) -> list[IngestJob]:
+        """Claim the available jobs with the lease.
+
+        Args:
+            lease_owner (str): Name of the worker.
+            job_count (int): Maximum count of the claimed jobs.
+
+        Returns:
+            list[IngestJob]: Claimed jobs.
+        """
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                # NOTE(synzr): jobs which were killing the worker are not retried forever
+                #              after the lease expires, they're marked as failed instead
+                await cursor.execute(self.FAIL_EXHAUSTED_INGEST_JOBS_SQL, [self.__ingest_settings.maximum_attempts])
+
+                # Rows locked by the other workers are skipped, so the workers are not waiting for each other
+                await cursor.execute(self.GET_AVAILABLE_INGEST_JOBS_SQL, [self.__ingest_settings.maximum_attempts,
+                                                                          job_count])
+                rows = await cursor.fetchall()
+
+                if not rows:
+                    await connection.commit()
+                    return []
+
+                query = self.LEASE_INGEST_JOBS_SQL.format(ingest_job_ids=", ".join(["%s"] * len(rows)))
+                await cursor.execute(query, [lease_owner, self.__ingest_settings.lease_duration] +
+                                     [row["ingest_job_id"] for row in rows])
+                await connection.commit()
+
+        ingest_jobs = [IngestJob(job_id=row["ingest_job_id"],
+                                 job_request=IngestRequest(request_submission_urn=row["ingest_job_submission_urn"],
+                                                           request_urls=ujson.loads(row["ingest_job_urls"]),
+                                                           request_tags=ujson.loads(row["ingest_job_tags"])),
+                                 job_attempts=row["ingest_job_attempts"] + 1)
+                       for row in rows]
+
+        self.__logger.info(f"claim_jobs(lease_owner={lease_owner}, job_count={job_count}): Claimed {len(ingest_jobs)} jobs")
+        return ingest_jobs
+
+    async def renew_leases(self, lease_owner: str, job_ids: list[int]) -> None:
+        """Renew the leases of the jobs in progress.
+
+        Args:
+            lease_owner (str): Name of the worker.
+            job_ids (list[int]): IDs of the jobs.
+        """
+
+        if not job_ids:
+            return
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                query = self.RENEW_INGEST_JOB_LEASES_SQL.format(ingest_job_ids=", ".join(["%s"] * len(job_ids)))
+                await cursor.execute(query, [self.__ingest_settings.lease_duration, lease_owner] + job_ids)
+                await connection.commit()
+
+    async def complete_job(self, lease_owner: str, ingest_job: IngestJob) -> None:
+        """Remove the completed job from the queue.
+
+        Args:
+            lease_owner (str): Name of the worker.
+            ingest_job (IngestJob): Completed job.
+        """
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.DELETE_INGEST_JOB_SQL, [ingest_job.job_id, lease_owner])
+                await connection.commit()
+
+    async def fail_job(self, lease_owner: str, ingest_job: IngestJob, error: Exception) -> bool:
+        """Schedule the retry of the failed job (or mark it as failed after the last attempt).
+
+        Args:
+            lease_owner (str): Name of the worker.
+            ingest_job (IngestJob): Failed job.
+            error (Exception): Error of the job.
+
+        Returns:
+            bool: Job will be retried?
+        """
+
+        is_retried = ingest_job.job_attempts < self.__ingest_settings.maximum_attempts
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                if is_retried:
+                    retry_delay = self.__get_retry_delay(ingest_job.job_attempts)
+                    await cursor.execute(self.RETRY_INGEST_JOB_SQL, [retry_delay, repr(error),
+                                                                     ingest_job.job_id, lease_owner])
+
+                    self.__logger.warning(f"fail_job(lease_owner={lease_owner}, ingest_job={ingest_job.job_id}, error={error}): Retrying in {retry_delay}s")
+                else:
+                    await cursor.execute(self.FAIL_INGEST_JOB_SQL, [repr(error), ingest_job.job_id, lease_owner])
+
+                    self.__logger.error(f"fail_job(lease_owner={lease_owner}, ingest_job={ingest_job.job_id}, error={error}): Failed after {ingest_job.job_attempts} attempts")
+
+                await connection.commit()
+
+        return is_retried
+
+    async def release_jobs(self, lease_owner: str) -> None:
+        """Release the leased jobs of the stopped worker without spending their attempts.
+
+        Args:
+            lease_owner (str): Name of the worker.
+        """
+
+        async with self.__database_pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(self.RELEASE_INGEST_JOBS_SQL, [lease_owner])
+                await connection.commit()
+
+                self.__logger.info(f"release_jobs(lease_owner={lease_owner}): Released {cursor.rowcount} jobs")
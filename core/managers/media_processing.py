@@ -1,151 +1,623 @@
-from core.models import StorageConnectionSettings, ImageType
-from enum import Enum
-
-from aiohttp import ClientSession
-
-from PIL import Image
-from io import BytesIO
-
-from hashlib import md5
-
+from core.models import (
+    MediaProcessingSettings,
+    ExternalDataValidators,
+    DownloadedMedia,
+    EncodedImage,
+    ImageType,
+    ImageFormat,
+    EncodingProfile,
+    MediaSourceVariant,
+    MediaSourceProfile
+)
+from core.clients import HttpClient, StorageClient, SourceCache
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from hashlib import blake2b
+
+from aiohttp import ClientResponseError
 from fake_useragent import UserAgent
 from yarl import URL
 
-import aiobotocore.session
-import logging
-
-DOWNLOAD_CHUNK_SIZE = 4096
-BLACK_COLOR = (0, 0, 0)
+from .image_operations import process_image, is_format_supported
 
+import asyncio
+import dataclasses
+import functools
+import logging
+import os
+import re
+import tempfile
+import ujson
+
+# The chunk size grows while the connection fills the whole chunk
+DOWNLOAD_MINIMUM_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_MAXIMUM_CHUNK_SIZE = 1024 * 1024
+REVALIDATION_CACHE_SIZE = 4096
+STORED_OBJECT_INDEX_SIZE = 65536
+
+# NOTE(synzr): increase it when the output of `process_image` changes
+#              without the changes of the image settings
+IMAGE_PROCESSING_VERSION = 1
+STORAGE_OBJECT_HASH_SIZE = 16
+
+# NOTE(synzr): JPEG is the primary format, other formats are produced
+#              only when they're enabled in the media processing settings
 IMAGE_SETTINGS = {
     ImageType.MEDIA: {
         "maximum_height": 1024,
-        "jpeg_quality": 93,
-        "storage_directory_name": "media"
+        "storage_directory_name": "media",
+        "output_formats": {
+            ImageFormat.JPEG: EncodingProfile(target_size=400 * 1024,
+                                              minimum_quality=70,
+                                              maximum_quality=93,
+                                              progressive=True,
+                                              optimize=True),
+            ImageFormat.WEBP: EncodingProfile(target_size=300 * 1024,
+                                              minimum_quality=65,
+                                              maximum_quality=90),
+            ImageFormat.AVIF: EncodingProfile(target_size=200 * 1024,
+                                              minimum_quality=50,
+                                              maximum_quality=75)
+        }
     },
     ImageType.THUMBNAIL: {
         "maximum_height": 200,
-        "jpeg_quality": 46,
-        "storage_directory_name": "thumbnails"
+        "storage_directory_name": "thumbnails",
+        "output_formats": {
+            ImageFormat.JPEG: EncodingProfile(target_size=12 * 1024,
+                                              minimum_quality=30,
+                                              maximum_quality=60,
+                                              optimize=True),
+            ImageFormat.WEBP: EncodingProfile(target_size=10 * 1024,
+                                              minimum_quality=30,
+                                              maximum_quality=60),
+            ImageFormat.AVIF: EncodingProfile(target_size=8 * 1024,
+                                              minimum_quality=25,
+                                              maximum_quality=45)
+        }
     },
     ImageType.AVATAR: {
         "maximum_height": 200,
-        "jpeg_quality": 62,
-        "storage_directory_name": "avatars"
+        "storage_directory_name": "avatars",
+        "output_formats": {
+            ImageFormat.JPEG: EncodingProfile(target_size=16 * 1024,
+                                              minimum_quality=45,
+                                              maximum_quality=75,
+                                              optimize=True),
+            ImageFormat.WEBP: EncodingProfile(target_size=12 * 1024,
+                                              minimum_quality=45,
+                                              maximum_quality=75),
+            ImageFormat.AVIF: EncodingProfile(target_size=10 * 1024,
+                                              minimum_quality=35,
+                                              maximum_quality=55)
+        }
     }
 }
 
 
+TWITTER_MEDIA_PROFILE = MediaSourceProfile(
+    source_referer="https://twitter.com/",
+    source_url_pattern=re.compile(r"(?P<base>https://pbs\.twimg\.com/media/[\w-]+)\.(?P<extension>\w+)(?:\?.*)?"),
+    source_url_template="{base}?format={extension}&name={variant}",
+    source_variants=[
+        MediaSourceVariant(variant_width=680, variant_height=680, variant_name="small"),
+        MediaSourceVariant(variant_width=1200, variant_height=1200, variant_name="medium"),
+        MediaSourceVariant(variant_width=2048, variant_height=2048, variant_name="large"),
+        MediaSourceVariant(variant_width=None, variant_height=None, variant_name="orig")
+    ],
+    source_aspect_ratio=2.0
+)
+
+TWITTER_PROFILE_IMAGE_PROFILE = MediaSourceProfile(
+    source_referer="https://twitter.com/",
+    source_url_pattern=re.compile(r"(?P<base>https://pbs\.twimg\.com/profile_images/\d+/[^/]+?)"
+                                  r"(?P<variant>_normal|_bigger|_mini|_200x200|_400x400)?\.(?P<extension>\w+)"),
+    source_url_template="{base}{variant}.{extension}",
+    source_variants=[
+        MediaSourceVariant(variant_width=48, variant_height=48, variant_name="_normal"),
+        MediaSourceVariant(variant_width=73, variant_height=73, variant_name="_bigger"),
+        MediaSourceVariant(variant_width=200, variant_height=200, variant_name="_200x200"),
+        MediaSourceVariant(variant_width=400, variant_height=400, variant_name="_400x400"),
+        MediaSourceVariant(variant_width=None, variant_height=None, variant_name="")
+    ]
+)
+
+TUMBLR_MEDIA_PROFILE = MediaSourceProfile(
+    source_referer="https://tumblr.com/",
+    source_url_pattern=re.compile(r"(?P<base>https://64\.media\.tumblr\.com/.+/)(?P<variant>s\d+x\d+)(?P<path>/[^/]+)"),
+    source_url_template="{base}{variant}{path}",
+    source_variants=[
+        MediaSourceVariant(variant_width=250, variant_height=400, variant_name="s250x400"),
+        MediaSourceVariant(variant_width=400, variant_height=600, variant_name="s400x600"),
+        MediaSourceVariant(variant_width=500, variant_height=750, variant_name="s500x750"),
+        MediaSourceVariant(variant_width=640, variant_height=960, variant_name="s640x960"),
+        MediaSourceVariant(variant_width=1280, variant_height=1920, variant_name="s1280x1920"),
+        MediaSourceVariant(variant_width=2048, variant_height=3072, variant_name="s2048x3072")
+    ],
+    source_aspect_ratio=2.0
+)
+
+PIXIV_MEDIA_PROFILE = MediaSourceProfile(
+    source_referer="https://www.pixiv.net/",
+    source_url_pattern=re.compile(r"https://i\.pximg\.net/(?P<variant>c/\w+/)?(?P<path>img-master/.+)"),
+    source_url_template="https://i.pximg.net/{variant}{path}",
+    source_variants=[
+        MediaSourceVariant(variant_width=360, variant_height=360, variant_name="c/360x360_70/"),
+        MediaSourceVariant(variant_width=540, variant_height=540, variant_name="c/540x540_70/"),
+        MediaSourceVariant(variant_width=1200, variant_height=1200, variant_name="")
+    ],
+    source_aspect_ratio=2.0
+)
+
+# NOTE(synzr): the first profile which matches the URL is used
+MEDIA_SOURCE_PROFILES = {
+    "pbs.twimg.com": [TWITTER_MEDIA_PROFILE, TWITTER_PROFILE_IMAGE_PROFILE],
+    "64.media.tumblr.com": [TUMBLR_MEDIA_PROFILE],
+    "i.pximg.net": [PIXIV_MEDIA_PROFILE, MediaSourceProfile(source_referer="https://www.pixiv.net/")],
+    "s.pximg.net": [MediaSourceProfile(source_referer="https://www.pixiv.net/")]
+}
+
+
+class MediaTooLargeError(Exception):
+    """Media is larger than the maximum download size."""
+
+
 class MediaProcessingManager:
     """Media processing manager."""
 
-    # TODO(synzr): please create the content url model
-    #              with referrer field and use
-    #              instead of this hardcode
-    REFERRER_WEBSITES = {
-        "pbs.twimg.com": "https://twitter.com/",
-        "64.media.tumblr.com": "https://tumblr.com/",
-        "i.pximg.net": "https://www.pixiv.net/",
-        "s.pximg.net": "https://www.pixiv.net/"
-    }
-
     def __init__(self,
-                 storage_connection_settings: StorageConnectionSettings) -> None:
+                 media_processing_settings: MediaProcessingSettings,
+                 storage_client: StorageClient,
+                 http_client: HttpClient) -> None:
         """Class constructor.
 
         Args:
-            storage_connection_settings (StorageConnectionSettings): Storage connection settings.
+            media_processing_settings (MediaProcessingSettings): Media processing settings.
+            storage_client (StorageClient): Shared storage client.
+            http_client (HttpClient): Shared HTTP client.
         """
 
-        self.__storage_connection_settings = storage_connection_settings
+        self.__storage_client = storage_client
+        self.__http_client = http_client
+
+        self.__media_processing_settings = media_processing_settings
+
+        # Pillow work is CPU-bound, so it's executed out of the event loop
+        self.__process_pool = ProcessPoolExecutor(media_processing_settings.process_pool_maximum_workers)
+        self.__processing_concurrency = media_processing_settings.process_pool_maximum_workers or os.cpu_count() or 1
+        self.__revalidation_cache = OrderedDict()
+        self.__stored_object_index = OrderedDict()
+        self.__source_cache = SourceCache(media_processing_settings.source_cache_directory,
+                                          media_processing_settings.source_cache_maximum_size) \
+            if media_processing_settings.source_cache_directory else None
         self.__user_agent = UserAgent().random
         self.__logger = logging.getLogger("core.managers.media_processing")
 
-    async def __download_image_to_memory(self, source_url: str) -> Image:
-        parsed_source_url = URL(source_url)
+        # JPEG is always produced, the other formats are the optional variants
+        self.__output_formats = self.__get_output_formats(media_processing_settings.output_formats)
+
+    def __get_output_formats(self, image_formats: list[ImageFormat]) -> list[ImageFormat]:
+        output_formats = [ImageFormat.JPEG]
+
+        for image_format in image_formats:
+            if image_format in output_formats:
+                continue
+
+            # AVIF encoder is optional in the Pillow builds
+            if not is_format_supported(image_format):
+                self.__logger.warning(f"__get_output_formats(image_formats={image_formats}): {image_format.value} is not supported by Pillow, skipping")
+                continue
+
+            output_formats.append(image_format)
+
+        return output_formats
+
+    def __get_source_profile(self, source_url: str) -> tuple[MediaSourceProfile | None, re.Match | None]:
+        for source_profile in MEDIA_SOURCE_PROFILES.get(URL(source_url).host, []):
+            if not source_profile.source_url_pattern:
+                return source_profile, None
+
+            if source_url_match := source_profile.source_url_pattern.fullmatch(source_url):
+                return source_profile, source_url_match
+
+        return None, None
+
+    def __get_source_variant_url(self, source_url: str, image_types: list[ImageType]) -> str:
+        source_profile, source_url_match = self.__get_source_profile(source_url)
+
+        if not source_url_match:
+            return source_url
+
+        # The smallest variant which covers the largest image type is used,
+        # the largest one is used when nothing covers it
+        target_height = max(IMAGE_SETTINGS[image_type]["maximum_height"] for image_type in image_types)
+        target_width = target_height * source_profile.source_aspect_ratio
+
+        source_variant = source_profile.source_variants[-1]
+
+        for variant in source_profile.source_variants:
+            if (variant.variant_width is None or variant.variant_width >= target_width) and \
+               (variant.variant_height is None or variant.variant_height >= target_height):
+                source_variant = variant
+                break
+
+        return source_profile.source_url_template.format(**{**source_url_match.groupdict(),
+                                                            "variant": source_variant.variant_name})
+
+    def __create_spill_file(self):
+        return tempfile.NamedTemporaryFile(dir=self.__media_processing_settings.download_spill_directory,
+                                           prefix="torobooru-", suffix=".download", delete=False)
+
+    def __remove_spill_file(self, file_path: str) -> None:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    async def __download_image(self,
+                               source_url: str,
+                               spilled_file_paths: list[str],
+                               validators: ExternalDataValidators | None = None) \
+                                   -> tuple[DownloadedMedia | None, ExternalDataValidators | None]:
         headers = {"user-agent": self.__user_agent}
+        headers.update(self.__http_client.get_conditional_headers(validators))
+
+        source_profile, _ = self.__get_source_profile(source_url)
+
+        if source_profile and source_profile.source_referer:
+            headers["referer"] = source_profile.source_referer
+
+        maximum_size = self.__media_processing_settings.download_maximum_size
+        spill_threshold = self.__media_processing_settings.download_spill_threshold
+
+        session = await self.__http_client.get_session()
+
+        async with session.get(source_url, headers=headers) as image_response:
+            if image_response.status == 304:
+                self.__logger.info(f"__download_image(source_url={source_url}): Image was not modified")
+                return None, validators
+
+            image_response.raise_for_status()
+
+            content_length = image_response.content_length
 
-        if parsed_source_url.host in self.REFERRER_WEBSITES:
-            headers["referrer"] = self.REFERRER_WEBSITES[parsed_source_url.host]
+            if content_length and content_length > maximum_size:
+                raise MediaTooLargeError(f"{source_url} is larger than {maximum_size} bytes ({content_length} bytes)")
 
-        async with ClientSession(headers=headers) as session:
-            async with session.get(source_url) as image_response:
-                image_contents = BytesIO()
+            image_hash = blake2b()
+            image_size = 0
+            image_file = None
 
-                async for chunk in image_response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
-                    image_contents.write(chunk)
+            # The buffer is allocated once when the size is known
+            image_contents = bytearray(content_length or 0)
 
-                self.__logger.info(f"__download_image_to_memory(source_url={source_url}): Downloaded image to memory, image size: {len(image_contents.getvalue())}")
-                return Image.open(image_contents)
+            # NOTE(synzr): the temporary file is removed by the caller,
+            #              so it's remembered before any data is written
+            if content_length and content_length > spill_threshold:
+                image_file = self.__create_spill_file()
+                spilled_file_paths.append(image_file.name)
 
-    def __process_image(self, source_image: Image, destination_image_type: ImageType) -> Image:
-        destination_image = source_image
+                image_contents = None
 
-        if destination_image.mode[-1] == "A":
-            background_image = Image.new(destination_image.mode, destination_image.size, BLACK_COLOR)
-            destination_image = Image.alpha_composite(source_image, background_image).convert(destination_image.mode[:-1])
+            chunk_size = DOWNLOAD_MINIMUM_CHUNK_SIZE
 
-        maximum_height = IMAGE_SETTINGS[destination_image_type]["maximum_height"]
+            try:
+                while chunk := await image_response.content.read(chunk_size):
+                    image_size += len(chunk)
 
-        if destination_image.size[1] > maximum_height:
-            destination_image_aspect_ratio = destination_image.size[1] / destination_image.size[0]
+                    if image_size > maximum_size:
+                        raise MediaTooLargeError(f"{source_url} is larger than {maximum_size} bytes")
 
-            destination_image_size = int(maximum_height // destination_image_aspect_ratio), maximum_height
-            destination_image = destination_image.resize(destination_image_size)
+                    image_hash.update(chunk)
 
-        return destination_image.convert("RGB")
+                    if not image_file and image_size > spill_threshold:
+                        image_file = self.__create_spill_file()
+                        spilled_file_paths.append(image_file.name)
 
-    async def __upload_image_to_storage(self, image: Image, image_type: ImageType) -> str:
-        session = aiobotocore.session.get_session()
-        image_contents = BytesIO()
+                        image_file.write(memoryview(image_contents)[:image_size - len(chunk)])
+                        image_contents = None
 
-        jpeg_quality = IMAGE_SETTINGS[image_type]["jpeg_quality"]
-        image.save(image_contents, format="jpeg", quality=jpeg_quality)
+                    if image_file:
+                        image_file.write(chunk)
+                    else:
+                        image_contents[image_size - len(chunk):image_size] = chunk
 
-        image_contents.seek(0)
-        image_hash = md5(image_contents.getvalue()).hexdigest()
+                    if len(chunk) == chunk_size:
+                        chunk_size = min(chunk_size * 2, DOWNLOAD_MAXIMUM_CHUNK_SIZE)
+            finally:
+                if image_file: image_file.close()
 
-        image_contents.seek(0)
+            # The server could send less data than it's announced
+            if image_contents is not None:
+                del image_contents[image_size:]
 
-        async with session.create_client("s3",
-                                         region_name=self.__storage_connection_settings.instance_region_name,
-                                         endpoint_url=self.__storage_connection_settings.instance_url,
-                                         aws_access_key_id=self.__storage_connection_settings.credentials_access_key,
-                                         aws_secret_access_key=self.__storage_connection_settings.credentials_secret_access_key) as storage:
-            storage_directory_name = IMAGE_SETTINGS[image_type]["storage_directory_name"]
-            image_path = f"{storage_directory_name}/{image_hash}.jpeg"
+            downloaded_media = DownloadedMedia(media_contents=image_contents,
+                                               media_file_path=image_file.name if image_file else None,
+                                               media_size=image_size,
+                                               media_hash=image_hash.digest())
 
-            await storage.put_object(
-                Body=image_contents,
-                Bucket=self.__storage_connection_settings.bucket_name,
-                Key=image_path,
-                ContentType="image/jpeg"
-            )
+            self.__logger.info(f"__download_image(source_url={source_url}): Downloaded image to {'disk' if image_file else 'memory'}, image size: {image_size}")
+            return downloaded_media, self.__http_client.get_validators(image_response)
 
-            self.__logger.info(f"__upload_image_to_storage(image={image}, image_type={image_type}): Uploaded image ({image_path}) to storage")
-            return image_path
+    def __get_revalidation_entry(self,
+                                 image_url: str,
+                                 image_types: list[ImageType]) -> tuple[ExternalDataValidators, dict] | None:
+        revalidation_entry = self.__revalidation_cache.get(image_url)
+
+        if not revalidation_entry:
+            return None
+
+        validators, processed_image_paths = revalidation_entry
+
+        if any(image_type not in processed_image_paths or
+               any(image_format not in processed_image_paths[image_type] for image_format in self.__output_formats)
+               for image_type in image_types):
+            return None
+
+        self.__revalidation_cache.move_to_end(image_url)
+        return revalidation_entry
+
+    def __add_revalidation_entry(self,
+                                 image_url: str,
+                                 validators: ExternalDataValidators,
+                                 processed_image_paths: dict[ImageType, dict[ImageFormat, str]]) -> None:
+        self.__revalidation_cache[image_url] = (validators, processed_image_paths)
+        self.__revalidation_cache.move_to_end(image_url)
+
+        if len(self.__revalidation_cache) > REVALIDATION_CACHE_SIZE:
+            self.__revalidation_cache.popitem(last=False)
+
+    def __get_storage_path(self, source_hash: bytes, image_type: ImageType, image_format: ImageFormat) -> str:
+        image_settings = IMAGE_SETTINGS[image_type]
+
+        # The processing profile is a part of the key, so the changed settings produce the new objects
+        encoding_profile = dataclasses.asdict(image_settings["output_formats"][image_format])
+        processing_profile = ujson.dumps([IMAGE_PROCESSING_VERSION, image_settings["maximum_height"],
+                                          image_format.value, encoding_profile],
+                                         sort_keys=True)
+        object_hash = blake2b(source_hash + processing_profile.encode(),
+                              digest_size=STORAGE_OBJECT_HASH_SIZE).hexdigest()
+
+        return f"{image_settings['storage_directory_name']}/{object_hash}.{image_format.value}"
+
+    def __add_stored_object(self, image_path: str) -> None:
+        self.__stored_object_index[image_path] = True
+        self.__stored_object_index.move_to_end(image_path)
+
+        if len(self.__stored_object_index) > STORED_OBJECT_INDEX_SIZE:
+            self.__stored_object_index.popitem(last=False)
+
+    async def __is_stored_object(self, image_path: str) -> bool:
+        if image_path in self.__stored_object_index:
+            self.__stored_object_index.move_to_end(image_path)
+            return True
+
+        if not await self.__storage_client.is_object_exists(image_path):
+            return False
+
+        self.__add_stored_object(image_path)
+        return True
+
+    async def __process_image(self,
+                              image: DownloadedMedia,
+                              image_formats: dict[ImageType, list[ImageFormat]]) -> dict[ImageType, dict[ImageFormat, EncodedImage]]:
+        image_settings = {
+            image_type: {
+                "maximum_height": IMAGE_SETTINGS[image_type]["maximum_height"],
+                "output_formats": {image_format: IMAGE_SETTINGS[image_type]["output_formats"][image_format]
+                                   for image_format in image_formats[image_type]}
+            }
+            for image_type in image_formats
+        }
+
+        # Spilled images are passed by the path, so they're not copied to the process pool
+        image_source = image.media_file_path or image.media_contents
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__process_pool,
+            functools.partial(process_image, image_source, image_settings, self.__storage_client.multipart_part_size)
+        )
+
+    async def __upload_image_to_storage(self,
+                                        encoded_image: EncodedImage,
+                                        image_format: ImageFormat,
+                                        image_path: str) -> str:
+        await self.__storage_client.upload_encoded_object(image_path, encoded_image, f"image/{image_format.value}")
+        self.__add_stored_object(image_path)
+
+        self.__logger.info(f"__upload_image_to_storage(encoded_image=[{encoded_image.image_size} bytes], image_path={image_path}): Uploaded image to storage")
+        return image_path
+
+    async def __download_source(self,
+                                image_url: str,
+                                source_url: str,
+                                spilled_file_paths: list[str],
+                                validators: ExternalDataValidators | None) \
+                                    -> tuple[DownloadedMedia | None, ExternalDataValidators | None]:
+        # Reprocessing and retries are served from the local disk
+        if self.__source_cache and (cached_image := await self.__source_cache.get(source_url)):
+            image, image_validators = cached_image
+            spilled_file_paths.append(image.media_file_path)
+
+            self.__logger.info(f"__download_source(image_url={image_url}, source_url={source_url}): Image was found in the source cache")
+            return image, image_validators
+
+        try:
+            image, image_validators = await self.__download_image(source_url, spilled_file_paths, validators)
+        except ClientResponseError as error:
+            # Not every image has all of the variants, so the original URL is the fallback
+            if source_url == image_url or error.status not in (403, 404):
+                raise
+
+            self.__logger.warning(f"__download_source(image_url={image_url}, source_url={source_url}): Variant is not available, using the original URL")
+
+            source_url = image_url
+            image, image_validators = await self.__download_image(source_url, spilled_file_paths, validators)
+
+        if self.__source_cache and image:
+            await self.__source_cache.put(source_url, image, image_validators)
+
+        return image, image_validators
+
+    async def __download_stage(self,
+                               download_queue: asyncio.Queue,
+                               processing_queue: asyncio.Queue,
+                               processed_images: dict[str, dict[ImageType, dict[ImageFormat, str]]],
+                               source_validators: dict[str, ExternalDataValidators],
+                               spilled_file_paths: list[str]) -> None:
+        while not download_queue.empty():
+            image_url, image_types = download_queue.get_nowait()
+
+            revalidation_entry = self.__get_revalidation_entry(image_url, image_types)
+            validators = revalidation_entry[0] if revalidation_entry else None
+
+            source_url = self.__get_source_variant_url(image_url, image_types)
+            image, image_validators = await self.__download_source(image_url, source_url,
+                                                                   spilled_file_paths, validators)
+
+            # The source wasn't modified, so the previously uploaded images are still valid
+            if not image:
+                processed_images[image_url] = {image_type: revalidation_entry[1][image_type]
+                                               for image_type in image_types}
+                continue
+
+            processed_images[image_url] = {
+                image_type: {image_format: self.__get_storage_path(image.media_hash, image_type, image_format)
+                             for image_format in self.__output_formats}
+                for image_type in image_types
+            }
+
+            if image_validators:
+                source_validators[image_url] = image_validators
+
+            missing_image_formats = {}
+
+            for image_type, image_paths in processed_images[image_url].items():
+                for image_format, image_path in image_paths.items():
+                    if not await self.__is_stored_object(image_path):
+                        missing_image_formats.setdefault(image_type, []).append(image_format)
+
+            # Processing is skipped if all of the derivatives are already in the storage
+            if not missing_image_formats:
+                self.__logger.info(f"__download_stage(image_url={image_url}): Derivatives are already in the storage")
+
+                if image.media_file_path: self.__remove_spill_file(image.media_file_path)
+                continue
+
+            await processing_queue.put((image, missing_image_formats, processed_images[image_url]))
+
+    async def __processing_stage(self,
+                                 processing_queue: asyncio.Queue,
+                                 upload_queue: asyncio.Queue) -> None:
+        while (item := await processing_queue.get()) is not None:
+            image, image_formats, image_paths = item
+
+            try:
+                processed_image_contents = await self.__process_image(image, image_formats)
+            finally:
+                if image.media_file_path: self.__remove_spill_file(image.media_file_path)
+
+            for image_type, encoded_images in processed_image_contents.items():
+                for image_format, encoded_image in encoded_images.items():
+                    await upload_queue.put((encoded_image, image_format, image_paths[image_type][image_format]))
+
+    async def __upload_stage(self, upload_queue: asyncio.Queue) -> None:
+        while (item := await upload_queue.get()) is not None:
+            await self.__upload_image_to_storage(*item)
+
+    async def __stop_stages(self,
+                            download_workers: list[asyncio.Task],
+                            processing_queue: asyncio.Queue,
+                            processing_workers: list[asyncio.Task],
+                            upload_queue: asyncio.Queue,
+                            upload_workers: list[asyncio.Task]) -> None:
+        # Each stage is stopped after the previous one, `None` is the stop signal
+        await asyncio.gather(*download_workers)
+
+        for _ in processing_workers: await processing_queue.put(None)
+        await asyncio.gather(*processing_workers)
+
+        for _ in upload_workers: await upload_queue.put(None)
+        await asyncio.gather(*upload_workers)
 
     async def process_images_from_urls(self, image_urls: dict[str, list[ImageType]]) \
-        -> dict[str, dict[ImageType, str]]:
+        -> dict[str, dict[ImageType, dict[ImageFormat, str]]]:
         """Process image(s) from URL(s).
 
+        Downloads, processing and uploads are running concurrently
+        as the stages of the pipeline with bounded queues between them.
+        Large images are spilled to the disk instead of the memory.
+        Each image type is produced in all of the enabled output formats.
+
         Args:
             image_urls (dict[str, list[ImageType]]): Image URL(s) with needed image types.
 
         Returns:
-            dict[str, dict[ImageType, str]]: Processed images.
+            dict[str, dict[ImageType, dict[ImageFormat, str]]]: Storage paths of the processed images.
         """
 
         processed_images = {}
-
-        for image_url in image_urls:
-            image = await self.__download_image_to_memory(image_url)
-            processed_images[image_url] = {}
-
-            for image_type in image_urls[image_url]:
-                processed_image = self.__process_image(image, image_type)
-                processed_images[image_url][image_type] = \
-                    await self.__upload_image_to_storage(processed_image, image_type)
+        source_validators = {}
+        spilled_file_paths = []
+
+        download_queue = asyncio.Queue()
+        processing_queue = asyncio.Queue(self.__media_processing_settings.pipeline_queue_size)
+        upload_queue = asyncio.Queue(self.__media_processing_settings.pipeline_queue_size)
+
+        for image_url, image_types in image_urls.items():
+            download_queue.put_nowait((image_url, image_types))
+
+        download_worker_count = min(self.__media_processing_settings.download_concurrency, len(image_urls))
+
+        download_workers = [asyncio.create_task(self.__download_stage(download_queue, processing_queue,
+                                                                      processed_images, source_validators,
+                                                                      spilled_file_paths))
+                            for _ in range(max(download_worker_count, 1))]
+        processing_workers = [asyncio.create_task(self.__processing_stage(processing_queue, upload_queue))
+                              for _ in range(self.__processing_concurrency)]
+        upload_workers = [asyncio.create_task(self.__upload_stage(upload_queue))
+                          for _ in range(self.__media_processing_settings.upload_concurrency)]
+
+        workers = download_workers + processing_workers + upload_workers
+        stopper = asyncio.create_task(self.__stop_stages(download_workers,
+                                                         processing_queue, processing_workers,
+                                                         upload_queue, upload_workers))
+
+        try:
+            await asyncio.wait(workers + [stopper], return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # Stages are stopped if any of them failed (or the call was cancelled)
+            for task in workers + [stopper]:
+                if not task.done(): task.cancel()
+
+            # NOTE(synzr): cancel() only requests the cancellation, so the stages are
+            #              awaited before exception() is called (it raises InvalidStateError
+            #              on the pending task) and before their spill files are removed
+            await asyncio.gather(*workers, stopper, return_exceptions=True)
+
+            # Spilled images of the failed (or cancelled) stages are still on the disk
+            for file_path in spilled_file_paths:
+                self.__remove_spill_file(file_path)
+
+        for task in workers + [stopper]:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+
+        # Validators are remembered only when all of the derivatives were uploaded
+        for image_url, validators in source_validators.items():
+            self.__add_revalidation_entry(image_url, validators, processed_images[image_url])
 
         self.__logger.info(f"process_images_from_urls(image_urls={image_urls}): Processed {len(processed_images)} images")
         return processed_images
+
+    @property
+    def output_formats(self) -> list[ImageFormat]:
+        """Enabled output formats (JPEG is the first one)."""
+
+        return list(self.__output_formats)
+
+    def close(self) -> None:
+        """Shut down the process pool."""
+
+        self.__process_pool.shutdown(wait=False, cancel_futures=True)
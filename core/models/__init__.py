@@ -4,9 +4,19 @@ from .providers.tumblr import TumblrBlog, TumblrPost
 from .providers.twitter import TwitterUser, TwitterTweet
 from .settings.connection_settings import (
     StorageConnectionSettings,
-    DatabaseConnectionSettings
+    DatabaseConnectionSettings,
+    HttpConnectionSettings
 )
-from .settings.media import ImageType
+from .settings.media import (
+    ImageType,
+    ImageFormat,
+    EncodingProfile,
+    MediaSourceVariant,
+    MediaSourceProfile,
+    MediaProcessingSettings,
+    RenderServiceSettings
+)
+from .settings.ingest import IngestSettings
 from .settings.view import (
     ViewOrderType,
     ViewResult,
@@ -14,4 +24,13 @@ from .settings.view import (
     ViewTagType
 )
 from .datatypes.content import Content, ContentViewResult
-from .datatypes.external_data import URN, ExternalData
+from .datatypes.external_data import (
+    URN,
+    ExternalData,
+    ExternalDataValidators,
+    ConditionalFetchResult
+)
+from .datatypes.session import ProviderSession
+from .datatypes.metrics import LatencyMetrics, EventRateMetrics
+from .datatypes.media import DownloadedMedia, EncodedImage
+from .datatypes.ingest import IngestRequest, IngestMetrics, IngestJob
@@ -13,6 +13,8 @@ class Content:
     content_origin_urn: str
     content_media_url: str
     content_thumbnail_url: str | None
+    content_media_variants: str | dict[str, dict[str, str]] | None
+    content_source_media_url: str | None
     content_tags: str | list[str]
     content_submitted_at: datetime
 
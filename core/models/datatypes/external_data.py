@@ -11,6 +11,14 @@ class URN:
     urn_extra_fields: dict | None
 
 
+@dataclass
+class ExternalDataValidators:
+    """HTTP validators of the external data."""
+
+    validator_etag: str | None
+    validator_last_modified: str | None
+
+
 @dataclass
 class ExternalData:
     """External data."""
@@ -18,3 +26,13 @@ class ExternalData:
     urn_string: str
     urn_parsed: URN
     external_data: any
+    validators: ExternalDataValidators | None = None
+
+
+@dataclass
+class ConditionalFetchResult:
+    """Result of the conditional fetch."""
+
+    is_not_modified: bool
+    external_data: any
+    validators: ExternalDataValidators | None
@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class IngestRequest:
+    """Request to ingest the contents of the submission."""
+
+    request_submission_urn: str
+    request_urls: list[str]
+    request_tags: list[str]
+
+    # Already resolved URNs of the URLs (they're resolved by the ingest otherwise)
+    request_urns: list[str] | None = None
+
+    # NOTE(synzr): monotonic time, it's set by the ingest manager
+    request_enqueued_at: float = 0.0
+
+
+@dataclass
+class IngestMetrics:
+    """Ingest metrics."""
+
+    metrics_queue_depth: int
+    metrics_queue_maximum_depth: int
+
+    metrics_processed_count: int
+    metrics_failed_count: int
+
+    metrics_wait_average_seconds: float
+    metrics_processing_average_seconds: float
+
+
+@dataclass
+class IngestJob:
+    """Leased job of the durable ingest queue."""
+
+    job_id: int
+    job_request: IngestRequest
+    job_attempts: int
@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class DownloadedMedia:
+    """Downloaded media (in memory or spilled to the disk)."""
+
+    media_contents: bytes | bytearray | None
+    media_file_path: str | None
+
+    media_size: int
+    media_hash: bytes
+
+
+@dataclass
+class EncodedImage:
+    """Encoded image split to the upload parts."""
+
+    image_parts: list[bytearray]
+
+    # NOTE(synzr): MD5 digests are used for the `Content-MD5` header only
+    image_part_digests: list[bytes]
+    image_digest: bytes
+
+    image_size: int
@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+
+import time
+
+
+@dataclass
+class LatencyMetrics:
+    """Latency metrics."""
+
+    metrics_count: int = 0
+    metrics_total_seconds: float = 0.0
+    metrics_maximum_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record the latency of an operation.
+
+        Args:
+            seconds (float): Latency in seconds.
+        """
+
+        self.metrics_count += 1
+        self.metrics_total_seconds += seconds
+        self.metrics_maximum_seconds = max(self.metrics_maximum_seconds, seconds)
+
+    @property
+    def metrics_average_seconds(self) -> float:
+        """Average latency in seconds."""
+
+        return self.metrics_total_seconds / self.metrics_count if self.metrics_count else 0.0
+
+
+@dataclass
+class EventRateMetrics:
+    """Event rate metrics."""
+
+    metrics_count: int = 0
+    metrics_window_count: int = 0
+    metrics_window_started_at: float = field(default_factory=time.monotonic)
+
+    def record(self) -> None:
+        """Record an event."""
+
+        self.metrics_count += 1
+        self.metrics_window_count += 1
+
+    def reset_window(self) -> float:
+        """Start the new window of the metrics.
+
+        Returns:
+            float: Event rate of the previous window (in events per second).
+        """
+
+        window_finished_at = time.monotonic()
+        window_seconds = max(window_finished_at - self.metrics_window_started_at, 1e-9)
+
+        event_rate = self.metrics_window_count / window_seconds
+
+        self.metrics_window_count = 0
+        self.metrics_window_started_at = window_finished_at
+
+        return event_rate
@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class ProviderSession:
+    """Provider session credentials."""
+
+    session_headers: dict[str, str]
+    session_cookies: dict[str, str]
+
+    session_expires_at: float
+    session_remaining_requests: int | None
+    session_rate_limit_reset_at: float | None
@@ -30,3 +30,25 @@ class StorageConnectionSettings:
     bucket_name: str
 
     public_url_base: str | None
+
+    pool_maximum_size: int
+    retries_maximum_attempts: int
+
+    # NOTE(synzr): objects larger than the part size are uploaded in multiple parts,
+    #              S3 requires at least 5 MiB for every part except the last one
+    multipart_part_size: int
+    multipart_concurrency: int
+
+
+@dataclass
+class HttpConnectionSettings:
+    """HTTP connection settings."""
+
+    pool_maximum_size: int
+    pool_maximum_size_per_host: int
+
+    dns_cache_ttl: int
+    keepalive_timeout: float
+
+    connect_timeout: float
+    total_timeout: float
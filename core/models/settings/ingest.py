@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class IngestSettings:
+    """Ingest settings."""
+
+    worker_count: int
+
+    # NOTE(synzr): the full queue is blocking the message handlers (backpressure)
+    queue_maximum_size: int
+
+    # Requests are saved to the database and processed by the separate workers
+    durable_enabled: bool
+
+    lease_duration: int
+    maximum_attempts: int
+
+    retry_base_delay: int
+    retry_maximum_delay: int
+
+    poll_interval: float
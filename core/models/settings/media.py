@@ -1,5 +1,8 @@
+from dataclasses import dataclass, field
 from enum import Enum
 
+import re
+
 
 class ImageType(Enum):
     """Image type."""
@@ -7,3 +10,87 @@ class ImageType(Enum):
     MEDIA = 0
     THUMBNAIL = 1
     AVATAR = 2
+
+
+class ImageFormat(Enum):
+    """Image output format (value is the file extension)."""
+
+    JPEG = "jpeg"
+    WEBP = "webp"
+    AVIF = "avif"
+
+
+@dataclass
+class EncodingProfile:
+    """Encoding profile of the image output format."""
+
+    # NOTE(synzr): `None` is the maximum quality without the searching
+    target_size: int | None
+
+    minimum_quality: int
+    maximum_quality: int
+
+    progressive: bool = False
+    optimize: bool = False
+
+
+@dataclass
+class MediaSourceVariant:
+    """Size variant of the media on the CDN."""
+
+    # NOTE(synzr): `None` is the unbounded size (the original image)
+    variant_width: int | None
+    variant_height: int | None
+
+    variant_name: str
+
+
+@dataclass
+class MediaSourceProfile:
+    """Media profile of the CDN host."""
+
+    source_referer: str | None
+
+    # NOTE(synzr): pattern is matched with the whole URL, the template is
+    #              formatted with its named groups and the variant name
+    source_url_pattern: re.Pattern | None = None
+    source_url_template: str | None = None
+
+    # Variants are sorted from the smallest to the largest one
+    source_variants: list[MediaSourceVariant] = field(default_factory=list)
+
+    # Maximum aspect ratio (width / height) which the chosen variant should cover
+    source_aspect_ratio: float = 1.0
+
+
+@dataclass
+class RenderServiceSettings:
+    """On-demand rendering service settings."""
+
+    # NOTE(synzr): derivatives are rendered at the ingest when it's disabled
+    service_enabled: bool
+
+    service_hostname: str
+    service_port: int
+
+    public_url_base: str
+
+
+@dataclass
+class MediaProcessingSettings:
+    """Media processing settings."""
+
+    process_pool_maximum_workers: int | None
+    output_formats: list[ImageFormat]
+
+    download_concurrency: int
+    upload_concurrency: int
+    pipeline_queue_size: int
+
+    download_maximum_size: int
+    download_spill_threshold: int
+    download_spill_directory: str | None
+
+    # NOTE(synzr): `None` disables the source cache
+    source_cache_directory: str | None
+    source_cache_maximum_size: int
@@ -1,3 +1,4 @@
+from .discord import DiscordProvider
 from .pixiv import PixivProvider
 from .tumblr import TumblrProvider
 from .twitter import TwitterProvider
@@ -1,5 +1,7 @@
 from core.models import DiscordMessage, DiscordUser, URN
-from discord import Client
+from discord import Client, Message, Object
+from discord.abc import Messageable
+from discord.utils import get
 import asyncio
 import logging
 
@@ -7,6 +9,8 @@ import logging
 class DiscordProvider:
     """Discord data provider."""
 
+    DISCORD_HISTORY_WINDOW_SIZE = 100
+
     def __init__(self, bot_token: str | None = None, client: Client | None = None) -> None:
         """Class constructor.
 
@@ -16,6 +20,7 @@ class DiscordProvider:
         """
 
         self.__logger = logging.getLogger("core.providers.discord")
+        self.__channels = {}
 
         if client: self.__client = client
         else:
@@ -24,15 +29,20 @@ class DiscordProvider:
             asyncio.get_event_loop().run_until_complete(
                 self.__client.login(bot_token))
 
-    async def __fetch_message(self,
-                              channel_id: int,
-                              message_id: int) -> DiscordMessage | None:
-        try:
-            channel = await self.__client.fetch_channel(channel_id)
-            message = await channel.fetch_message(message_id)
-        except:
-            return None
+    async def __get_channel(self, channel_id: int) -> Messageable | None:
+        channel = self.__client.get_channel(channel_id) or self.__channels.get(channel_id)
+
+        if channel:
+            return channel
+
+        try: channel = await self.__client.fetch_channel(channel_id)
+        except: return None
+
+        # Channels received over REST are not stored in the gateway cache
+        self.__channels[channel_id] = channel
+        return channel
 
+    def __parse_message(self, message: Message) -> DiscordMessage:
         message_id = message.id
         message_user_id = message.author.id
         message_full_url = message.jump_url
@@ -40,13 +50,11 @@ class DiscordProvider:
         message_image_attachements = []
 
         for attachement in message.attachments:
-            if not attachement.content_type.startswith("image"):
+            if not attachement.content_type or not attachement.content_type.startswith("image"):
                 continue
 
             message_image_attachements.append(attachement.proxy_url)
 
-        self.__logger.info(f"__fetch_message(channel_id={channel_id}, message_id={message_id}): Received message \"{message_content}\" ({message_full_url})")
-
         return DiscordMessage(
             message_id=message_id,
             message_user_id=message_user_id,
@@ -55,16 +63,77 @@ class DiscordProvider:
             message_image_attachements=message_image_attachements
         )
 
+    async def __fetch_message(self,
+                              channel_id: int,
+                              message_id: int) -> DiscordMessage | None:
+        message = get(self.__client.cached_messages, id=message_id)
+
+        if not message:
+            channel = await self.__get_channel(channel_id)
+            if not channel: return None
+
+            try: message = await channel.fetch_message(message_id)
+            except: return None
+
+        parsed_message = self.__parse_message(message)
+
+        self.__logger.info(f"__fetch_message(channel_id={channel_id}, message_id={message_id}): Received message \"{parsed_message.message_content}\" ({parsed_message.message_full_url})")
+        return parsed_message
+
+    async def __fetch_channel_messages(self,
+                                       channel_id: int,
+                                       message_ids: list[int]) -> dict[int, DiscordMessage]:
+        messages = {}
+        pending_message_ids = []
+
+        for message_id in sorted(set(message_ids)):
+            message = get(self.__client.cached_messages, id=message_id)
+
+            if message: messages[message_id] = self.__parse_message(message)
+            else: pending_message_ids.append(message_id)
+
+        channel = await self.__get_channel(channel_id) if pending_message_ids else None
+        request_count = 0
+
+        while channel and pending_message_ids:
+            # One history request returns the window of messages after the oldest pending one
+            window = [message async for message in channel.history(limit=self.DISCORD_HISTORY_WINDOW_SIZE,
+                                                                   after=Object(id=pending_message_ids[0] - 1),
+                                                                   oldest_first=True)]
+            request_count += 1
+
+            for message in window:
+                if message.id in pending_message_ids:
+                    messages[message.id] = self.__parse_message(message)
+
+            if len(window) < self.DISCORD_HISTORY_WINDOW_SIZE:
+                break
+
+            # Messages before the end of the window which weren't received are deleted
+            last_message_id = window[-1].id
+            pending_message_ids = [message_id for message_id in pending_message_ids
+                                   if message_id > last_message_id]
+
+        self.__logger.info(f"__fetch_channel_messages(channel_id={channel_id}, message_ids={message_ids}): Received {len(messages)} messages using {request_count} requests")
+        return messages
+
     async def __fetch_user(self, user_id: int) -> DiscordUser | None:
-        try: user = await self.__client.fetch_user(user_id)
-        except: return None
+        user = self.__client.get_user(user_id)
+
+        if not user:
+            try: user = await self.__client.fetch_user(user_id)
+            except: return None
 
         user_id = user.id
         user_name = user.name
         user_display_name = user.display_name
         user_legacy_discriminator = user.discriminator
-        user_avatar_url = user.avatar.with_size(512).with_static_format("png").url
-        user_banner_url = user.banner.with_size(512).with_static_format("png").url
+        user_avatar_url = user.display_avatar.with_size(512).with_static_format("png").url
+        user_banner_url = None
+
+        # NOTE(synzr): cached users don't have the banner, only the fetched ones
+        if user.banner:
+            user_banner_url = user.banner.with_size(512).with_static_format("png").url
 
         self.__logger.info(f"__fetch_user(user_id={user_id}): Received user {user_display_name} ({user_name}#{user_legacy_discriminator})")
 
@@ -101,3 +170,39 @@ class DiscordProvider:
 
         self.__logger.error(f"fetch(urn={urn}): Can't receive this object")
         return None
+
+    async def fetch_many(self, urns: list[URN]) -> list[DiscordUser | DiscordMessage | None]:
+        """Fetch multiple objects, resolving the messages of one channel using history windows.
+
+        Args:
+            urns (list[URN]): URNs.
+
+        Returns:
+            list[DiscordUser | DiscordMessage | None]: Objects in the same order as URNs.
+        """
+
+        channel_message_ids = {}
+
+        for urn in urns:
+            if urn.urn_object != "message":
+                continue
+
+            channel_id = int(urn.urn_extra_fields["channel_id"], 10)
+            channel_message_ids.setdefault(channel_id, []).append(int(urn.urn_identifier, 10))
+
+        messages = {}
+
+        for channel_id, message_ids in channel_message_ids.items():
+            channel_messages = await self.__fetch_channel_messages(channel_id, message_ids)
+            messages.update({(channel_id, message_id): message for message_id, message in channel_messages.items()})
+
+        result = []
+
+        for urn in urns:
+            if urn.urn_object == "message":
+                channel_id = int(urn.urn_extra_fields["channel_id"], 10)
+                result.append(messages.get((channel_id, int(urn.urn_identifier, 10))))
+            else:
+                result.append(await self.fetch(urn))
+
+        return result
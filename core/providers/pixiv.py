@@ -1,8 +1,15 @@
-from core.models import PivixArtwork, PivixUser, URN
+from core.models import (
+    PivixArtwork,
+    PivixUser,
+    URN,
+    ExternalDataValidators,
+    ConditionalFetchResult
+)
+from core.clients import HttpClient
 
-from aiohttp import ClientSession
 from fake_useragent import FakeUserAgent
 
+import re
 import logging
 
 
@@ -15,74 +22,202 @@ class PixivProvider:
     PIXIV_USER_BASE_URL = "https://www.pixiv.net/users/{user_id}"
 
     PIXIV_AJAX_ARTWORK_URL = "https://www.pixiv.net/ajax/illust/{artwork_id}?full=0"
+    PIXIV_AJAX_USER_ARTWORKS_URL = "https://www.pixiv.net/ajax/user/{user_id}/profile/illusts"
+    # NOTE(synzr): users are saved with the following count and social links,
+    #              so the full profile is always fetched
     PIXIV_AJAX_USER_URL = "https://www.pixiv.net/ajax/user/{user_id}?full=1"
 
-    def __init__(self) -> None:
-        """Class constructor."""
+    # Batch endpoint gives the thumbnail URLs only, e.g.
+    # https://i.pximg.net/c/250x250_80_a2/img-master/img/.../1_p0_square1200.jpg
+    PIXIV_THUMBNAIL_SIZE_PATTERN = re.compile(r"/c/[^/]+/")
+    PIXIV_THUMBNAIL_SUFFIX_PATTERN = re.compile(r"_(square|custom)1200\.")
 
+    # NOTE(synzr): custom thumbnails are the crops chosen by the author,
+    #              the master image is stored under the `img-master` path
+    PIXIV_CUSTOM_THUMBNAIL_PATH = "/custom-thumb/"
+    PIXIV_MASTER_IMAGE_PATH = "/img-master/"
+
+    def __init__(self, http_client: HttpClient) -> None:
+        """Class constructor.
+
+        Args:
+            http_client (HttpClient): Shared HTTP client.
+        """
+
+        self.__http_client = http_client
         self.__user_agent = FakeUserAgent().random
         self.__logger = logging.getLogger("core.providers.pixiv")
 
-    async def __fetch_artwork(self, artwork_id: int) -> PivixArtwork | None:
+    async def __get_ajax_response(self,
+                                  url: str,
+                                  params: list | None = None,
+                                  validators: ExternalDataValidators | None = None) -> ConditionalFetchResult:
         headers = {"user-agent": self.__user_agent, "referrer": self.PIXIV_BASE_URL}
+        headers.update(self.__http_client.get_conditional_headers(validators))
 
-        async with ClientSession(headers=headers) as session:
-            url = self.PIXIV_AJAX_ARTWORK_URL.format(artwork_id=artwork_id)
-
-            async with session.get(url) as response:
-                result = await response.json()
-                if result["error"]: return None
-
-                artwork_id = int(result["body"]["illustId"], 10)
-                artwork_full_url = self.PIXIV_ARTWORK_BASE_URL.format(artwork_id=artwork_id)
-                artwork_title = result["body"]["illustTitle"]
-                artwork_comment = result["body"]["illustComment"]
-                artwork_hq_image_url = result["body"]["urls"]["regular"]
-                artwork_author_id = int(result["body"]["userId"], 10)
-                artwork_author_full_url = self.PIXIV_USER_BASE_URL.format(user_id=artwork_author_id)
-
-                logging.info(f"__fetch_artwork(artwork_id={artwork_id}): Recevied artwork {artwork_title} ({artwork_full_url})")
-
-                return PivixArtwork(
-                    artwork_id=artwork_id,
-                    artwork_full_url=artwork_full_url,
-                    artwork_title=artwork_title,
-                    artwork_comment=artwork_comment,
-                    artwork_hq_image_url=artwork_hq_image_url,
-                    artwork_author_id=artwork_author_id,
-                    artwork_author_full_url=artwork_author_full_url
-                )
+        session = await self.__http_client.get_session()
 
-    async def __fetch_user(self, user_id: int) -> PivixUser | None:
-        headers = {"user-agent": self.__user_agent, "referrer": self.PIXIV_BASE_URL}
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status == 304:
+                return ConditionalFetchResult(is_not_modified=True, external_data=None, validators=validators)
+
+            result = await response.json()
+
+            return ConditionalFetchResult(
+                is_not_modified=False,
+                external_data=None if result["error"] else result["body"],
+                validators=self.__http_client.get_validators(response)
+            )
+
+    async def __get_ajax_result(self, url: str, params: list | None = None) -> dict | None:
+        response = await self.__get_ajax_response(url, params)
+        return response.external_data
+
+    def __parse_artwork(self, artwork: dict) -> PivixArtwork:
+        artwork_id = int(artwork["illustId"], 10)
+        artwork_full_url = self.PIXIV_ARTWORK_BASE_URL.format(artwork_id=artwork_id)
+        artwork_title = artwork["illustTitle"]
+        artwork_comment = artwork["illustComment"]
+        artwork_hq_image_url = artwork["urls"]["regular"]
+        artwork_author_id = int(artwork["userId"], 10)
+        artwork_author_full_url = self.PIXIV_USER_BASE_URL.format(user_id=artwork_author_id)
+
+        return PivixArtwork(
+            artwork_id=artwork_id,
+            artwork_full_url=artwork_full_url,
+            artwork_title=artwork_title,
+            artwork_comment=artwork_comment,
+            artwork_hq_image_url=artwork_hq_image_url,
+            artwork_author_id=artwork_author_id,
+            artwork_author_full_url=artwork_author_full_url
+        )
+
+    def __parse_artwork_thumbnail(self, artwork: dict) -> PivixArtwork:
+        artwork_id = int(artwork["id"], 10)
+        artwork_full_url = self.PIXIV_ARTWORK_BASE_URL.format(artwork_id=artwork_id)
+        artwork_title = artwork["title"]
+        artwork_comment = artwork.get("description", "")
+        artwork_author_id = int(artwork["userId"], 10)
+        artwork_author_full_url = self.PIXIV_USER_BASE_URL.format(user_id=artwork_author_id)
+
+        artwork_hq_image_url = self.PIXIV_THUMBNAIL_SIZE_PATTERN.sub("/", artwork["url"], count=1)
+        artwork_hq_image_url = self.PIXIV_THUMBNAIL_SUFFIX_PATTERN.sub("_master1200.", artwork_hq_image_url)
+        artwork_hq_image_url = artwork_hq_image_url.replace(self.PIXIV_CUSTOM_THUMBNAIL_PATH,
+                                                            self.PIXIV_MASTER_IMAGE_PATH, 1)
+
+        return PivixArtwork(
+            artwork_id=artwork_id,
+            artwork_full_url=artwork_full_url,
+            artwork_title=artwork_title,
+            artwork_comment=artwork_comment,
+            artwork_hq_image_url=artwork_hq_image_url,
+            artwork_author_id=artwork_author_id,
+            artwork_author_full_url=artwork_author_full_url
+        )
+
+    async def __fetch_artwork_with_siblings(self, artwork_id: int) -> tuple[ConditionalFetchResult, set[int]] | None:
+        response = await self.__get_ajax_response(self.PIXIV_AJAX_ARTWORK_URL.format(artwork_id=artwork_id))
+        if not response.external_data: return None
+
+        artwork = response.external_data
+        response.external_data = self.__parse_artwork(artwork)
+
+        sibling_artwork_ids = set(int(sibling_artwork_id, 10) for sibling_artwork_id in artwork.get("userIllusts", {}))
+
+        self.__logger.info(f"__fetch_artwork_with_siblings(artwork_id={artwork_id}): Recevied artwork {response.external_data.artwork_title} ({response.external_data.artwork_full_url})")
+        return response, sibling_artwork_ids
+
+    async def __fetch_artwork(self, artwork_id: int) -> PivixArtwork | None:
+        result = await self.__fetch_artwork_with_siblings(artwork_id)
+        return result[0].external_data if result else None
+
+    async def __fetch_user_artworks(self, user_id: int, artwork_ids: list[int]) -> dict[int, PivixArtwork]:
+        params = [("ids[]", artwork_id) for artwork_id in artwork_ids]
+        params += [("work_category", "illustManga"), ("is_first_page", 0)]
+
+        result = await self.__get_ajax_result(self.PIXIV_AJAX_USER_ARTWORKS_URL.format(user_id=user_id), params)
+        if not result: return {}
+
+        artworks = {}
+
+        for artwork in result["works"].values():
+            parsed_artwork = self.__parse_artwork_thumbnail(artwork)
+            artworks[parsed_artwork.artwork_id] = parsed_artwork
+
+        self.__logger.info(f"__fetch_user_artworks(user_id={user_id}, artwork_ids={artwork_ids}): Recevied {len(artworks)} artworks")
+        return artworks
+
+    async def __fetch_artworks(self, artwork_ids: list[int]) -> dict[int, ConditionalFetchResult]:
+        pending_artwork_ids = list(dict.fromkeys(artwork_ids))
+        batched_artwork_ids = set()
+
+        responses = {}
+
+        while pending_artwork_ids:
+            artwork_id = pending_artwork_ids.pop(0)
+            result = await self.__fetch_artwork_with_siblings(artwork_id)
+
+            if not result:
+                continue
+
+            response, sibling_artwork_ids = result
+            responses[response.external_data.artwork_id] = response
+
+            # The artworks of the same author can be resolved using one request
+            same_author_artwork_ids = [pending_artwork_id for pending_artwork_id in pending_artwork_ids
+                                       if pending_artwork_id in sibling_artwork_ids and
+                                       pending_artwork_id not in batched_artwork_ids]
+
+            if not same_author_artwork_ids:
+                continue
+
+            batched_artwork_ids.update(same_author_artwork_ids)
+            batched_artworks = await self.__fetch_user_artworks(response.external_data.artwork_author_id,
+                                                                same_author_artwork_ids)
 
-        async with ClientSession(headers=headers) as session:
-            url = self.PIXIV_AJAX_USER_URL.format(user_id=user_id)
+            # NOTE(synzr): validators of the batch response are not describing
+            #              the single artwork, so the batched ones are without them
+            for batched_artwork_id, batched_artwork in batched_artworks.items():
+                responses[batched_artwork_id] = ConditionalFetchResult(is_not_modified=False,
+                                                                       external_data=batched_artwork,
+                                                                       validators=None)
 
-            async with session.get(url) as response:
-                result = await response.json()
-                if result["error"]: return None
+            # Artworks missing in the batch response are fetched one by one
+            pending_artwork_ids = [pending_artwork_id for pending_artwork_id in pending_artwork_ids
+                                   if pending_artwork_id not in responses]
 
-                user_id = int(result["body"]["userId"], 10)
-                user_full_url = self.PIXIV_USER_BASE_URL.format(user_id=user_id)
-                user_name = result["body"]["name"]
-                user_hq_avatar_url = result["body"]["imageBig"]
-                user_following_count = result["body"]["following"]
-                user_twitter_account_url = None
+        return responses
 
-                if result["body"]["social"] and "twitter" in result["body"]["social"]:
-                    user_twitter_account_url = result["body"]["social"]["twitter"]["url"]
+    def __parse_user(self, user: dict) -> PivixUser:
+        user_id = int(user["userId"], 10)
+        user_full_url = self.PIXIV_USER_BASE_URL.format(user_id=user_id)
+        user_name = user["name"]
+        user_hq_avatar_url = user["imageBig"]
+        user_following_count = user["following"]
+        user_twitter_account_url = None
 
-                logging.info(f"__fetch_user(user_id={user_id}): Recevied user {user_name} ({user_full_url})")
+        if user.get("social") and "twitter" in user["social"]:
+            user_twitter_account_url = user["social"]["twitter"]["url"]
 
-                return PivixUser(
-                    user_id=user_id,
-                    user_full_url=user_full_url,
-                    user_name=user_name,
-                    user_hq_avatar_url=user_hq_avatar_url,
-                    user_following_count=user_following_count,
-                    user_twitter_account_url=user_twitter_account_url
-                )
+        return PivixUser(
+            user_id=user_id,
+            user_full_url=user_full_url,
+            user_name=user_name,
+            user_hq_avatar_url=user_hq_avatar_url,
+            user_following_count=user_following_count,
+            user_twitter_account_url=user_twitter_account_url
+        )
+
+    async def __fetch_user(self, user_id: int) -> PivixUser | None:
+        url = self.PIXIV_AJAX_USER_URL.format(user_id=user_id)
+
+        user = await self.__get_ajax_result(url)
+        if not user: return None
+
+        parsed_user = self.__parse_user(user)
+
+        self.__logger.info(f"__fetch_user(user_id={user_id}): Recevied user {parsed_user.user_name} ({parsed_user.user_full_url})")
+        return parsed_user
 
     async def fetch(self, urn: URN) -> PivixArtwork | PivixUser | None:
         """Fetch the object using an identifier.
@@ -104,5 +239,75 @@ class PixivProvider:
             user_id = int(urn.urn_identifier, 10)
             return await self.__fetch_user(user_id)
 
-        logging.error(f"fetch(urn={urn}): Can't receive this object")
+        self.__logger.error(f"fetch(urn={urn}): Can't receive this object")
         return None
+
+    async def fetch_conditional(self,
+                                urn: URN,
+                                validators: ExternalDataValidators | None) -> ConditionalFetchResult:
+        """Fetch the object only if it was modified since the previous response.
+
+        Args:
+            urn (URN): URN.
+            validators (ExternalDataValidators | None): Validators of the previous response.
+
+        Returns:
+            ConditionalFetchResult: Result of the conditional fetch.
+        """
+
+        if urn.urn_object == "artwork":
+            url = self.PIXIV_AJAX_ARTWORK_URL.format(artwork_id=int(urn.urn_identifier, 10))
+            parse = self.__parse_artwork
+        elif urn.urn_object == "user":
+            url = self.PIXIV_AJAX_USER_URL.format(user_id=int(urn.urn_identifier, 10))
+            parse = self.__parse_user
+        else:
+            self.__logger.error(f"fetch_conditional(urn={urn}, validators={validators}): Can't receive this object")
+            return ConditionalFetchResult(is_not_modified=False, external_data=None, validators=None)
+
+        response = await self.__get_ajax_response(url, validators=validators)
+
+        if response.external_data:
+            response.external_data = parse(response.external_data)
+
+        self.__logger.info(f"fetch_conditional(urn={urn}, validators={validators}): Not modified: {response.is_not_modified}")
+        return response
+
+    async def fetch_many(self, urns: list[URN]) -> list[PivixArtwork | PivixUser | None]:
+        """Fetch multiple objects, resolving the artworks of the same author together.
+
+        Args:
+            urns (list[URN]): URNs.
+
+        Returns:
+            list[PivixArtwork | PivixUser | None]: Objects in the same order as URNs.
+        """
+
+        return [response.external_data for response in await self.fetch_many_conditional(urns)]
+
+    async def fetch_many_conditional(self, urns: list[URN]) -> list[ConditionalFetchResult]:
+        """Fetch multiple objects with the validators of their responses,
+        resolving the artworks of the same author together.
+
+        Artworks resolved using the batch endpoint are without the validators.
+
+        Args:
+            urns (list[URN]): URNs.
+
+        Returns:
+            list[ConditionalFetchResult]: Results in the same order as URNs.
+        """
+
+        artwork_ids = [int(urn.urn_identifier, 10) for urn in urns if urn.urn_object == "artwork"]
+        responses = await self.__fetch_artworks(artwork_ids) if artwork_ids else {}
+
+        result = []
+
+        for urn in urns:
+            if urn.urn_object == "artwork":
+                result.append(responses.get(int(urn.urn_identifier, 10)) or
+                              ConditionalFetchResult(is_not_modified=False, external_data=None, validators=None))
+            else:
+                result.append(await self.fetch_conditional(urn, None))
+
+        return result
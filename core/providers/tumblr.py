@@ -1,58 +1,253 @@
-from core.models import TumblrBlog, TumblrPost, URN
+from core.models import (
+    TumblrBlog,
+    TumblrPost,
+    URN,
+    ExternalDataValidators,
+    ConditionalFetchResult
+)
+from core.clients import HttpClient
 
-from aiohttp import ClientSession
 from fake_useragent import FakeUserAgent
 
+import codecs
+import re
 import ujson
 import logging
 
 
+class TumblrInitialStateScanner:
+    """Incremental scanner of the `___INITIAL_STATE___` object in the Tumblr pages."""
+
+    INITIAL_STATE_MARKER = "window['___INITIAL_STATE___'] = "
+
+    STRUCTURE_PATTERN = re.compile(r'[{}\[\]",:]|undefined')
+    STRING_PATTERN = re.compile(r'[\\"]')
+
+    def __init__(self, state_key: str) -> None:
+        """Class constructor.
+
+        Args:
+            state_key (str): Top-level key of the initial state which is needed.
+        """
+
+        self.__state_key = state_key
+
+        self.__buffer = ""
+        self.__is_marker_found = False
+        self.__is_finished = False
+
+        self.__position = 0
+        self.__depth = 0
+        self.__is_in_string = False
+        self.__string_start = None
+
+        self.__last_string_range = None
+        self.__current_key = None
+        self.__current_value_start = None
+
+        self.__undefined_positions = []
+        self.__value_ranges = {}
+
+    def __find_marker(self) -> bool:
+        marker_index = self.__buffer.find(self.INITIAL_STATE_MARKER)
+
+        if marker_index == -1:
+            # Keeping the tail only, the marker can be split between chunks
+            self.__buffer = self.__buffer[-len(self.INITIAL_STATE_MARKER):]
+            return False
+
+        object_index = self.__buffer.find("{", marker_index + len(self.INITIAL_STATE_MARKER))
+
+        if object_index == -1:
+            self.__buffer = self.__buffer[marker_index:]
+            return False
+
+        self.__buffer = self.__buffer[object_index:]
+        self.__is_marker_found = True
+
+        return True
+
+    def __end_value(self, value_end: int) -> None:
+        if self.__current_key is not None and self.__current_value_start is not None:
+            self.__value_ranges[self.__current_key] = (self.__current_value_start, value_end)
+
+            if self.__current_key == self.__state_key:
+                self.__is_finished = True
+
+        self.__current_key = None
+        self.__current_value_start = None
+
+    def __scan_string(self) -> bool:
+        while True:
+            match = self.STRING_PATTERN.search(self.__buffer, self.__position)
+
+            if not match:
+                self.__position = len(self.__buffer)
+                return False
+
+            if match.group() == "\\":
+                # Escape sequence can be split between chunks
+                if match.end() >= len(self.__buffer):
+                    self.__position = match.start()
+                    return False
+
+                self.__position = match.end() + 1
+                continue
+
+            self.__last_string_range = (self.__string_start + 1, match.start())
+            self.__position = match.end()
+            self.__is_in_string = False
+
+            return True
+
+    def __scan(self) -> None:
+        while not self.__is_finished:
+            if self.__is_in_string and not self.__scan_string():
+                return
+
+            match = self.STRUCTURE_PATTERN.search(self.__buffer, self.__position)
+
+            if not match:
+                # `undefined` can be split between chunks
+                self.__position = max(self.__position, len(self.__buffer) - len("undefined") + 1)
+                return
+
+            token = match.group()
+            self.__position = match.end()
+
+            if token == '"':
+                self.__string_start = match.start()
+                self.__is_in_string = True
+            elif token == "undefined":
+                self.__undefined_positions.append(match.start())
+            elif token in "{[":
+                self.__depth += 1
+            elif token in "}]":
+                self.__depth -= 1
+
+                if self.__depth == 0:
+                    self.__end_value(match.start())
+                    self.__is_finished = True
+            elif token == ":" and self.__depth == 1:
+                string_start, string_end = self.__last_string_range
+
+                self.__current_key = self.__buffer[string_start:string_end]
+                self.__current_value_start = match.end()
+            elif token == "," and self.__depth == 1:
+                self.__end_value(match.start())
+
+    def feed(self, data: str) -> bool:
+        """Feed the next part of the page.
+
+        Args:
+            data (str): Decoded part of the page.
+
+        Returns:
+            bool: Is the needed part of the initial state received?
+        """
+
+        if self.__is_finished:
+            return True
+
+        self.__buffer += data
+
+        if not self.__is_marker_found and not self.__find_marker():
+            return False
+
+        self.__scan()
+        return self.__is_finished
+
+    def get_value(self) -> any:
+        """Parse the value of the needed top-level key.
+
+        Returns:
+            any: Parsed value.
+            None: Nothing (the key wasn't found).
+        """
+
+        if self.__state_key not in self.__value_ranges:
+            return None
+
+        value_start, value_end = self.__value_ranges[self.__state_key]
+        value_parts = []
+
+        # JavaScript's `undefined` is not valid JSON, replacing it outside of strings
+        for undefined_position in self.__undefined_positions:
+            if not value_start <= undefined_position < value_end:
+                continue
+
+            value_parts.append(self.__buffer[value_start:undefined_position])
+            value_parts.append("null")
+
+            value_start = undefined_position + len("undefined")
+
+        value_parts.append(self.__buffer[value_start:value_end])
+        return ujson.loads("".join(value_parts))
+
+
 class TumblrProvider:
     """Tumblr data provider."""
 
     TUMBLR_BLOG_URL = "https://www.tumblr.com/{blog_name}/"
     TUMBLR_POST_URL = "https://www.tumblr.com/{blog_name}/{post_id}/"
 
-    def __init__(self) -> None:
-        """Class constructor."""
+    TUMBLR_READ_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, http_client: HttpClient) -> None:
+        """Class constructor.
+
+        Args:
+            http_client (HttpClient): Shared HTTP client.
+        """
 
+        self.__http_client = http_client
         self.__user_agent = FakeUserAgent().random
         self.__logger = logging.getLogger("core.providers.tumblr")
 
-    async def __get_initial_state(self, url: str) -> dict | None:
+    async def __get_initial_state(self,
+                                  url: str,
+                                  state_key: str,
+                                  validators: ExternalDataValidators | None = None) -> ConditionalFetchResult:
         headers = {"user-agent": self.__user_agent}
+        headers.update(self.__http_client.get_conditional_headers(validators))
 
-        async with ClientSession(headers=headers) as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    return None
+        session = await self.__http_client.get_session()
 
-                response_data = await response.text()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return ConditionalFetchResult(is_not_modified=True, external_data=None, validators=validators)
 
-                initial_state = response_data \
-                    .split("window[\'___INITIAL_STATE___\'] = ")[-1] \
-                    .split("};")[0] \
-                    .replace("undefined", '"undefined"') + "}"
-                initial_state = ujson.loads(initial_state)
+            if response.status != 200:
+                return ConditionalFetchResult(is_not_modified=False, external_data=None, validators=None)
 
-                return initial_state
+            scanner = TumblrInitialStateScanner(state_key)
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
 
-    async def __fetch_blog(self, blog_name: str) -> TumblrBlog | None:
-        url = self.TUMBLR_BLOG_URL.format(blog_name=blog_name)
-        initial_state = await self.__get_initial_state(url)
+            received_size = 0
 
-        if not initial_state:
-            return None
+            async for chunk in response.content.iter_chunked(self.TUMBLR_READ_CHUNK_SIZE):
+                received_size += len(chunk)
+
+                # Stop reading the page as soon as the needed part is received
+                if scanner.feed(decoder.decode(chunk)):
+                    break
+
+            self.__logger.info(f"__get_initial_state(url={url}, state_key={state_key}): Read {received_size} bytes of the page")
+
+            return ConditionalFetchResult(
+                is_not_modified=False,
+                external_data=scanner.get_value(),
+                validators=self.__http_client.get_validators(response)
+            )
 
-        blog = initial_state["queries"]["queries"][-1]["state"]["data"]
+    def __parse_blog(self, queries: dict) -> TumblrBlog:
+        blog = queries["queries"][-1]["state"]["data"]
 
         blog_name = blog["name"]
         blog_url = blog["blogViewUrl"]
         blog_title = blog["title"]
         blog_hq_avatar_url = blog["avatar"][0]["url"]
 
-        self.__logger.info(f"__fetch_blog(blog_name={blog_name}): Received blog {blog_title} ({blog_url})")
-
         return TumblrBlog(
             blog_name=blog_name,
             blog_url=blog_url,
@@ -60,14 +255,8 @@ class TumblrProvider:
             blog_hq_avatar_url=blog_hq_avatar_url
         )
 
-    async def __fetch_post(self, post_id: int, blog_name: str) -> TumblrPost | None:
-        url = self.TUMBLR_POST_URL.format(blog_name=blog_name, post_id=post_id)
-        initial_state = await self.__get_initial_state(url)
-
-        if not initial_state:
-            return None
-
-        post = initial_state["PeeprRoute"]["initialTimeline"]["objects"][0]
+    def __parse_post(self, peepr_route: dict) -> TumblrPost:
+        post = peepr_route["initialTimeline"]["objects"][0]
 
         post_id = int(post["idString"], 10)
         post_url = post["postUrl"]
@@ -81,8 +270,6 @@ class TumblrProvider:
 
             post_images.append(content["media"][0]["url"])
 
-        self.__logger.info(f"__fetch_post(post_id={post_id}, blog_name={blog_name}): Received post {post_id} ({post_url})")
-
         return TumblrPost(
             post_id=post_id,
             post_url=post_url,
@@ -91,6 +278,30 @@ class TumblrProvider:
             blog_url=blog_url
         )
 
+    async def __fetch_blog(self, blog_name: str) -> TumblrBlog | None:
+        url = self.TUMBLR_BLOG_URL.format(blog_name=blog_name)
+        response = await self.__get_initial_state(url, "queries")
+
+        if not response.external_data:
+            return None
+
+        blog = self.__parse_blog(response.external_data)
+
+        self.__logger.info(f"__fetch_blog(blog_name={blog_name}): Received blog {blog.blog_title} ({blog.blog_url})")
+        return blog
+
+    async def __fetch_post(self, post_id: int, blog_name: str) -> TumblrPost | None:
+        url = self.TUMBLR_POST_URL.format(blog_name=blog_name, post_id=post_id)
+        response = await self.__get_initial_state(url, "PeeprRoute")
+
+        if not response.external_data:
+            return None
+
+        post = self.__parse_post(response.external_data)
+
+        self.__logger.info(f"__fetch_post(post_id={post_id}, blog_name={blog_name}): Received post {post.post_id} ({post.post_url})")
+        return post
+
     async def fetch(self, urn: URN) -> TumblrBlog | TumblrPost | None:
         """Fetch the object using an identifier.
 
@@ -112,3 +323,35 @@ class TumblrProvider:
 
         logging.error(f"fetch(urn={urn}): Can't receive this object")
         return None
+
+    async def fetch_conditional(self,
+                                urn: URN,
+                                validators: ExternalDataValidators | None) -> ConditionalFetchResult:
+        """Fetch the object only if it was modified since the previous response.
+
+        Args:
+            urn (URN): URN.
+            validators (ExternalDataValidators | None): Validators of the previous response.
+
+        Returns:
+            ConditionalFetchResult: Result of the conditional fetch.
+        """
+
+        if urn.urn_object == "blog":
+            url = self.TUMBLR_BLOG_URL.format(blog_name=urn.urn_identifier)
+            state_key, parse = "queries", self.__parse_blog
+        elif urn.urn_object == "post":
+            url = self.TUMBLR_POST_URL.format(blog_name=urn.urn_extra_fields["blog_name"],
+                                              post_id=int(urn.urn_identifier, 10))
+            state_key, parse = "PeeprRoute", self.__parse_post
+        else:
+            self.__logger.error(f"fetch_conditional(urn={urn}, validators={validators}): Can't receive this object")
+            return ConditionalFetchResult(is_not_modified=False, external_data=None, validators=None)
+
+        response = await self.__get_initial_state(url, state_key, validators)
+
+        if response.external_data:
+            response.external_data = parse(response.external_data)
+
+        self.__logger.info(f"fetch_conditional(urn={urn}, validators={validators}): Not modified: {response.is_not_modified}")
+        return response
@@ -1,10 +1,11 @@
-from core.models import TwitterUser, TwitterTweet, URN
+from core.models import TwitterUser, TwitterTweet, ProviderSession, URN
+from core.clients import HttpClient, SessionPool
 
-from aiohttp import ClientSession
 from fake_useragent import FakeUserAgent
 
 import ujson
 import logging
+import time
 
 
 class TwitterProvider:
@@ -13,6 +14,7 @@ class TwitterProvider:
     TWITTER_GUEST_ACTIVATE_URL = "https://api.twitter.com/1.1/guest/activate.json"
 
     TWITTER_TWEET_RESULT_BY_REST_ID_URL = "https://api.twitter.com/graphql/5GOHgZe-8U2j5sVHQzEm9A/TweetResultByRestId"
+    TWITTER_TWEET_RESULTS_BY_REST_IDS_URL = "https://api.twitter.com/graphql/BWy5aoI-WvwbkSiHtDH4pQ/TweetResultsByRestIds"
     TWITTER_USER_BY_SCREEN_NAME_URL = "https://api.twitter.com/graphql/G3KGOASz96M-Qu0nwmGXNg/UserByScreenName"
 
     TWITTER_TWEET_FULL_URL = "https://x.com/i/status/{tweet_rest_id}"
@@ -62,136 +64,191 @@ class TwitterProvider:
         "withVoice": False
     }
 
-    def __init__(self) -> None:
-        """Class constructor."""
+    TWITTER_TWEET_BATCH_SIZE = 50
 
+    TWITTER_GUEST_SESSION_LIFETIME = 3 * 60 * 60
+    TWITTER_GUEST_SESSION_POOL_SIZE = 4
+    TWITTER_GUEST_SESSION_REFRESH_MARGIN = 10 * 60
+    TWITTER_GUEST_SESSION_REFRESH_INTERVAL = 60
+
+    def __init__(self, http_client: HttpClient) -> None:
+        """Class constructor.
+
+        Args:
+            http_client (HttpClient): Shared HTTP client.
+        """
+
+        self.__http_client = http_client
         self.__user_agent = FakeUserAgent().random
         self.__logger = logging.getLogger("core.providers.twitter")
 
-    async def __activate_guest_session(self, session: ClientSession) -> bool:
-        session.headers["user-agent"] = self.__user_agent
-        session.headers.update(self.TWITTER_DEFAULT_HEADERS)
+        self.__guest_session_pool = SessionPool("twitter",
+                                                self.__activate_guest_session,
+                                                self.TWITTER_GUEST_SESSION_POOL_SIZE,
+                                                self.TWITTER_GUEST_SESSION_REFRESH_MARGIN,
+                                                self.TWITTER_GUEST_SESSION_REFRESH_INTERVAL)
+
+    async def __activate_guest_session(self) -> ProviderSession | None:
+        session = await self.__http_client.get_session()
 
-        async with session.post(self.TWITTER_GUEST_ACTIVATE_URL) as response:
+        headers = {"user-agent": self.__user_agent}
+        headers.update(self.TWITTER_DEFAULT_HEADERS)
+
+        async with session.post(self.TWITTER_GUEST_ACTIVATE_URL, headers=headers) as response:
             if response.status != 200:
-                return False
+                return None
 
             result = await response.json()
             guest_token = result["guest_token"]
 
-            session.headers.update({
+            headers.update({
                 "content-type": "application/json",
                 "x-guest-token": guest_token,
                 "x-twitter-active-user": "yes"
             })
-            session.cookie_jar.update_cookies({"guest_id": "v1%3A" + guest_token})
 
-            self.__logger.info(f"__activate_guest_session(session={session}): Guest session activation successful")
-            return True
+            self.__logger.info("__activate_guest_session(): Guest session activation successful")
 
-    async def __fetch_user(self, screen_name: str) -> TwitterUser | None:
-        async with ClientSession() as session:
-            if not await self.__activate_guest_session(session):
-                return None
-
-            variables = {"screen_name": screen_name}
-            variables.update(self.TWITTER_DEFAULT_VARIABLES)
-
-            params = {
-                "variables": ujson.dumps(variables),
-                "features": ujson.dumps(self.TWITTER_DEFAULT_FEATURES)
-            }
+            return ProviderSession(
+                session_headers=headers,
+                session_cookies={"guest_id": "v1%3A" + guest_token},
+                session_expires_at=time.time() + self.TWITTER_GUEST_SESSION_LIFETIME,
+                session_remaining_requests=None,
+                session_rate_limit_reset_at=None
+            )
 
-            async with session.get(self.TWITTER_USER_BY_SCREEN_NAME_URL, params=params) as response:
-                if response.status != 200:
-                    print(await response.text())
-                    return None
+    async def __get_graphql_result(self, url: str, variables: dict) -> dict | None:
+        guest_session = await self.__guest_session_pool.acquire()
 
-                result = await response.json()
+        if not guest_session:
+            return None
 
-                if result["data"]["user"]["result"]["__typename"] != "User":
-                    return None
+        session = await self.__http_client.get_session()
+        variables.update(self.TWITTER_DEFAULT_VARIABLES)
 
-                base_user = result["data"]["user"]["result"]["legacy"]
+        params = {
+            "variables": ujson.dumps(variables),
+            "features": ujson.dumps(self.TWITTER_DEFAULT_FEATURES)
+        }
 
-                user_rest_id = int(result["data"]["user"]["result"]["rest_id"], 10)
-                user_full_url = self.TWITTER_USER_FULL_URL.format(screen_name=base_user["screen_name"])
-                user_name = base_user["name"]
-                user_screen_name = base_user["screen_name"]
-                user_follower_count = base_user["followers_count"]
-                user_avatar_url = base_user["profile_image_url_https"]
+        async with session.get(url,
+                               params=params,
+                               headers=guest_session.session_headers,
+                               cookies=guest_session.session_cookies) as response:
+            self.__guest_session_pool.update_rate_limit(guest_session, response.headers)
 
-                self.__logger.info(f"__fetch_user(screen_name={screen_name}): Received user {user_name} ({user_full_url})")
+            # The guest token is expired or revoked
+            if response.status in (401, 403):
+                self.__guest_session_pool.invalidate(guest_session)
 
-                return TwitterUser(
-                    user_rest_id=user_rest_id,
-                    user_full_url=user_full_url,
-                    user_name=user_name,
-                    user_screen_name=user_screen_name,
-                    user_follower_count=user_follower_count,
-                    user_avatar_url=user_avatar_url
-                )
-
-    async def __fetch_tweet(self, tweet_rest_id: int) -> TwitterTweet | None:
-        async with ClientSession(headers={"User-Agent": self.__user_agent}) as session:
-            if not await self.__activate_guest_session(session):
+            if response.status != 200:
+                self.__logger.error(f"__get_graphql_result(url={url}, variables={variables}): Received status {response.status}")
                 return None
 
-            variables = {"tweetId": tweet_rest_id}
-            variables.update(self.TWITTER_DEFAULT_VARIABLES)
+            return await response.json()
 
-            params = {
-                "variables": ujson.dumps(variables),
-                "features": ujson.dumps(self.TWITTER_DEFAULT_FEATURES)
-            }
+    async def __fetch_user(self, screen_name: str) -> TwitterUser | None:
+        result = await self.__get_graphql_result(self.TWITTER_USER_BY_SCREEN_NAME_URL,
+                                                 {"screen_name": screen_name})
+
+        if not result or result["data"]["user"]["result"]["__typename"] != "User":
+            return None
+
+        base_user = result["data"]["user"]["result"]["legacy"]
+
+        user_rest_id = int(result["data"]["user"]["result"]["rest_id"], 10)
+        user_full_url = self.TWITTER_USER_FULL_URL.format(screen_name=base_user["screen_name"])
+        user_name = base_user["name"]
+        user_screen_name = base_user["screen_name"]
+        user_follower_count = base_user["followers_count"]
+        user_avatar_url = base_user["profile_image_url_https"]
+
+        self.__logger.info(f"__fetch_user(screen_name={screen_name}): Received user {user_name} ({user_full_url})")
+
+        return TwitterUser(
+            user_rest_id=user_rest_id,
+            user_full_url=user_full_url,
+            user_name=user_name,
+            user_screen_name=user_screen_name,
+            user_follower_count=user_follower_count,
+            user_avatar_url=user_avatar_url
+        )
+
+    def __parse_tweet_result(self, tweet_result: dict) -> TwitterTweet | None:
+        if tweet_result.get("__typename") != "Tweet":
+            return None
+
+        base_user = tweet_result["core"]["user_results"]["result"]
+        base_tweet = tweet_result["legacy"]
+
+        base_media = []
+
+        if base_tweet.get("retweeted_status_result"):
+            base_media = base_tweet["retweeted_status_result"]["result"]["legacy"]["extended_entities"]
+
+        if base_tweet["extended_entities"].get("media"):
+            base_media = base_tweet["extended_entities"]["media"]
+
+        tweet_rest_id = int(base_tweet["id_str"], 10)
+        tweet_full_url = self.TWITTER_TWEET_FULL_URL.format(tweet_rest_id=tweet_rest_id)
+        tweet_favorite_count = base_tweet["favorite_count"]
+        tweet_retweet_count = base_tweet["retweet_count"]
+        tweet_image_urls = []
+        tweet_author_user_rest_id = int(base_user["rest_id"], 10)
+        tweet_author_screen_name = base_user["legacy"]["screen_name"]
+        tweet_author_full_url = self.TWITTER_USER_FULL_URL.format(screen_name=tweet_author_screen_name)
+
+        for media_entity in base_media:
+            if media_entity["type"] != "photo":
+                continue
+
+            tweet_image_urls.append(media_entity["media_url_https"])
+
+        return TwitterTweet(
+            tweet_rest_id=tweet_rest_id,
+            tweet_full_url=tweet_full_url,
+            tweet_favorite_count=tweet_favorite_count,
+            tweet_retweet_count=tweet_retweet_count,
+            tweet_image_urls=tweet_image_urls,
+            tweet_author_user_rest_id=tweet_author_user_rest_id,
+            tweet_author_screen_name=tweet_author_screen_name,
+            tweet_author_full_url=tweet_author_full_url
+        )
 
-            async with session.get(self.TWITTER_TWEET_RESULT_BY_REST_ID_URL, params=params) as response:
-                if response.status != 200:
-                    return None
+    async def __fetch_tweet(self, tweet_rest_id: int) -> TwitterTweet | None:
+        result = await self.__get_graphql_result(self.TWITTER_TWEET_RESULT_BY_REST_ID_URL,
+                                                 {"tweetId": tweet_rest_id})
 
-                result = await response.json()
+        if not result:
+            return None
 
-                if result["data"]["tweetResult"]["result"]["__typename"] != "Tweet":
-                    return None
+        tweet = self.__parse_tweet_result(result["data"]["tweetResult"]["result"])
 
-                base_user = result["data"]["tweetResult"]["result"]["core"]["user_results"]["result"]
-                base_tweet = result["data"]["tweetResult"]["result"]["legacy"]
+        if tweet:
+            self.__logger.info(f"__fetch_tweet(tweet_rest_id={tweet_rest_id}): Received tweet {tweet.tweet_rest_id} ({tweet.tweet_full_url})")
 
-                base_media = []
+        return tweet
 
-                if base_tweet.get("retweeted_status_result"):
-                    base_media = base_tweet["retweeted_status_result"]["result"]["legacy"]["extended_entities"]
+    async def __fetch_tweets(self, tweet_rest_ids: list[int]) -> dict[int, TwitterTweet]:
+        tweets = {}
 
-                if base_tweet["extended_entities"].get("media"):
-                    base_media = base_tweet["extended_entities"]["media"]
+        for batch_index in range(0, len(tweet_rest_ids), self.TWITTER_TWEET_BATCH_SIZE):
+            batch = tweet_rest_ids[batch_index:batch_index + self.TWITTER_TWEET_BATCH_SIZE]
 
-                tweet_rest_id = int(base_tweet["id_str"], 10)
-                tweet_full_url = self.TWITTER_TWEET_FULL_URL.format(tweet_rest_id=tweet_rest_id)
-                tweet_favorite_count = base_tweet["favorite_count"]
-                tweet_retweet_count = base_tweet["retweet_count"]
-                tweet_image_urls = []
-                tweet_author_user_rest_id = int(base_user["rest_id"], 10)
-                tweet_author_screen_name = base_user["legacy"]["screen_name"]
-                tweet_author_full_url = self.TWITTER_USER_FULL_URL.format(screen_name=tweet_author_screen_name)
+            result = await self.__get_graphql_result(self.TWITTER_TWEET_RESULTS_BY_REST_IDS_URL,
+                                                     {"tweetIds": [str(tweet_rest_id) for tweet_rest_id in batch]})
 
-                for media_entity in base_media:
-                    if media_entity["type"] != "photo":
-                        continue
+            if not result:
+                continue
 
-                    tweet_image_urls.append(media_entity["media_url_https"])
+            for tweet_result in result["data"]["tweetResult"]:
+                tweet = self.__parse_tweet_result(tweet_result.get("result", {}))
 
-                self.__logger.info(f"__fetch_tweet(tweet_rest_id={tweet_rest_id}): Received tweet {tweet_rest_id} ({tweet_full_url})")
+                if tweet:
+                    tweets[tweet.tweet_rest_id] = tweet
 
-                return TwitterTweet(
-                    tweet_rest_id=tweet_rest_id,
-                    tweet_full_url=tweet_full_url,
-                    tweet_favorite_count=tweet_favorite_count,
-                    tweet_retweet_count=tweet_retweet_count,
-                    tweet_image_urls=tweet_image_urls,
-                    tweet_author_user_rest_id=tweet_author_user_rest_id,
-                    tweet_author_screen_name=tweet_author_screen_name,
-                    tweet_author_full_url=tweet_author_full_url
-                )
+        self.__logger.info(f"__fetch_tweets(tweet_rest_ids={tweet_rest_ids}): Received {len(tweets)} tweets")
+        return tweets
 
     async def fetch(self, urn: URN) -> TwitterUser | TwitterTweet | None:
         """Fetch the object using an identifier.
@@ -214,3 +271,31 @@ class TwitterProvider:
 
         self.__logger.error(f"fetch(urn={urn}): Can't receive this object")
         return None
+
+    async def fetch_many(self, urns: list[URN]) -> list[TwitterUser | TwitterTweet | None]:
+        """Fetch multiple objects, resolving the tweets in batches.
+
+        Args:
+            urns (list[URN]): URNs.
+
+        Returns:
+            list[TwitterUser | TwitterTweet | None]: Objects in the same order as URNs.
+        """
+
+        tweet_rest_ids = [int(urn.urn_identifier, 10) for urn in urns if urn.urn_object == "tweet"]
+        tweets = await self.__fetch_tweets(tweet_rest_ids) if tweet_rest_ids else {}
+
+        result = []
+
+        for urn in urns:
+            if urn.urn_object == "tweet":
+                result.append(tweets.get(int(urn.urn_identifier, 10)))
+            else:
+                result.append(await self.fetch(urn))
+
+        return result
+
+    async def close(self) -> None:
+        """Stop the guest session pool."""
+
+        await self.__guest_session_pool.close()
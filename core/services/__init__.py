@@ -0,0 +1 @@
+from .render import RenderService
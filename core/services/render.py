@@ -0,0 +1,80 @@
+from core.clients import StorageClient
+from core.managers import DerivativeManager
+from core.managers.derivative import DERIVATIVE_PATH_CACHE_TTL
+from core.models import RenderServiceSettings, ImageType, ImageFormat
+
+from aiohttp import web
+
+import logging
+
+# NOTE(synzr): the rendering URL is not including the processing profile, so the redirect
+#              is changed by the re-rendering. It's cached shortly (as the derivative paths),
+#              only the storage objects are immutable.
+RENDER_REDIRECT_CACHE_CONTROL = f"public, max-age={DERIVATIVE_PATH_CACHE_TTL}, must-revalidate"
+
+
+class RenderService:
+    """Local HTTP service which renders the derivatives on demand."""
+
+    def __init__(self,
+                 render_service_settings: RenderServiceSettings,
+                 derivative_manager: DerivativeManager,
+                 storage_client: StorageClient) -> None:
+        """Class constructor.
+
+        Args:
+            render_service_settings (RenderServiceSettings): On-demand rendering service settings.
+            derivative_manager (DerivativeManager): Derivative manager.
+            storage_client (StorageClient): Shared storage client.
+        """
+
+        self.__render_service_settings = render_service_settings
+        self.__derivative_manager = derivative_manager
+        self.__storage_client = storage_client
+
+        self.__runner = None
+        self.__logger = logging.getLogger("core.services.render")
+
+    async def __handle_derivative(self, request: web.Request) -> web.Response:
+        try:
+            image_type = ImageType[request.match_info["image_type"].upper()]
+            image_format = ImageFormat(request.match_info["image_format"])
+        except (KeyError, ValueError):
+            raise web.HTTPNotFound()
+
+        source_key = request.match_info["source_key"]
+
+        try:
+            derivative_path = await self.__derivative_manager.get_derivative_path(source_key, image_type, image_format)
+        except Exception as error:
+            self.__logger.error(f"__handle_derivative(request={request}): Failed to render the derivative: {error}")
+            raise web.HTTPBadGateway()
+
+        if not derivative_path:
+            raise web.HTTPNotFound()
+
+        raise web.HTTPFound(self.__storage_client.get_public_url(derivative_path),
+                            headers={"cache-control": RENDER_REDIRECT_CACHE_CONTROL})
+
+    async def start(self) -> None:
+        """Start the HTTP server."""
+
+        application = web.Application()
+        application.router.add_get("/{image_type}/{source_key:[0-9a-f]+}.{image_format}",
+                                   self.__handle_derivative)
+
+        self.__runner = web.AppRunner(application)
+        await self.__runner.setup()
+
+        await web.TCPSite(self.__runner,
+                          self.__render_service_settings.service_hostname,
+                          self.__render_service_settings.service_port).start()
+
+        self.__logger.info(f"start(): Listening on {self.__render_service_settings.service_hostname}:{self.__render_service_settings.service_port}")
+
+    async def close(self) -> None:
+        """Stop the HTTP server."""
+
+        if self.__runner:
+            await self.__runner.cleanup()
+            self.__runner = None
@@ -0,0 +1,294 @@
+from bot.discord.message import is_submission_message, get_ingest_request
+from bot.utils import (
+    build_argument_parser,
+    parse_environment_variables_to_namespace,
+    get_settings_using_namespace
+)
+from core.clients import HttpClient, StorageClient
+from core.managers import (
+    ContentManager,
+    DerivativeManager,
+    ExternalDataManager,
+    IngestManager,
+    MediaProcessingManager
+)
+from collections import deque
+from discord import Client, Intents, Message, NotFound, Object, TextChannel
+
+from .utils import load_checkpoint, save_checkpoint, ThroughputMeter
+
+import asyncio
+import logging
+import time
+import ujson
+
+logger = logging.getLogger("jobs.backfill")
+
+# Checkpoint is saved (and the throughput is reported) once per interval (in seconds)
+CHECKPOINT_SAVE_INTERVAL = 5
+
+
+async def backfill_message(ingest_manager: IngestManager,
+                           message: Message,
+                           seen_urns: set[str]) -> int:
+    """Ingest the contents of the submission message.
+
+    Args:
+        ingest_manager (IngestManager): Ingest manager.
+        message (Message): Submission message.
+        seen_urns (set[str]): URNs ingested successfully during the run.
+
+    Returns:
+        int: Count of added contents.
+    """
+
+    ingest_request = get_ingest_request(message)
+
+    if not ingest_request:
+        return 0
+
+    urns = await ingest_manager.resolve_urns(ingest_request.request_urls)
+    ingest_request.request_urns = [urn for urn in urns if urn not in seen_urns]
+
+    if not ingest_request.request_urns:
+        return 0
+
+    added_count = await ingest_manager.process_request(ingest_request)
+
+    # NOTE(synzr): URNs are marked as seen after the success only, so the failed
+    #              ones are retried by the later messages (the duplicate contents
+    #              are skipped by the database, so the concurrent ones are harmless)
+    seen_urns.update(ingest_request.request_urns)
+
+    return added_count
+
+
+async def retry_failed_messages(channel: TextChannel,
+                                ingest_manager: IngestManager,
+                                failed_message_ids: list[int],
+                                seen_urns: set[str],
+                                message_semaphore: asyncio.Semaphore) -> None:
+    """Ingest the messages failed by the previous runs again.
+
+    Args:
+        channel (TextChannel): Text channel.
+        ingest_manager (IngestManager): Ingest manager.
+        failed_message_ids (list[int]): IDs of the failed messages (updated in place).
+        seen_urns (set[str]): URNs ingested successfully during the run.
+        message_semaphore (asyncio.Semaphore): Semaphore of the messages in progress.
+    """
+
+    async def retry_message(message_id: int) -> bool:
+        async with message_semaphore:
+            try:
+                message = await channel.fetch_message(message_id)
+            except NotFound:
+                logger.warning(f"retry_failed_messages(channel_id={channel.id}): Message {message_id} is deleted")
+                return True
+
+            try:
+                await backfill_message(ingest_manager, message, seen_urns)
+            except Exception as error:
+                logger.error(f"retry_failed_messages(channel_id={channel.id}): Failed to ingest message {message_id} again: {error}")
+                return False
+
+            return True
+
+    if not failed_message_ids:
+        return
+
+    logger.info(f"retry_failed_messages(channel_id={channel.id}): Retrying {len(failed_message_ids)} failed messages")
+
+    results = await asyncio.gather(*[retry_message(message_id) for message_id in failed_message_ids])
+    failed_message_ids[:] = [message_id for message_id, is_done in zip(failed_message_ids, results)
+                             if not is_done]
+
+
+async def backfill_channel(client: Client,
+                           ingest_manager: IngestManager,
+                           channel_id: int,
+                           text_channels: list[int],
+                           checkpoint: dict,
+                           checkpoint_path: str,
+                           seen_urns: set[str],
+                           message_semaphore: asyncio.Semaphore,
+                           throughput_meter: ThroughputMeter) -> None:
+    """Ingest the submissions from the channel history, starting after the checkpoint.
+
+    Args:
+        client (Client): Discord client.
+        ingest_manager (IngestManager): Ingest manager.
+        channel_id (int): ID of the channel.
+        text_channels (list[int]): Allowed text channels.
+        checkpoint (dict): Checkpoint of the job (shared by the channels).
+        checkpoint_path (str): Path to the checkpoint file.
+        seen_urns (set[str]): URNs ingested successfully during the run.
+        message_semaphore (asyncio.Semaphore): Semaphore of the messages in progress.
+        throughput_meter (ThroughputMeter): Throughput meter of the job.
+    """
+
+    channel = await client.fetch_channel(channel_id)
+    channel_checkpoints = checkpoint.setdefault("channels", {})
+
+    # NOTE(synzr): the checkpoint is moved over the failed messages too, so one
+    #              broken message is not blocking the channel. Their IDs are saved
+    #              and retried first by the next run instead.
+    failed_message_ids = checkpoint.setdefault("failed_messages", {}).setdefault(str(channel_id), [])
+    await retry_failed_messages(channel, ingest_manager, failed_message_ids, seen_urns, message_semaphore)
+    save_checkpoint(checkpoint_path, checkpoint)
+
+    last_message_id = channel_checkpoints.get(str(channel_id))
+    logger.info(f"backfill_channel(channel_id={channel_id}): Starting after message {last_message_id}")
+
+    pending_messages = deque()
+    unrecorded_count = 0
+    saved_at = time.monotonic()
+
+    def complete_messages(is_forced: bool = False) -> None:
+        nonlocal unrecorded_count, saved_at
+
+        # NOTE(synzr): the checkpoint is moved over the completed prefix only,
+        #              so the resumed job never skips the unfinished message
+        while pending_messages and (pending_messages[0][1] is None or pending_messages[0][1].done()):
+            message_id, message_task = pending_messages.popleft()
+
+            if message_task and message_task.exception():
+                logger.error(f"backfill_channel(channel_id={channel_id}): Failed to ingest message {message_id}: {message_task.exception()}")
+                failed_message_ids.append(message_id)
+
+            channel_checkpoints[str(channel_id)] = message_id
+            unrecorded_count += 1
+
+        if is_forced or time.monotonic() - saved_at >= CHECKPOINT_SAVE_INTERVAL:
+            save_checkpoint(checkpoint_path, checkpoint)
+            saved_at = time.monotonic()
+
+            if unrecorded_count:
+                throughput_meter.record(unrecorded_count)
+                unrecorded_count = 0
+
+    # History is paged with the maximum page size (100 messages), the rate limits
+    # are handled by the client. Messages are ingested while the next pages are fetched.
+    async for message in channel.history(limit=None,
+                                         after=Object(id=last_message_id) if last_message_id else None,
+                                         oldest_first=True):
+        if not is_submission_message(message, text_channels, client.user.id):
+            pending_messages.append((message.id, None))
+        else:
+            await message_semaphore.acquire()
+
+            message_task = asyncio.create_task(backfill_message(ingest_manager, message, seen_urns))
+            message_task.add_done_callback(lambda _: message_semaphore.release())
+
+            pending_messages.append((message.id, message_task))
+
+        complete_messages()
+
+    await asyncio.gather(*[message_task for _, message_task in pending_messages if message_task],
+                         return_exceptions=True)
+    complete_messages(is_forced=True)
+
+    logger.info(f"backfill_channel(channel_id={channel_id}): Reached the end of the channel")
+
+
+async def backfill_channels(ingest_manager: IngestManager,
+                            discord_token: str,
+                            text_channels: list[int],
+                            checkpoint_path: str,
+                            concurrency: int) -> None:
+    """Ingest the submissions from the history of the text channels.
+
+    Args:
+        ingest_manager (IngestManager): Ingest manager.
+        discord_token (str): Token of the bot.
+        text_channels (list[int]): Text channels.
+        checkpoint_path (str): Path to the checkpoint file.
+        concurrency (int): Maximum count of the messages in progress.
+    """
+
+    # Only the REST API is used, so there is no gateway connection
+    client = Client(intents=Intents.none())
+    await client.login(discord_token)
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    seen_urns = set()
+
+    message_semaphore = asyncio.Semaphore(concurrency)
+    throughput_meter = ThroughputMeter(logger, "messages")
+
+    try:
+        # NOTE(synzr): channels are having the separate rate limits,
+        #              so their histories are paged concurrently
+        await asyncio.gather(*[backfill_channel(client, ingest_manager, channel_id, text_channels,
+                                                checkpoint, checkpoint_path, seen_urns,
+                                                message_semaphore, throughput_meter)
+                               for channel_id in text_channels])
+    finally:
+        await client.close()
+
+    logger.info(f"backfill_channels(text_channels={text_channels}): Processed {throughput_meter.processed_count} messages, "
+                f"{len(seen_urns)} unique URNs")
+
+
+def main() -> None:
+    argument_parser = build_argument_parser("torobooru-backfill",
+                                            description="Ingest the submissions from the history of Torobooru's channels")
+
+    argument_parser.add_argument("--concurrency", type=int, default=8)
+    argument_parser.add_argument("--checkpoint-path", default="backfill.checkpoint.json")
+
+    namespace = argument_parser.parse_args()
+    namespace = parse_environment_variables_to_namespace(namespace)
+
+    logging.basicConfig(level=logging.INFO)
+
+    text_channels = ujson.loads(namespace.discord_text_channels) \
+        if namespace.discord_text_channels else []
+
+    database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, ingest_settings = get_settings_using_namespace(namespace)
+
+    http_client = HttpClient(http_connection_settings)
+    storage_client = StorageClient(storage_connection_settings)
+
+    media_processing_manager = MediaProcessingManager(media_processing_settings,
+                                                      storage_client,
+                                                      http_client)
+    derivative_manager = None
+
+    # NOTE(synzr): backfilled contents are following the mode of the bot
+    if render_service_settings.service_enabled:
+        derivative_manager = DerivativeManager(database_connection_settings,
+                                               render_service_settings,
+                                               media_processing_manager)
+
+    content_manager = ContentManager(database_connection_settings,
+                                     storage_client,
+                                     media_processing_manager,
+                                     derivative_manager)
+    external_data_manager = ExternalDataManager(database_connection_settings,
+                                                http_client)
+    ingest_manager = IngestManager(ingest_settings,
+                                   external_data_manager,
+                                   content_manager)
+
+    event_loop = asyncio.get_event_loop()
+
+    try:
+        event_loop.run_until_complete(storage_client.start())
+        event_loop.run_until_complete(backfill_channels(ingest_manager,
+                                                        namespace.discord_token,
+                                                        text_channels,
+                                                        namespace.checkpoint_path,
+                                                        namespace.concurrency))
+    finally:
+        event_loop.run_until_complete(external_data_manager.close())
+        event_loop.run_until_complete(http_client.close())
+        event_loop.run_until_complete(storage_client.close())
+        media_processing_manager.close()
+
+
+# Process pool workers are importing this module too
+if __name__ == "__main__":
+    main()
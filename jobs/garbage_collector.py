@@ -0,0 +1,239 @@
+from bot.utils import (
+    build_argument_parser,
+    parse_environment_variables_to_namespace,
+    get_settings_using_namespace
+)
+from core.clients import HttpClient, StorageClient
+from core.clients.storage import STORAGE_DELETE_BATCH_SIZE
+from core.managers import ContentManager, DerivativeManager, MediaProcessingManager
+from core.managers.media_processing import IMAGE_SETTINGS
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+from hashlib import blake2b
+
+from .utils import ThroughputMeter
+
+import asyncio
+import heapq
+import logging
+
+logger = logging.getLogger("jobs.garbage_collector")
+
+# 64-bit hashes are colliding only in the safe direction (the orphan is kept)
+REFERENCED_KEY_HASH_SIZE = 8
+
+# Keys are sorted in the chunks, so the temporary list of integers stays small
+REFERENCED_KEY_CHUNK_SIZE = 1 << 20
+
+
+class ReferencedKeySet:
+    """Compact set of the referenced storage keys."""
+
+    # NOTE(synzr): keys are stored as a sorted array of the 64-bit hashes,
+    #              so millions of keys are taking 8 bytes each instead of
+    #              the string objects inside of the hash table
+
+    def __init__(self) -> None:
+        """Class constructor."""
+
+        self.__sorted_chunks = []
+        self.__pending_hashes = array("Q")
+        self.__hashes = array("Q")
+
+    def __get_key_hash(self, object_key: str) -> int:
+        return int.from_bytes(blake2b(object_key.encode(), digest_size=REFERENCED_KEY_HASH_SIZE).digest(), "big")
+
+    def __flush_pending_hashes(self) -> None:
+        if self.__pending_hashes:
+            self.__sorted_chunks.append(array("Q", sorted(self.__pending_hashes)))
+            self.__pending_hashes = array("Q")
+
+    def __len__(self) -> int:
+        return len(self.__hashes) + len(self.__pending_hashes) \
+            + sum(len(sorted_chunk) for sorted_chunk in self.__sorted_chunks)
+
+    def __contains__(self, object_key: str) -> bool:
+        key_hash = self.__get_key_hash(object_key)
+        hash_index = bisect_left(self.__hashes, key_hash)
+
+        return hash_index < len(self.__hashes) and self.__hashes[hash_index] == key_hash
+
+    def add(self, object_key: str) -> None:
+        """Add the key to the set.
+
+        Args:
+            object_key (str): Object key.
+        """
+
+        self.__pending_hashes.append(self.__get_key_hash(object_key))
+
+        if len(self.__pending_hashes) >= REFERENCED_KEY_CHUNK_SIZE:
+            self.__flush_pending_hashes()
+
+    def freeze(self) -> None:
+        """Merge the added keys, so the set could be queried."""
+
+        self.__flush_pending_hashes()
+
+        self.__hashes = array("Q", heapq.merge(self.__hashes, *self.__sorted_chunks))
+        self.__sorted_chunks = []
+
+
+async def mark_content_keys(content_manager: ContentManager,
+                            storage_client: StorageClient,
+                            referenced_keys: ReferencedKeySet | set[str],
+                            content_id: int = 0) -> int:
+    """Mark the storage keys referenced by the contents.
+
+    Args:
+        content_manager (ContentManager): Content manager.
+        storage_client (StorageClient): Storage client.
+        referenced_keys (ReferencedKeySet | set[str]): Set of the referenced keys.
+        content_id (int, optional): Content ID to start after (exclusive).
+
+    Returns:
+        int: Last marked content ID.
+    """
+
+    async for content_id, media_urls in content_manager.iterate_media_urls(content_id):
+        for media_url in media_urls:
+            # Render service URLs are not pointing to the bucket, their paths are marked separately
+            if object_key := storage_client.get_object_key(media_url):
+                referenced_keys.add(object_key)
+
+    return content_id
+
+
+async def collect_garbage(content_manager: ContentManager,
+                          derivative_manager: DerivativeManager,
+                          storage_client: StorageClient,
+                          grace_period: timedelta,
+                          dry_run: bool) -> None:
+    """Delete the storage objects which are not referenced by the database.
+
+    Args:
+        content_manager (ContentManager): Content manager.
+        derivative_manager (DerivativeManager): Derivative manager.
+        storage_client (StorageClient): Storage client.
+        grace_period (timedelta): Minimum age of the deleted object.
+        dry_run (bool): Only report the orphans, without deleting them.
+    """
+
+    # NOTE(synzr): objects uploaded after this time could be not referenced yet,
+    #              because the contents are inserted after the upload
+    modified_before = datetime.now(timezone.utc) - grace_period
+
+    referenced_keys = ReferencedKeySet()
+    last_content_id = await mark_content_keys(content_manager, storage_client, referenced_keys)
+
+    # Derivatives reset by the re-rendering could be still cached, so they're kept for the grace period
+    async for derivative_paths in derivative_manager.iterate_derivative_paths(int(grace_period.total_seconds())):
+        for derivative_path in derivative_paths:
+            referenced_keys.add(derivative_path)
+
+    referenced_keys.freeze()
+    logger.info(f"collect_garbage(dry_run={dry_run}): Marked {len(referenced_keys)} referenced keys")
+
+    if not len(referenced_keys) and not dry_run:
+        logger.error(f"collect_garbage(dry_run={dry_run}): No referenced keys were found, refusing to delete everything")
+        return
+
+    # Keys of the contents added while the bucket is listed (usually only a few of them)
+    late_referenced_keys = set()
+
+    throughput_meter = ThroughputMeter(logger, "objects")
+    orphaned_keys = []
+    orphaned_count = orphaned_size = deleted_count = 0
+
+    async def delete_orphaned_keys() -> int:
+        nonlocal last_content_id
+
+        # NOTE(synzr): the new content could reuse the stored derivative,
+        #              so the contents are marked again right before the deletion
+        last_content_id = await mark_content_keys(content_manager, storage_client,
+                                                  late_referenced_keys, last_content_id)
+
+        return await storage_client.delete_objects([object_key for object_key in orphaned_keys
+                                                    if object_key not in late_referenced_keys])
+
+    for storage_directory_name in sorted({image_settings["storage_directory_name"]
+                                          for image_settings in IMAGE_SETTINGS.values()}):
+        async for stored_objects in storage_client.iterate_objects(f"{storage_directory_name}/"):
+            for stored_object in stored_objects:
+                if stored_object["LastModified"] > modified_before \
+                        or stored_object["Key"] in referenced_keys \
+                        or stored_object["Key"] in late_referenced_keys:
+                    continue
+
+                orphaned_count += 1
+                orphaned_size += stored_object["Size"]
+
+                if dry_run:
+                    logger.info(f"collect_garbage(dry_run={dry_run}): Orphaned object {stored_object['Key']} ({stored_object['Size']} bytes)")
+                else:
+                    orphaned_keys.append(stored_object["Key"])
+
+            if len(orphaned_keys) >= STORAGE_DELETE_BATCH_SIZE:
+                deleted_count += await delete_orphaned_keys()
+                orphaned_keys.clear()
+
+            throughput_meter.record(len(stored_objects))
+
+    if orphaned_keys:
+        deleted_count += await delete_orphaned_keys()
+
+    logger.info(f"collect_garbage(dry_run={dry_run}): Found {orphaned_count} orphaned objects ({orphaned_size} bytes), "
+                f"deleted {deleted_count} of them")
+
+
+def main() -> None:
+    argument_parser = build_argument_parser("torobooru-garbage-collector",
+                                            description="Delete the storage objects orphaned by Torobooru's contents")
+
+    argument_parser.add_argument("--grace-period-hours", type=float, default=24)
+    argument_parser.add_argument("--dry-run", action="store_true")
+
+    namespace = argument_parser.parse_args()
+    namespace = parse_environment_variables_to_namespace(namespace)
+
+    logging.basicConfig(level=logging.INFO)
+
+    database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, _ = get_settings_using_namespace(namespace)
+
+    http_client = HttpClient(http_connection_settings)
+    storage_client = StorageClient(storage_connection_settings)
+
+    media_processing_manager = MediaProcessingManager(media_processing_settings,
+                                                      storage_client,
+                                                      http_client)
+    content_manager = ContentManager(database_connection_settings,
+                                     storage_client,
+                                     media_processing_manager)
+
+    # NOTE(synzr): rendered derivatives are marked even if the render service is disabled now
+    derivative_manager = DerivativeManager(database_connection_settings,
+                                           render_service_settings,
+                                           media_processing_manager)
+
+    event_loop = asyncio.get_event_loop()
+
+    try:
+        event_loop.run_until_complete(storage_client.start())
+        event_loop.run_until_complete(collect_garbage(content_manager,
+                                                      derivative_manager,
+                                                      storage_client,
+                                                      timedelta(hours=namespace.grace_period_hours),
+                                                      namespace.dry_run))
+    finally:
+        event_loop.run_until_complete(http_client.close())
+        event_loop.run_until_complete(storage_client.close())
+        media_processing_manager.close()
+
+
+# Process pool workers are importing this module too
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+from bot.utils import (
+    build_argument_parser,
+    parse_environment_variables_to_namespace,
+    get_settings_using_namespace
+)
+from core.clients import HttpClient, StorageClient
+from core.managers import ContentManager, DerivativeManager, MediaProcessingManager
+from core.models import Content
+from collections import deque
+
+from .utils import load_checkpoint, save_checkpoint, ThroughputMeter
+
+import asyncio
+import logging
+
+logger = logging.getLogger("jobs.rerender")
+
+
+async def rerender_batch(content_manager: ContentManager, contents: list[Content]) -> int:
+    """Re-render the batch of contents.
+
+    Args:
+        content_manager (ContentManager): Content manager.
+        contents (list[Content]): Batch of contents.
+
+    Returns:
+        int: Count of updated contents.
+    """
+
+    try:
+        return await content_manager.rerender_contents(contents)
+    except Exception as error:
+        logger.warning(f"rerender_batch(contents=[{len(contents)} contents]): Batch failed ({error}), re-rendering contents one by one")
+
+    # The single broken source shouldn't block the whole batch
+    updated_count = 0
+
+    for content in contents:
+        try:
+            updated_count += await content_manager.rerender_contents([content])
+        except Exception as error:
+            logger.error(f"rerender_batch(contents=[{len(contents)} contents]): Failed to re-render content {content.content_id}: {error}")
+
+    return updated_count
+
+
+async def rerender_contents(content_manager: ContentManager,
+                            checkpoint_path: str,
+                            batch_size: int,
+                            concurrency: int) -> None:
+    """Re-render the contents from the checkpoint to the end.
+
+    Args:
+        content_manager (ContentManager): Content manager.
+        checkpoint_path (str): Path to the checkpoint file.
+        batch_size (int): Count of contents in the batch.
+        concurrency (int): Maximum count of the batches in progress.
+    """
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    last_content_id = checkpoint.get("last_content_id", 0)
+
+    logger.info(f"rerender_contents(checkpoint_path={checkpoint_path}): Starting after content {last_content_id}")
+
+    throughput_meter = ThroughputMeter(logger, "contents")
+    pending_batches = deque()
+
+    async def complete_batches() -> None:
+        # NOTE(synzr): the checkpoint is moved over the completed prefix only,
+        #              so the resumed job never skips the unfinished batch
+        while pending_batches and pending_batches[0][2].done():
+            batch_last_content_id, batch_content_count, batch_task = pending_batches.popleft()
+            batch_task.result()
+
+            throughput_meter.record(batch_content_count)
+
+            checkpoint["last_content_id"] = batch_last_content_id
+            checkpoint["processed_count"] = checkpoint.get("processed_count", 0) + batch_content_count
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    while contents := await content_manager.get_contents_after(last_content_id, batch_size):
+        last_content_id = contents[-1].content_id
+
+        pending_batches.append((last_content_id, len(contents),
+                                asyncio.create_task(rerender_batch(content_manager, contents))))
+
+        running_tasks = [batch_task for _, _, batch_task in pending_batches if not batch_task.done()]
+
+        if len(running_tasks) >= concurrency:
+            await asyncio.wait(running_tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        await complete_batches()
+
+    while pending_batches:
+        await asyncio.wait([pending_batches[0][2]])
+        await complete_batches()
+
+    logger.info(f"rerender_contents(checkpoint_path={checkpoint_path}): Re-rendered {throughput_meter.processed_count} contents")
+
+
+def main() -> None:
+    argument_parser = build_argument_parser("torobooru-rerender",
+                                            description="Re-render the derivatives of Torobooru's contents")
+
+    argument_parser.add_argument("--batch-size", type=int, default=50)
+    argument_parser.add_argument("--concurrency", type=int, default=4)
+    argument_parser.add_argument("--checkpoint-path", default="rerender.checkpoint.json")
+
+    namespace = argument_parser.parse_args()
+    namespace = parse_environment_variables_to_namespace(namespace)
+
+    logging.basicConfig(level=logging.INFO)
+
+    database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, _ = get_settings_using_namespace(namespace)
+
+    http_client = HttpClient(http_connection_settings)
+    storage_client = StorageClient(storage_connection_settings)
+
+    media_processing_manager = MediaProcessingManager(media_processing_settings,
+                                                      storage_client,
+                                                      http_client)
+    derivative_manager = None
+
+    # NOTE(synzr): lazy contents are staying on the rendering service,
+    #              only their rendered derivatives are reset
+    if render_service_settings.service_enabled:
+        derivative_manager = DerivativeManager(database_connection_settings,
+                                               render_service_settings,
+                                               media_processing_manager)
+
+    content_manager = ContentManager(database_connection_settings,
+                                     storage_client,
+                                     media_processing_manager,
+                                     derivative_manager)
+
+    event_loop = asyncio.get_event_loop()
+
+    try:
+        event_loop.run_until_complete(storage_client.start())
+        event_loop.run_until_complete(rerender_contents(content_manager,
+                                                        namespace.checkpoint_path,
+                                                        namespace.batch_size,
+                                                        namespace.concurrency))
+    finally:
+        event_loop.run_until_complete(http_client.close())
+        event_loop.run_until_complete(storage_client.close())
+        media_processing_manager.close()
+
+
+# Process pool workers are importing this module too
+if __name__ == "__main__":
+    main()
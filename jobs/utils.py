@@ -0,0 +1,75 @@
+import logging
+import os
+import time
+import ujson
+
+
+def load_checkpoint(checkpoint_path: str) -> dict:
+    """Load the checkpoint of the job.
+
+    Args:
+        checkpoint_path (str): Path to the checkpoint file.
+
+    Returns:
+        dict: Checkpoint (empty if the job wasn't started yet).
+    """
+
+    try:
+        with open(checkpoint_path, "r") as checkpoint_file:
+            return ujson.load(checkpoint_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    """Save the checkpoint of the job atomically.
+
+    Args:
+        checkpoint_path (str): Path to the checkpoint file.
+        checkpoint (dict): Checkpoint.
+    """
+
+    temporary_checkpoint_path = f"{checkpoint_path}.tmp"
+
+    with open(temporary_checkpoint_path, "w") as checkpoint_file:
+        ujson.dump(checkpoint, checkpoint_file)
+
+    # The previous checkpoint stays valid if the job is interrupted while writing
+    os.replace(temporary_checkpoint_path, checkpoint_path)
+
+
+class ThroughputMeter:
+    """Throughput meter of the job."""
+
+    def __init__(self, logger: logging.Logger, unit_name: str) -> None:
+        """Class constructor.
+
+        Args:
+            logger (logging.Logger): Logger of the job.
+            unit_name (str): Name of the processed units.
+        """
+
+        self.__logger = logger
+        self.__unit_name = unit_name
+
+        self.__started_at = time.monotonic()
+        self.__processed_count = 0
+
+    @property
+    def processed_count(self) -> int:
+        """Count of the processed units."""
+
+        return self.__processed_count
+
+    def record(self, processed_count: int) -> None:
+        """Record the processed units and report the throughput.
+
+        Args:
+            processed_count (int): Count of the processed units.
+        """
+
+        self.__processed_count += processed_count
+        elapsed_seconds = max(time.monotonic() - self.__started_at, 1e-9)
+
+        self.__logger.info(f"record(processed_count={processed_count}): Processed {self.__processed_count} {self.__unit_name} "
+                           f"in {elapsed_seconds:.1f}s ({self.__processed_count / elapsed_seconds:.2f} {self.__unit_name}/s)")
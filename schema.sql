@@ -34,12 +34,28 @@ CREATE TABLE `contents` (
   `content_origin_urn` varchar(100) NOT NULL,
   `content_media_url` varchar(100) NOT NULL,
   `content_thumbnail_url` varchar(100) DEFAULT NULL,
+  `content_media_variants` json DEFAULT NULL,
+  `content_source_media_url` varchar(255) DEFAULT NULL,
   `content_tags` json NOT NULL,
   `content_submitted_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `derivative_sources`
+--
+
+CREATE TABLE `derivative_sources` (
+  `derivative_source_key` char(32) NOT NULL,
+  `derivative_source_url` varchar(255) NOT NULL,
+  `derivative_source_paths` json DEFAULT NULL,
+  `derivative_source_previous_paths` json DEFAULT NULL,
+  `derivative_source_reset_at` timestamp NULL DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `external_data`
 --
@@ -47,9 +63,30 @@ CREATE TABLE `contents` (
 CREATE TABLE `external_data` (
   `external_data_urn` varchar(100) NOT NULL,
   `external_data` json NOT NULL,
+  `external_data_etag` varchar(255) DEFAULT NULL,
+  `external_data_last_modified` varchar(64) DEFAULT NULL,
   `external_data_last_update` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `ingest_jobs`
+--
+
+CREATE TABLE `ingest_jobs` (
+  `ingest_job_id` bigint UNSIGNED NOT NULL,
+  `ingest_job_submission_urn` varchar(100) NOT NULL,
+  `ingest_job_urls` json NOT NULL,
+  `ingest_job_tags` json NOT NULL,
+  `ingest_job_attempts` int UNSIGNED NOT NULL DEFAULT '0',
+  `ingest_job_available_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `ingest_job_lease_owner` varchar(100) DEFAULT NULL,
+  `ingest_job_last_error` text,
+  `ingest_job_failed_at` timestamp NULL DEFAULT NULL,
+  `ingest_job_created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 --
 -- Indexes for dumped tables
 --
@@ -59,15 +96,28 @@ CREATE TABLE `external_data` (
 --
 ALTER TABLE `contents`
   ADD PRIMARY KEY (`content_id`),
-  ADD UNIQUE KEY `urns` (`content_submission_urn`,`content_source_urn`,`content_origin_urn`),
+  ADD UNIQUE KEY `urns` (`content_submission_urn`,`content_source_urn`,`content_origin_urn`,`content_source_media_url`),
   ADD UNIQUE KEY `media_url` (`content_media_url`) USING BTREE;
 
+--
+-- Indexes for table `derivative_sources`
+--
+ALTER TABLE `derivative_sources`
+  ADD PRIMARY KEY (`derivative_source_key`);
+
 --
 -- Indexes for table `external_data`
 --
 ALTER TABLE `external_data`
   ADD PRIMARY KEY (`external_data_urn`);
 
+--
+-- Indexes for table `ingest_jobs`
+--
+ALTER TABLE `ingest_jobs`
+  ADD PRIMARY KEY (`ingest_job_id`),
+  ADD KEY `available_jobs` (`ingest_job_failed_at`,`ingest_job_available_at`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -77,6 +127,12 @@ ALTER TABLE `external_data`
 --
 ALTER TABLE `contents`
   MODIFY `content_id` int UNSIGNED NOT NULL AUTO_INCREMENT;
+
+--
+-- AUTO_INCREMENT for table `ingest_jobs`
+--
+ALTER TABLE `ingest_jobs`
+  MODIFY `ingest_job_id` bigint UNSIGNED NOT NULL AUTO_INCREMENT;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
@@ -0,0 +1,201 @@
+from bot.utils import (
+    build_argument_parser,
+    parse_environment_variables_to_namespace,
+    get_settings_using_namespace
+)
+from core.clients import HttpClient, StorageClient
+from core.managers import (
+    ContentManager,
+    DerivativeManager,
+    ExternalDataManager,
+    IngestManager,
+    IngestQueueManager,
+    MediaProcessingManager
+)
+from core.models import IngestJob, IngestSettings
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+logger = logging.getLogger("worker")
+
+
+async def process_job(ingest_manager: IngestManager,
+                      ingest_queue_manager: IngestQueueManager,
+                      lease_owner: str,
+                      ingest_job: IngestJob) -> None:
+    """Process the leased ingest job.
+
+    Args:
+        ingest_manager (IngestManager): Ingest manager.
+        ingest_queue_manager (IngestQueueManager): Ingest queue manager.
+        lease_owner (str): Name of the worker.
+        ingest_job (IngestJob): Leased job.
+    """
+
+    try:
+        added_count = await ingest_manager.process_request(ingest_job.job_request)
+    except Exception as error:
+        await ingest_queue_manager.fail_job(lease_owner, ingest_job, error)
+        return
+
+    await ingest_queue_manager.complete_job(lease_owner, ingest_job)
+    logger.info(f"process_job(ingest_job={ingest_job.job_id}): Added {added_count} contents of {ingest_job.job_request.request_submission_urn}")
+
+
+async def renew_leases(ingest_queue_manager: IngestQueueManager,
+                       ingest_settings: IngestSettings,
+                       lease_owner: str,
+                       running_jobs: dict[asyncio.Task, IngestJob]) -> None:
+    """Renew the leases of the running jobs until cancelled.
+
+    Args:
+        ingest_queue_manager (IngestQueueManager): Ingest queue manager.
+        ingest_settings (IngestSettings): Ingest settings.
+        lease_owner (str): Name of the worker.
+        running_jobs (dict[asyncio.Task, IngestJob]): Running jobs.
+    """
+
+    # Leases are renewed well before they expire, so the slow job is not claimed twice
+    while True:
+        await asyncio.sleep(ingest_settings.lease_duration / 3)
+
+        try:
+            await ingest_queue_manager.renew_leases(lease_owner,
+                                                    [ingest_job.job_id for ingest_job in running_jobs.values()])
+        except Exception as error:
+            logger.warning(f"renew_leases(lease_owner={lease_owner}): Failed to renew the leases: {error}")
+
+
+async def run_worker(ingest_manager: IngestManager,
+                     ingest_queue_manager: IngestQueueManager,
+                     ingest_settings: IngestSettings,
+                     lease_owner: str) -> None:
+    """Claim and process the ingest jobs until cancelled.
+
+    Args:
+        ingest_manager (IngestManager): Ingest manager.
+        ingest_queue_manager (IngestQueueManager): Ingest queue manager.
+        ingest_settings (IngestSettings): Ingest settings.
+        lease_owner (str): Name of the worker.
+    """
+
+    running_jobs = {}
+    renewal_task = asyncio.create_task(renew_leases(ingest_queue_manager, ingest_settings,
+                                                    lease_owner, running_jobs))
+
+    logger.info(f"run_worker(lease_owner={lease_owner}): Processing up to {ingest_settings.worker_count} jobs at once")
+
+    try:
+        while True:
+            free_slot_count = ingest_settings.worker_count - len(running_jobs)
+            ingest_jobs = []
+
+            if free_slot_count:
+                try:
+                    ingest_jobs = await ingest_queue_manager.claim_jobs(lease_owner, free_slot_count)
+                except Exception as error:
+                    logger.warning(f"run_worker(lease_owner={lease_owner}): Failed to claim the jobs: {error}")
+
+            for ingest_job in ingest_jobs:
+                job_task = asyncio.create_task(process_job(ingest_manager, ingest_queue_manager,
+                                                           lease_owner, ingest_job))
+                running_jobs[job_task] = ingest_job
+
+            # NOTE(synzr): the queue is polled again when a job is done or after the interval,
+            #              so the empty queue is not hammered with the queries
+            if running_jobs:
+                await asyncio.wait(running_jobs.keys(),
+                                   timeout=ingest_settings.poll_interval,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(ingest_settings.poll_interval)
+
+            for done_task in [job_task for job_task in running_jobs if job_task.done()]:
+                ingest_job = running_jobs.pop(done_task)
+
+                if done_task.exception():
+                    logger.error(f"run_worker(lease_owner={lease_owner}): Job {ingest_job.job_id} failed: {done_task.exception()}")
+    finally:
+        renewal_task.cancel()
+
+        for job_task in running_jobs:
+            job_task.cancel()
+
+        await asyncio.gather(renewal_task, *running_jobs, return_exceptions=True)
+
+        # Interrupted jobs are available to the other workers right away
+        await ingest_queue_manager.release_jobs(lease_owner)
+
+
+def main() -> None:
+    argument_parser = build_argument_parser("torobooru-worker",
+                                            description="Torobooru's ingest worker")
+
+    namespace = argument_parser.parse_args()
+    namespace = parse_environment_variables_to_namespace(namespace)
+
+    logging.basicConfig(level=logging.INFO)
+
+    database_connection_settings, storage_connection_settings, \
+        http_connection_settings, media_processing_settings, \
+        render_service_settings, ingest_settings = get_settings_using_namespace(namespace)
+
+    http_client = HttpClient(http_connection_settings)
+    storage_client = StorageClient(storage_connection_settings)
+
+    media_processing_manager = MediaProcessingManager(media_processing_settings,
+                                                      storage_client,
+                                                      http_client)
+    derivative_manager = None
+
+    # NOTE(synzr): workers are following the mode of the bot, so the lazy
+    #              contents are pointing to the rendering service too
+    if render_service_settings.service_enabled:
+        derivative_manager = DerivativeManager(database_connection_settings,
+                                               render_service_settings,
+                                               media_processing_manager)
+
+    content_manager = ContentManager(database_connection_settings,
+                                     storage_client,
+                                     media_processing_manager,
+                                     derivative_manager)
+    external_data_manager = ExternalDataManager(database_connection_settings,
+                                                http_client)
+    ingest_manager = IngestManager(ingest_settings,
+                                   external_data_manager,
+                                   content_manager)
+    ingest_queue_manager = IngestQueueManager(database_connection_settings,
+                                              ingest_settings)
+
+    lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+    event_loop = asyncio.get_event_loop()
+
+    try:
+        event_loop.run_until_complete(storage_client.start())
+
+        worker_task = event_loop.create_task(run_worker(ingest_manager,
+                                                        ingest_queue_manager,
+                                                        ingest_settings,
+                                                        lease_owner))
+
+        # Worker is cancelled on the signal, so its leases are released before the exit
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            event_loop.add_signal_handler(signal_number, worker_task.cancel)
+
+        event_loop.run_until_complete(worker_task)
+    except asyncio.CancelledError:
+        logger.info(f"main(): Worker {lease_owner} is stopped")
+    finally:
+        event_loop.run_until_complete(external_data_manager.close())
+        event_loop.run_until_complete(http_client.close())
+        event_loop.run_until_complete(storage_client.close())
+        media_processing_manager.close()
+
+
+# Process pool workers are importing this module too
+if __name__ == "__main__":
+    main()